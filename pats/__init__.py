@@ -3,8 +3,16 @@
 from .core import *
 from .buyer import *
 from .seller import *
+from .mirror import PATSMirror
+from .tenants import PATSTenantManager
+from .events import EventReceiver, fetch_event_detail
+from .attachments import Attachment
+from .transport import ConnectionPool, RateLimiter, ReferenceCache, CircuitBreaker, CircuitBreakers, \
+    Hedging, DNSCache, HTTP2Pool, Transport, RecordingTransport, ReplayTransport
 
 __version__ = VERSION
-__all__ = ('PATSBuyer', 'PATSSeller', 'PATSException', '__version__')
+__all__ = ('PATSBuyer', 'PATSSeller', 'PATSException', 'PATSCircuitOpenError', 'PATSTimeoutError', 'deadline', 'PATSMirror', 'PATSTenantManager', 'EventReceiver', 'fetch_event_detail', 'Attachment',
+           'ConnectionPool', 'RateLimiter', 'ReferenceCache', 'CircuitBreaker', 'CircuitBreakers', 'Hedging',
+           'DNSCache', 'HTTP2Pool', 'Transport', 'RecordingTransport', 'ReplayTransport', '__version__')
 __author__ = 'Brendan Quinn' 
 
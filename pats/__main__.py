@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Command line
+
+    python -m pats export orders --side buyer --agency-id 35-XXXX-1 --agency-group-id 35-XXXX \\
+        --user-id user@example.com --since 2017-01-01 --output orders.jsonl.gz
+
+The API key comes from --api-key or the PATS_API_KEY environment variable.
+For more than one tenant, --tenants names a JSON file holding a list of
+tenant specs ({"side": "buyer", "agency_id": ..., "api_key": ...} and so on).
+Run the same command again to carry on an interrupted export.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+from .core import PATSException
+from .export import JSONLExport, KINDS, DEFAULT_WORKERS
+from .harvest import make_client
+
+def _date(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("%r is not a YYYY-MM-DD date" % value)
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m pats', description='PATS API tools')
+    commands = parser.add_subparsers(dest='command')
+    export = commands.add_parser('export', help='export orders, RFPs or proposals to JSONL')
+    export.add_argument('kind', choices=sorted(KINDS))
+    export.add_argument('--tenants', help='JSON file with a list of tenant specs')
+    export.add_argument('--side', choices=['buyer', 'seller'], help='for a single tenant')
+    export.add_argument('--agency-id')
+    export.add_argument('--agency-group-id')
+    export.add_argument('--vendor-id')
+    export.add_argument('--user-id')
+    export.add_argument('--api-key', default=os.environ.get('PATS_API_KEY'))
+    export.add_argument('--since', type=_date, help='YYYY-MM-DD (required for orders)')
+    export.add_argument('--until', type=_date, help='YYYY-MM-DD (RFPs only)')
+    export.add_argument('--output', required=True, help='JSONL file to write (gzipped if it ends in .gz)')
+    export.add_argument('--gzip', action='store_true', default=None, help='gzip the output whatever its name')
+    export.add_argument('--cursor', help='progress file (default: OUTPUT.cursor)')
+    export.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='tenants exported at once')
+    return parser
+
+def _tenants(args):
+    if args.tenants:
+        with open(args.tenants) as f:
+            return json.load(f)
+    if not args.side:
+        raise PATSException("Give either --tenants or --side and the tenant's IDs")
+    tenant = {'side': args.side, 'api_key': args.api_key, 'user_id': args.user_id}
+    if args.side == 'buyer':
+        tenant.update(agency_id=args.agency_id, agency_group_id=args.agency_group_id)
+    else:
+        tenant.update(vendor_id=args.vendor_id)
+    return [tenant]
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    if args.command != 'export':
+        _parser().print_help()
+        return 2
+    try:
+        clients = [make_client(tenant) for tenant in _tenants(args)]
+        counts = JSONLExport(args.kind, clients, args.output, since_date=args.since, end_date=args.until,
+                             cursor_path=args.cursor, compress=args.gzip, workers=args.workers).run()
+    except PATSException as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+    for tenant, count in sorted(counts.items()):
+        sys.stdout.write("%s: %d %s\n" % (tenant, count, args.kind))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Local attachment cache
+
+Keeps the attachments fetched with get_order_attachment(),
+get_rfp_attachment() and get_proposal_attachment() on disk, so asking for
+the same one again doesn't go back to PATS:
+
+    cache = AttachmentCache('pats-attachments', max_bytes=2 * 1024 ** 3)
+    buyer = PATSBuyer(..., attachment_cache=cache)
+
+Each attachment's file (the decoded "contents" of the response) is stored
+once per content (SHA-256) however many orders, RFPs or proposals it is
+attached to and under whatever names; the rest of the response is kept in
+the index. The least recently used files are removed when the cache grows
+past max_bytes. The cache can be used from several threads and shared by
+several clients.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attachments (
+    resource TEXT NOT NULL,
+    attachment_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    metadata TEXT,
+    PRIMARY KEY (resource, attachment_id)
+);
+CREATE INDEX IF NOT EXISTS attachments_digest ON attachments (digest);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used);
+"""
+
+class EmptyBlob(bytes):
+    """
+    What open() gives for an empty file, which can't be memory-mapped.
+    """
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+class AttachmentCache(object):
+    """
+    Content-addressed store of attachment blobs in a directory, indexed by
+    (resource, attachment ID) and by content hash in an SQLite file there.
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        directory: where blobs and their index are kept (created if need be)
+        max_bytes: total size of blobs kept before the least recently used go
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self.hits = 0
+        self.misses = 0
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+            self.size, self.clock = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM blobs").fetchone()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _tick(self):
+        # an access counter rather than the time, so the order is exact
+        self.clock += 1
+        return self.clock
+
+    def _open(self, resource, attachment_id):
+        """
+        (metadata JSON, read-only memory map of the blob) for an attachment, or None.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT digest, metadata FROM attachments WHERE resource = ? AND attachment_id = ?",
+                (resource, attachment_id)
+            ).fetchone()
+            if row is not None:
+                try:
+                    with open(self._path(row[0]), 'rb') as f:
+                        if os.fstat(f.fileno()).st_size == 0:
+                            blob = EmptyBlob()
+                        else:
+                            blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (IOError, OSError, ValueError):
+                    # removed from under us: forget it
+                    self._remove_blob(row[0])
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.conn:
+                self.conn.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (self._tick(), row[0]))
+        return row[1], blob
+
+    def open(self, resource, attachment_id):
+        """
+        A read-only memory map of the file cached for an attachment (close it
+        when done; an empty EmptyBlob for an empty file), or None if it isn't
+        cached.
+        """
+        entry = self._open(resource, attachment_id)
+        return None if entry is None else entry[1]
+
+    def lookup(self, resource, attachment_id):
+        """
+        (metadata dict, file contents as bytes) cached for an attachment, or None.
+        """
+        entry = self._open(resource, attachment_id)
+        if entry is None:
+            return None
+        metadata, blob = entry
+        try:
+            return json.loads(metadata) if metadata else {}, blob[:]
+        finally:
+            blob.close()
+
+    def get(self, resource, attachment_id):
+        """
+        The file cached for an attachment as bytes, or None.
+        """
+        entry = self.lookup(resource, attachment_id)
+        return None if entry is None else entry[1]
+
+    def put(self, resource, attachment_id, data, metadata=None):
+        """
+        Cache the file (bytes) of an attachment, with a dict of anything else
+        to remember about it (eg its file name). Returns its SHA-256 digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            with self.conn:
+                known = self.conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                if known is None or not os.path.exists(self._path(digest)):
+                    path = self._path(digest)
+                    if not os.path.isdir(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path))
+                    with open(path + '.partial', 'wb') as f:
+                        f.write(data)
+                    os.rename(path + '.partial', path)
+                if known is None:
+                    self.conn.execute("INSERT INTO blobs (digest, size, last_used) VALUES (?, ?, ?)",
+                                      (digest, len(data), self._tick()))
+                    self.size += len(data)
+                else:
+                    self.conn.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (self._tick(), digest))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO attachments (resource, attachment_id, digest, metadata) VALUES (?, ?, ?, ?)",
+                    (resource, attachment_id, digest, json.dumps(metadata) if metadata is not None else None)
+                )
+                self._evict(digest)
+        return digest
+
+    def _remove_blob(self, digest):
+        row = self.conn.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        with self.conn:
+            self.conn.execute("DELETE FROM attachments WHERE digest = ?", (digest,))
+            self.conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        if row is not None:
+            self.size -= row[0]
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def _evict(self, keep):
+        """
+        Remove the least recently used blobs (but never keep, the one just
+        added) until the cache fits in max_bytes.
+        """
+        while self.size > self.max_bytes:
+            row = self.conn.execute(
+                "SELECT digest FROM blobs WHERE digest != ? ORDER BY last_used LIMIT 1", (keep,)
+            ).fetchone()
+            if row is None:
+                break
+            self._remove_blob(row[0])
+
+    def metrics(self):
+        with self.lock:
+            blobs, attachments = self.conn.execute(
+                "SELECT (SELECT COUNT(*) FROM blobs), (SELECT COUNT(*) FROM attachments)").fetchone()
+            return {
+                'attachment_cache_hits': self.hits,
+                'attachment_cache_misses': self.misses,
+                'attachment_cache_blobs': blobs,
+                'attachment_cache_attachments': attachments,
+                'attachment_cache_bytes': self.size,
+            }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
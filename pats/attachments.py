@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Streamed attachment uploads
+
+PATS wants attachments base64-encoded inside the JSON body of a request.
+Rather than reading each file and building its base64 string and then the
+whole body in memory, files can be given as Attachment objects (paths or
+binary file objects), which are read and encoded a chunk at a time while
+the request is being sent:
+
+    buyer.send_rfp(..., attachments=[Attachment('media-kit.pdf')])
+    seller.send_proposal(..., attachments=[Attachment(f, file_name='rates.xlsx')])
+
+so memory use doesn't grow with the size of the files.
+"""
+
+import base64
+import json
+import mimetypes
+import os
+from .core import JSONSerializable
+
+CHUNK_SIZE = 3 * 64 * 1024 # bytes of file read at once (a multiple of 3, so chunks encode separately)
+
+class Base64File(object):
+    """
+    A JSON string value holding the base64 of a file (path or binary file
+    object, read from its current position), after an optional prefix such
+    as "data:image/jpeg;base64,". Only read when the request is sent.
+    """
+    def __init__(self, source, prefix=''):
+        self.source = source
+        self.prefix = prefix
+        if hasattr(source, 'read'):
+            self.start = source.tell()
+            source.seek(0, os.SEEK_END)
+            self.size = source.tell() - self.start
+            source.seek(self.start)
+        else:
+            self.start = 0
+            self.size = os.path.getsize(source)
+
+    def encoded_length(self):
+        return len(self.prefix) + 4 * ((self.size + 2) // 3)
+
+    def chunks(self):
+        """
+        The prefix and then the base64 of the file, in pieces of bytes.
+        """
+        if self.prefix:
+            yield self.prefix.encode('ascii')
+        if hasattr(self.source, 'read'):
+            f = self.source
+            f.seek(self.start)
+        else:
+            f = open(self.source, 'rb')
+        try:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                # a short read mid-file would put padding in the middle
+                while len(chunk) % 3 and len(chunk) < CHUNK_SIZE:
+                    more = f.read(CHUNK_SIZE - len(chunk))
+                    if not more:
+                        break
+                    chunk += more
+                yield base64.b64encode(chunk)
+        finally:
+            if f is not self.source:
+                f.close()
+
+class Attachment(JSONSerializable):
+    """
+    A file attached to an RFP, proposal or proposal return, as
+    {"fileName", "mimeType", "contents"}. The file name defaults to that of
+    the path (or file object) and the MIME type is guessed from the file name.
+    """
+    def __init__(self, source, file_name=None, mime_type=None):
+        if file_name is None:
+            file_name = os.path.basename(getattr(source, 'name', source))
+        self.file_name = file_name
+        self.mime_type = mime_type or mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+        self.contents = Base64File(source)
+
+    def dict_repr(self):
+        return {
+            'fileName': self.file_name,
+            'mimeType': self.mime_type,
+            'contents': self.contents,
+        }
+
+class JSONBody(object):
+    """
+    A request body: the JSON of a payload with the base64 of its files
+    streamed into it. Readable as a file (read(size)) or iterable of bytes,
+    has a len() for the Content-Length header, and can be rewound with
+    seek(0) to be sent again.
+    """
+    def __init__(self, parts):
+        # parts: bytes and Base64File objects, the latter sent as JSON strings
+        self.parts = parts
+        self.length = sum(len(part) if isinstance(part, bytes) else part.encoded_length() + 2 for part in parts)
+        self.seek(0)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield b'"'
+                for chunk in part.chunks():
+                    yield chunk
+                yield b'"'
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise ValueError("A JSONBody can only be rewound to the start")
+        self.pieces = iter(self)
+        self.piece = b''
+        self.offset = 0
+
+    def read(self, size=-1):
+        data = []
+        while size != 0:
+            if self.offset >= len(self.piece):
+                self.piece = next(self.pieces, b'')
+                self.offset = 0
+                if not self.piece:
+                    break
+            end = len(self.piece) if size < 0 else self.offset + size
+            data.append(self.piece[self.offset:end])
+            self.offset += len(data[-1])
+            if size > 0:
+                size -= len(data[-1])
+        return b''.join(data)
+
+    def getvalue(self):
+        """
+        The whole body as bytes (so for small bodies and tests only).
+        """
+        return b''.join(self)
+
+def json_body(data):
+    """
+    The JSON of a request payload, which can contain Attachment, Base64File
+    and other JSONSerializable objects. Without any files it's just the JSON
+    string; otherwise a JSONBody that streams them.
+    """
+    files = []
+
+    def default(value):
+        if isinstance(value, Base64File):
+            files.append(value)
+            return '\x00file-%d\x00' % (len(files) - 1)
+        if isinstance(value, JSONSerializable):
+            return value.dict_repr()
+        raise TypeError("%r is not JSON serializable" % (value,))
+
+    text = json.dumps(data, default=default)
+    if not files:
+        return text
+    parts = []
+    for n, value in enumerate(files):
+        placeholder = json.dumps('\x00file-%d\x00' % n)
+        before, text = text.split(placeholder, 1)
+        parts.extend((before.encode('utf-8'), value))
+    parts.append(text.encode('utf-8'))
+    return JSONBody(parts)
@@ -40,16 +40,18 @@ try:
     from urllib.parse import urlencode
 except ImportError:
     from urllib import urlencode # 2.x
-from .core import PATSAPIClient, PATSException, CampaignDetails
+from .core import PATSAPIClient, PATSException, CampaignDetails, deadline
+from .attachments import json_body
 
 AGENCY_API_DOMAIN = 'prisma-demo.api.mediaocean.com'
 
 class PATSBuyer(PATSAPIClient):
+    api_domain = AGENCY_API_DOMAIN
     agency_id = None
     agency_group_id = None
     user_id = None
 
-    def __init__(self, agency_id=None, agency_group_id=None, user_id=None, api_key=None, debug_mode=False, raw_mode=False, session=None):
+    def __init__(self, agency_id=None, agency_group_id=None, user_id=None, api_key=None, debug_mode=False, raw_mode=False, session=None, **kwargs):
         """
         Create a new buyer-side PATS API object.
 
@@ -62,14 +64,24 @@ class PATSBuyer(PATSAPIClient):
         - raw_mode (boolean) : Store output of request (as 'curl' equivalent) and
                                response (JSON payload) when making requests
         - session (optional) : User session in which to write curl and response objects in raw mode
+        - other keyword arguments (eg mirror) are passed through to PATSAPIClient
         """
-        super(PATSBuyer, self).__init__(api_key, debug_mode, raw_mode, session)
+        super(PATSBuyer, self).__init__(api_key, debug_mode, raw_mode, session, **kwargs)
         if agency_id == None:
             raise PATSException("Agency (aka buyer) ID is required")
         self.agency_id = agency_id
         self.agency_group_id = agency_group_id
         self.user_id = user_id
 
+    def _organization_id(self):
+        return self.agency_id
+
+    def _refresh_mirror_rfps(self):
+        self.search_rfps()
+
+    def _refresh_mirror_proposals(self, rfp_id):
+        self.list_all_proposals(rfp_id=rfp_id)
+
     def get_sellers(self, agency_id=None, user_id=None):
         """
         As a buyer, view all the sellers for which I have access to send orders.
@@ -80,16 +92,15 @@ class PATSBuyer(PATSAPIClient):
         if agency_id == None:
             agency_id = self.agency_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.security-v1+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Agency-Group-ID': self.agency_group_id,
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-User-ID': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.security-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=self.agency_group_id,
+            user_id=user_id
+        )
         path = '/vendors?agencyId=%s' % self.agency_id
-        js = self._send_request(
-            "GET",
+        js = self._send_reference_request(
             AGENCY_API_DOMAIN,
             path,
             extra_headers
@@ -106,17 +117,16 @@ class PATSBuyer(PATSAPIClient):
         if agency_id == None:
             # use default agency ID if none specified
             agency_id = self.agency_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.security-v1+json',
-            'X-MO-User-ID': user_id,
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.security-v1+json',
+            user_id=user_id
+        )
         path = '/agencies?agencyId=%s' % agency_id
         if name:
             path += "&name=%s" % name
         if last_updated_date:
             path += "&updatedAfter=%s" % last_updated_date
-        js = self._send_request(
-            "GET",
+        js = self._send_reference_request(
             AGENCY_API_DOMAIN,
             path,
             extra_headers
@@ -137,17 +147,16 @@ class PATSBuyer(PATSAPIClient):
             agency_id = self.agency_id
         if vendor_id == None:
             raise PATSException("Vendor ID is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.security-v1+json',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': self.agency_group_id,
-            'X-MO-User-ID': user_id,
-            # this really should be 'X-MO-App': 'prisma' - raised PATS-1183
-            'X-MO-App': 'pats'
-        }
+        # this really should be 'X-MO-App': 'prisma' - raised PATS-1183
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.security-v1+json',
+            app='pats',
+            organization_id=agency_id,
+            agency_group_id=self.agency_group_id,
+            user_id=user_id
+        )
         path = '/vendors/%s/users' % (vendor_id)
-        js = self._send_request(
-            "GET",
+        js = self._send_reference_request(
             AGENCY_API_DOMAIN,
             path,
             extra_headers
@@ -170,17 +179,14 @@ class PATSBuyer(PATSAPIClient):
             user_id = campaign_details.user_id
         organisation_id = campaign_details.organisation_id or self.agency_id
         # Create the http object
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.prisma-v1+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Agency-Group-ID': self.agency_group_id,
-            'X-MO-Organization-ID': organisation_id,
-        }
-        # allow for no user ID for unit testing purposes - really we should always have one
-        if user_id:
-            extra_headers.update({
-                'X-MO-User-ID': user_id
-            })
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.prisma-v1+json',
+            app='prisma',
+            organization_id=organisation_id,
+            agency_group_id=self.agency_group_id,
+            # allow for no user ID for unit testing purposes - really we should always have one
+            user_id=user_id
+        )
         campaign_uri = self._send_request(
             "POST",
             AGENCY_API_DOMAIN,
@@ -207,13 +213,13 @@ class PATSBuyer(PATSAPIClient):
             raise PATSException("campaign_id is required")
         organisation_id = campaign_details.organisation_id or self.agency_id
         # Create the http object
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.prisma-v1+json',
-            'X-MO-App': 'prisma',
-            'X-MO-User-ID': campaign_details.user_id,
-            'X-MO-Agency-Group-Id': self.agency_group_id,
-            'X-MO-Organization-ID': organisation_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.prisma-v1+json',
+            app='prisma',
+            organization_id=organisation_id,
+            agency_group_id=self.agency_group_id,
+            user_id=campaign_details.user_id
+        )
         campaign_uri = self._send_request(
             "PUT",
             AGENCY_API_DOMAIN,
@@ -237,13 +243,13 @@ class PATSBuyer(PATSAPIClient):
             agency_id = self.agency_id
         if user_id is None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.prisma-v1+json',
-            'X-MO-User-ID': user_id,
-            'X-MO-App': 'prisma',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': agency_group_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.prisma-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         js = self._send_request(
             "GET",
             AGENCY_API_DOMAIN,
@@ -263,13 +269,13 @@ class PATSBuyer(PATSAPIClient):
             agency_group_id = self.agency_group_id
         if user_id is None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v1+json',
-            'X-MO-Organization-Id': organisation_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v1+json',
+            app='prisma',
+            organization_id=organisation_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         media = []
         if media_print:
             media.append('Print')
@@ -308,7 +314,8 @@ class PATSBuyer(PATSAPIClient):
         if requested_products and requested_products != '':
             data.update({'requestedProducts': requested_products })
         # handle attachments - expect an array containing dicts
-        # of { "fileName", "mimeType" and "contents" }
+        # of { "fileName", "mimeType" and "contents" }, or Attachment objects
+        # (pats.attachments) which are base64-encoded as the request is sent
         # attachments is now mandatory, even if it's an empty array
         # if attachments:
         data.update({ 'attachments': attachments })
@@ -318,7 +325,7 @@ class PATSBuyer(PATSAPIClient):
             AGENCY_API_DOMAIN,
             "/campaigns/%s/rfps" % campaign_id,
             extra_headers,
-            json.dumps(data)
+            json_body(data)
         )
         match = re.search('https?://(.+)?/rfps/(.+?)$', rfp_uri)
         rfp_id = None
@@ -339,13 +346,13 @@ class PATSBuyer(PATSAPIClient):
         if user_id is None:
             user_id = self.user_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v1+json',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
 
         path = '/rfps?'
         if start_date:
@@ -364,19 +371,21 @@ class PATSBuyer(PATSAPIClient):
         )
         return js
 
-    def list_all_rfps(self, start_date=None, end_date=None):
+    def list_all_rfps(self, start_date=None, end_date=None, timeout=None):
         """
         Loop over the list_rfps method until we definitely have all RFPs in an array
+        timeout: seconds the whole loop may take (see pats.deadline)
         """
         page_size = 25
         page = 1
         full_json_list = []
         remaining_content = True
-        while (remaining_content):
-            partial_json_list = self.list_rfps(start_date=start_date, end_date=end_date, page_size=page_size, page=page)
-            full_json_list.extend(partial_json_list)
-            page = page + 1
-            remaining_content = (len(partial_json_list) == page_size)
+        with deadline(timeout):
+            while (remaining_content):
+                partial_json_list = self.list_rfps(start_date=start_date, end_date=end_date, page_size=page_size, page=page)
+                full_json_list.extend(partial_json_list)
+                page = page + 1
+                remaining_content = (len(partial_json_list) == page_size)
 
         return full_json_list
 
@@ -393,13 +402,13 @@ class PATSBuyer(PATSAPIClient):
         if agency_id is None:
             agency_id = self.agency_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v1+json',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=self.user_id
+        )
 
         path = '/campaigns/%s/rfps?' % campaign_id
         js = self._send_request(
@@ -423,13 +432,13 @@ class PATSBuyer(PATSAPIClient):
             agency_group_id = self.agency_group_id
         if agency_id is None:
             agency_id = self.agency_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v1+json',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         js = self._send_request(
             "GET",
             AGENCY_API_DOMAIN,
@@ -453,17 +462,17 @@ class PATSBuyer(PATSAPIClient):
             agency_group_id = self.agency_group_id
         if agency_id is None:
             agency_id = self.agency_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v1+json',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'prisma'
-        }
-        js = self._send_request(
-            "GET",
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
+        js = self._send_attachment_request(
             AGENCY_API_DOMAIN,
-            "/rfps/%s/attachments/%s" % (rfp_id, attachment_id),
+            "/rfps/%s" % rfp_id,
+            attachment_id,
             extra_headers
         )
         return js
@@ -479,13 +488,13 @@ class PATSBuyer(PATSAPIClient):
             agency_id = self.agency_id
         if agency_group_id is None:
             agency_group_id = self.agency_group_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v1+json',
-            'X-MO-Organization-Id': agency_id,
-            'X-MO-Agency-Group-Id': agency_group_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         path = '/rfps'
         if advertiser_name or campaign_urn or rfp_start_date or rfp_end_date or response_due_date or status:
             path += "?"
@@ -508,6 +517,10 @@ class PATSBuyer(PATSAPIClient):
             path,
             extra_headers
         )
+        if self.mirror and agency_id == self.agency_id:
+            # only an unfiltered search gives us the full set of RFPs
+            complete = not (advertiser_name or campaign_urn or rfp_start_date or rfp_end_date or response_due_date or status)
+            self.mirror.store_rfps(agency_id, js, complete=complete)
         return js
 
     def list_proposals(self, agency_group_id=None, agency_id=None, rfp_id=None, start_date=None, end_date=None, page=None):
@@ -525,13 +538,13 @@ class PATSBuyer(PATSAPIClient):
         if agency_id is None:
             agency_id = self.agency_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v2+json',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=self.user_id
+        )
 
         if rfp_id:
             path = '/rfps/%s/proposals?' % rfp_id
@@ -555,23 +568,27 @@ class PATSBuyer(PATSAPIClient):
         )
         return js
 
-    def list_all_proposals(self, agency_group_id=None, agency_id=None, rfp_id=None, start_date=None, end_date=None):
+    def list_all_proposals(self, agency_group_id=None, agency_id=None, rfp_id=None, start_date=None, end_date=None, timeout=None):
         """
         Loop over the list_proposals method until we definitely have all orders in an array
+        timeout: seconds the whole loop may take (see pats.deadline)
         """
         page_size = 25
         page = 1
         full_json_list = []
         remaining_content = True
-        while (remaining_content):
-            partial_json_list = self.list_proposals(
-                agency_group_id=agency_group_id, agency_id=agency_id, rfp_id=rfp_id,
-                start_date=start_date, end_date=end_date, page=page
-                )
-            full_json_list.extend(partial_json_list)
-            page = page + 1
-            remaining_content = (len(partial_json_list) == page_size)
-
+        with deadline(timeout):
+            while (remaining_content):
+                partial_json_list = self.list_proposals(
+                    agency_group_id=agency_group_id, agency_id=agency_id, rfp_id=rfp_id,
+                    start_date=start_date, end_date=end_date, page=page
+                    )
+                full_json_list.extend(partial_json_list)
+                page = page + 1
+                remaining_content = (len(partial_json_list) == page_size)
+
+        if self.mirror and rfp_id and agency_id in (None, self.agency_id) and not (start_date or end_date):
+            self.mirror.store_proposals(self.agency_id, full_json_list, rfp_id=rfp_id, complete=True)
         return full_json_list
  
     def view_proposal_detail(self, agency_group_id=None, agency_id=None, user_id=None, proposal_id=None):
@@ -588,13 +605,13 @@ class PATSBuyer(PATSAPIClient):
             agency_group_id = self.agency_group_id
         if agency_id is None:
             agency_id = self.agency_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v1+json',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         js = self._send_request(
             "GET",
             AGENCY_API_DOMAIN,
@@ -618,17 +635,17 @@ class PATSBuyer(PATSAPIClient):
             raise PATSException("Proposal ID is required")
         if attachment_id is None:
             raise PATSException("Attachment ID is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v1+json',
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'prisma'
-        }
-        js = self._send_request(
-            "GET",
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
+        js = self._send_attachment_request(
             AGENCY_API_DOMAIN,
-            "/proposals/%s/attachments/%s" % (proposal_id, attachment_id),
+            "/proposals/%s" % proposal_id,
+            attachment_id,
             extra_headers
         )
         return js
@@ -648,13 +665,13 @@ class PATSBuyer(PATSAPIClient):
             agency_id = self.agency_id
         if user_id is None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v1+json',
-            'X-MO-User-Id': user_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         if proposal_id is None:
             raise PATSException("Proposal ID is required")
         data = {
@@ -671,7 +688,7 @@ class PATSBuyer(PATSAPIClient):
             AGENCY_API_DOMAIN,
             "/proposals/%s/return" % proposal_id,
             extra_headers,
-            json.dumps(data)
+            json_body(data)
         )
         return js
 
@@ -700,13 +717,13 @@ class PATSBuyer(PATSAPIClient):
         if user_id is None:
             user_id = self.user_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v2+json',
-            'X-MO-User-Id': user_id,
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
  
         path = '/proposals/%s' % proposal_id
         path += '?operation=link&campaignId=%s' % campaign_id
@@ -736,17 +753,16 @@ class PATSBuyer(PATSAPIClient):
             agency_id = self.agency_id
         if user_id == None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.catalog-v1+json',
-            'X-MO-User-ID': user_id,
-            'X-MO-Agency-Group-ID': self.agency_group_id,
-            'X-MO-Organization-ID': self.agency_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.catalog-v1+json',
+            app='prisma',
+            organization_id=self.agency_id,
+            agency_group_id=self.agency_group_id,
+            user_id=user_id
+        )
         # a publisher can query another publisher's properties if they want...
         path = '/vendors/%s/products' % vendor_id
-        js = self._send_request(
-            "GET",
+        js = self._send_reference_request(
             AGENCY_API_DOMAIN,
             path,
             extra_headers
@@ -771,10 +787,7 @@ class PATSBuyer(PATSAPIClient):
         if user_id is None:
             user_id = self.user_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.catalog-v1+json',
-            'X-MO-User-Id': user_id
-        }
+        extra_headers = self._identity_headers('application/vnd.mediaocean.catalog-v1+json', user_id=user_id)
 
         params = {}
         if start_index:
@@ -807,16 +820,15 @@ class PATSBuyer(PATSAPIClient):
             agency_group_id = self.agency_group_id
         if user_id == None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.catalog-v1+json',
-            'X-MO-User-ID': user_id,
-            'X-MO-Agency-Group-ID': self.agency_group_id,
-            'X-MO-Organization-ID': self.agency_id,
-            'X-MO-App': 'prisma'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.catalog-v1+json',
+            app='prisma',
+            organization_id=self.agency_id,
+            agency_group_id=self.agency_group_id,
+            user_id=user_id
+        )
         path = '/vendors/%s/mediaproperties/fields' % organisation_id
-        js = self._send_request(
-            "GET",
+        js = self._send_reference_request(
             AGENCY_API_DOMAIN,
             path,
             extra_headers
@@ -910,16 +922,13 @@ class PATSBuyer(PATSAPIClient):
             agency_group_id=self.agency_group_id
         if campaign_id==None:
             raise PATSException("Campaign ID is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-App': 'prisma'
-        }
-        if user_id:
-            extra_headers.update({
-                'X-MO-User-ID': user_id
-            })
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
 
         if order_id:
             path = "/campaigns/%s/orders/%s/versions" % (campaign_id, order_id)
@@ -957,16 +966,13 @@ class PATSBuyer(PATSAPIClient):
         if user_id == None:
             user_id = self.user_id
         path = '/orders?since=%s&size=%s&page=%s' % (since_date.strftime("%Y-%m-%d"), page_size, page)
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-Organization-ID': agency_id
-        }
-        if user_id:
-            extra_headers.update({
-                'X-MO-User-ID': user_id
-            })
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
 
         # send request
         js = self._send_request(
@@ -977,20 +983,24 @@ class PATSBuyer(PATSAPIClient):
         )
         return js
 
-    def list_all_orders(self, since_date=None):
+    def list_all_orders(self, since_date=None, timeout=None):
         """
         Loop over the list_orders method until we definitely have all orders in an array
+        timeout: seconds the whole loop may take (see pats.deadline)
         """
         page_size = 25
         page = 1
         full_json_list = []
         remaining_content = True
-        while (remaining_content):
-            partial_json_list = self.list_orders(since_date=since_date, page_size=page_size, page=page)
-            full_json_list.extend(partial_json_list)
-            page = page + 1
-            remaining_content = (len(partial_json_list) == page_size)
-
+        with deadline(timeout):
+            while (remaining_content):
+                partial_json_list = self.list_orders(since_date=since_date, page_size=page_size, page=page)
+                full_json_list.extend(partial_json_list)
+                page = page + 1
+                remaining_content = (len(partial_json_list) == page_size)
+
+        if self.mirror:
+            self.mirror.store_orders(self.agency_id, full_json_list, since_date=since_date)
         return full_json_list
 
     def list_order_revisions(self, agency_id=None, agency_group_id=None, user_id=None, campaign_id=None, order_id=None, version=None):
@@ -1007,13 +1017,13 @@ class PATSBuyer(PATSAPIClient):
         if user_id == None:
             user_id = self.user_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Organization-Id': agency_id,
-            'X-MO-Agency-Group-Id': agency_group_id,
-            'X-MO-User-Id': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
 
         path = '/campaigns/%s/orders/%s/versions/%s/revisions' % (campaign_id, order_id, version)
         js = self._send_request(
@@ -1041,13 +1051,13 @@ class PATSBuyer(PATSAPIClient):
         if agency_id == None:
             agency_id = self.agency_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Organization-Id': agency_id,
-            'X-MO-Agency-Group-Id': agency_group_id,
-            'X-MO-User-Id': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         js = self._send_request(
             "GET",
             AGENCY_API_DOMAIN,
@@ -1076,13 +1086,13 @@ class PATSBuyer(PATSAPIClient):
         if agency_id == None:
             agency_id = self.agency_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Organization-Id': agency_id,
-            'X-MO-Agency-Group-Id': agency_group_id,
-            'X-MO-User-Id': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         js = self._send_request(
             "GET",
             AGENCY_API_DOMAIN,
@@ -1112,13 +1122,13 @@ class PATSBuyer(PATSAPIClient):
         if agency_id == None:
             agency_id = self.agency_id
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Organization-Id': agency_id,
-            'X-MO-Agency-Group-Id': agency_group_id,
-            'X-MO-User-Id': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         js = self._send_request(
             "GET",
             AGENCY_API_DOMAIN,
@@ -1143,17 +1153,17 @@ class PATSBuyer(PATSAPIClient):
             raise PATSException("Campaign ID is required")
         if order_id == None:
             raise PATSException("Order ID is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Agency-Group-Id': agency_group_id,
-            'X-MO-Organization-Id': agency_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'prisma'
-        }
-        js = self._send_request(
-            "GET",
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
+        js = self._send_attachment_request(
             AGENCY_API_DOMAIN,
-            "/campaigns/%s/orders/%s/attachments/%s" % (campaign_id, order_id, attachment_id),
+            "/campaigns/%s/orders/%s" % (campaign_id, order_id),
+            attachment_id,
             extra_headers
         )
         return js
@@ -1175,13 +1185,13 @@ class PATSBuyer(PATSAPIClient):
         if order_id == None:
             raise PATSException("Order ID is required")
         # TODO: allow attachments
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-User-ID': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         # TODO: allow for list of emails
         data = {
             'revisionDueBy': revision_due_date.strftime("%Y-%m-%d"),
@@ -1218,13 +1228,13 @@ class PATSBuyer(PATSAPIClient):
             agency_id = self.agency_id
         if user_id == None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-User-ID': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         # TODO: allow for list of emails
         data = {
             'revisionDueBy': revision_due_date.strftime("%Y-%m-%d"),
@@ -1260,13 +1270,13 @@ class PATSBuyer(PATSAPIClient):
             agency_id = self.agency_id
         if user_id == None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.eventnotification-v1+json',
-            'X-MO-App': 'prisma',
-            'X-MO-Agency-Group-ID': agency_group_id,
-            'X-MO-Organization-ID': agency_id,
-            'X-MO-User-ID': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.eventnotification-v1+json',
+            app='prisma',
+            organization_id=agency_id,
+            agency_group_id=agency_group_id,
+            user_id=user_id
+        )
         since_date_string = since_date.strftime("%Y-%m-%dT%H:%M:%SZ")
 
         # TODO: allow for list of emails
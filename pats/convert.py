@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Proposal to order conversion
+
+Turns proposals (as returned by view_proposal_detail) straight into order
+payloads for send_order_raw(), without building an InsertionOrderLineItem
+object per line:
+
+    proposal = buyer.view_proposal_detail(proposal_id=proposal_id)
+    for payload in proposal_to_orders(proposal, respond_by_date=due_date, recipient_emails=[...]):
+        buyer.send_order_raw(campaign_id=proposal['campaignId'], data=payload)
+
+Each order line item keeps a referenceId link back to the proposal line it
+came from, and package children keep their parentExternalId. The fields
+copied for each kind of line item follow the rules of LineItem.dict_repr().
+"""
+
+import datetime
+import six
+from .core import PATSException, payload_value, PROPOSAL_ID_FIELDS, VENDOR_ID_FIELDS
+from .lazy import JSONView
+
+COMMON_FIELDS = ('externalId', 'name', 'packageType', 'comments', 'supplierPlacementParentReference',
+                 'freeFormMediaProperty', 'buyType', 'buyCategory', 'unitType', 'costMethod',
+                 'cost', 'units', 'rate', 'campaignId', 'section', 'subsection', 'copySplit', 'region')
+PRINT_FIELDS = COMMON_FIELDS + ('coverDate', 'color', 'size', 'saleDate', 'positionGuaranteed',
+                                'includeInDigitalEdition', 'position', 'serialNumber')
+DIGITAL_FIELDS = COMMON_FIELDS + ('primaryPlacement', 'servedBy', 'target', 'creativeType', 'dimensions',
+                                  'position', 'parentExternalId', 'flightStartDate', 'flightEndDate',
+                                  'flighting', 'serialNumber')
+
+# fields left out of some kinds of line item (see LineItem*.dict_repr)
+CHILD_EXCLUDED = ('unitType', 'costMethod', 'cost', 'units', 'rate', 'flightStartDate', 'flightEndDate')
+PARENT_EXCLUDED = ('buyType', 'buyCategory', 'servedBy', 'target', 'creativeType', 'dimensions', 'position')
+FEE_EXCLUDED = ('section', 'subsection')
+DIGITAL_FEE_EXCLUDED = ('dimensions', 'position')
+PRINT_FEE_EXCLUDED = ('rate', 'section', 'subsection', 'color', 'size', 'saleDate', 'positionGuaranteed',
+                      'includeInDigitalEdition', 'position')
+PARENT_PACKAGE_TYPES = ('Package', 'Roadblock')
+# decimal places amounts are rounded to, as in LineItem.dict_repr
+ROUNDING = {'cost': 2, 'rate': 4}
+
+MEDIA = (
+    # proposal and order key, order mediaType, fields
+    ('digitalLineItems', 'Online', DIGITAL_FIELDS),
+    ('printLineItems', 'Print', PRINT_FIELDS),
+)
+
+_field_cache = {}
+
+def _fields(all_fields, package_type, buy_type):
+    """
+    The fields to copy for one kind of line item, worked out once per kind.
+    """
+    key = (all_fields, package_type, buy_type)
+    fields = _field_cache.get(key)
+    if fields is None:
+        excluded = set()
+        if package_type == 'Child':
+            excluded.update(CHILD_EXCLUDED)
+        else:
+            excluded.add('parentExternalId')
+        if package_type in PARENT_PACKAGE_TYPES:
+            excluded.update(PARENT_EXCLUDED)
+        if buy_type == 'Fee':
+            excluded.update(FEE_EXCLUDED)
+            if 'primaryPlacement' in all_fields:
+                # only digital fees lose their position (print ones keep it)
+                excluded.update(DIGITAL_FEE_EXCLUDED)
+        elif buy_type == 'Print Fee':
+            excluded.update(PRINT_FEE_EXCLUDED)
+        fields = _field_cache[key] = tuple(name for name in all_fields if name not in excluded)
+    return fields
+
+def _round(value, places):
+    if isinstance(value, six.string_types):
+        try:
+            value = float(value)
+        except ValueError:
+            raise PATSException("Can't parse amount %r" % (value,))
+    return round(value, places)
+
+def convert_line_items(line_items, all_fields=DIGITAL_FIELDS):
+    """
+    Order line item dicts for a list of proposal line items (dicts or lazy
+    views). referenceId is set to the proposal line's ID (or kept, if the
+    proposal line has no ID of its own), and every package child must name a
+    package or roadblock in the same list as its parentExternalId.
+    """
+    converted = []
+    parents = set()
+    children = []
+    for item in line_items:
+        if isinstance(item, JSONView):
+            # one json.loads of the line is quicker than finding each field in the view
+            item = item.to_python()
+        get = item.get
+        package_type = get('packageType')
+        line_item = {}
+        for name in _fields(all_fields, package_type, get('buyType')):
+            value = get(name)
+            if value is not None:
+                if name in ROUNDING:
+                    value = _round(value, ROUNDING[name])
+                line_item[name] = value
+        reference_id = get('id') or get('referenceId')
+        if reference_id is not None:
+            line_item['referenceId'] = reference_id
+        if package_type in PARENT_PACKAGE_TYPES:
+            parents.add(line_item.get('externalId'))
+        elif package_type == 'Child':
+            children.append(line_item)
+        converted.append(line_item)
+    for line_item in children:
+        if line_item.get('parentExternalId') not in parents:
+            raise PATSException("Line item %s: parent package %s is not in the proposal" % (
+                line_item.get('externalId') or line_item.get('name'), line_item.get('parentExternalId')))
+    return converted
+
+def proposal_to_orders(proposal, external_order_id=None, respond_by_date=None, **order_fields):
+    """
+    Order payloads for send_order_raw() - one for the proposal's digital line
+    items and one for its print line items, for whichever it has.
+
+    external_order_id: the orders' externalId (with "-print" added to the print
+        order's when the proposal has both)
+    respond_by_date: date or "YYYY-MM-DD" string
+    other keyword arguments are order fields, eg currencyCode, recipientEmails,
+        buyer, comment (vendorId and currencyCode default to the proposal's)
+    """
+    if isinstance(respond_by_date, datetime.date):
+        respond_by_date = respond_by_date.strftime("%Y-%m-%d")
+    media = [(key, media_type, fields) for key, media_type, fields in MEDIA if proposal.get(key)]
+    if not media:
+        raise PATSException("Proposal %s has no line items" % payload_value(proposal, PROPOSAL_ID_FIELDS))
+    orders = []
+    for key, media_type, fields in media:
+        order = {'mediaType': media_type}
+        for name, value in (('vendorId', payload_value(proposal, VENDOR_ID_FIELDS)),
+                            ('currencyCode', proposal.get('currencyCode')),
+                            ('respondByDate', respond_by_date)):
+            # left out when not known, as dict_repr() does
+            if value:
+                order[name] = value
+        if external_order_id:
+            order['externalId'] = external_order_id if len(media) == 1 or media_type == 'Online' \
+                else external_order_id + '-print'
+        order.update(order_fields)
+        order[key] = convert_line_items(proposal[key], fields)
+        orders.append(order)
+    return orders
+
+def proposals_to_orders(proposals, external_order_id=None, **order_fields):
+    """
+    proposal_to_orders() for many proposals, as a list of (proposal ID, [order payloads]).
+
+    external_order_id: prefix of the orders' externalIds - each proposal's
+        orders get external_order_id + "-" + its proposal ID
+    """
+    results = []
+    for proposal in proposals:
+        proposal_id = payload_value(proposal, PROPOSAL_ID_FIELDS)
+        own_id = "%s-%s" % (external_order_id, proposal_id) if external_order_id else None
+        results.append((proposal_id, proposal_to_orders(proposal, external_order_id=own_id, **order_fields)))
+    return results
@@ -28,28 +28,204 @@ PATS Python library - Core functions - Brendan Quinn Dec 2014
 Based on Mediaocean PATS API documented at https://developer.mediaocean.com/
 """
 
+from array import array
 from collections import OrderedDict
-try:
-    from http.client import HTTPSConnection
-except ImportError:
-    from httplib import HTTPSConnection # 2.x
+from contextlib import contextmanager
+import base64
+import copy
 import datetime
 import json
+import logging
 import os
 import re
 import six # for 2.x / 3.x compatibility eg iteritems
+import socket
 from socket import gaierror
 import string
+import threading
 import time
+from . import lazy
+from .transport import ConnectionPool, HTTP2Pool
 
 VERSION = '0.12' # update for 2016.6 APIs
 
+logger = logging.getLogger(__name__)
+
 RETRY_LIMIT = 3 # number of times to re-try HTTP requests if we get a gateway timeout error
 
+DEFAULT_CONNECT_TIMEOUT = 30 # seconds to wait for a connection to PATS
+DEFAULT_READ_TIMEOUT = 300 # seconds to wait on a connected socket (list calls can be slow)
+
+HEADER_TEMPLATE_LIMIT = 1024 # number of distinct header sets each client keeps ready-made
+
+# Field names used in order, RFP and proposal payloads. Some of these have
+# changed between API versions, so we look for each alternative in turn.
+ORDER_ID_FIELDS = ('orderId', 'id', 'publicId')
+VERSION_FIELDS = ('version', 'majorVersion')
+CAMPAIGN_ID_FIELDS = ('campaignId', 'campaignPublicId')
+ADVERTISER_FIELDS = ('advertiserName', 'advertiser')
+VENDOR_ID_FIELDS = ('vendorId', 'vendorPublicId')
+STATUS_FIELDS = ('status', 'orderStatus')
+UPDATED_FIELDS = ('lastUpdatedDate', 'lastModifiedDate', 'updatedDate')
+RFP_ID_FIELDS = ('rfpId', 'id', 'publicId')
+PROPOSAL_ID_FIELDS = ('proposalId', 'id', 'publicId')
+RESPONSE_DUE_FIELDS = ('responseDueDate', 'dueDate')
+
+def payload_value(payload, names, default=None):
+    """
+    Return the first of the given field names found in an API payload dict.
+    Advertiser fields are sometimes objects, so we unwrap those to their name.
+    """
+    for name in names:
+        value = payload.get(name)
+        if value is not None:
+            if isinstance(value, (dict, lazy.JSONObjectView)):
+                value = value.get('name') or value.get('code')
+            return value
+    return default
+
 class PATSException(Exception):
     pass
 
+class PATSCircuitOpenError(PATSException):
+    """
+    Raised without calling PATS when the circuit breaker for an endpoint is
+    open, ie the endpoint has been failing or too slow recently.
+    """
+    pass
+
+class PATSTimeoutError(PATSException):
+    """
+    Raised when a request or its deadline runs out of time.
+    """
+    pass
+
+class Deadline(object):
+    """
+    A point in time by which an operation, however many requests it makes,
+    must be finished.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        return self.expires - time.time()
+
+    def check(self):
+        """
+        Raise PATSTimeoutError if the deadline has passed.
+        """
+        if self.remaining() <= 0:
+            raise PATSTimeoutError("Deadline of %s seconds exceeded" % self.seconds)
+
+deadline_context = threading.local()
+
+def current_deadline():
+    """
+    The Deadline that requests made by this thread must meet, if any.
+    """
+    return getattr(deadline_context, 'deadline', None)
+
+@contextmanager
+def deadline(timeout=None):
+    """
+    Give every request made by this thread inside the block - by any client -
+    a share of one time budget:
+
+        with pats.deadline(60):
+            orders = buyer.list_all_orders(since_date)
+
+    Each request only waits for as long as is left, and once the time is up
+    the next request raises PATSTimeoutError without being sent. Only the
+    list_all_* methods take a timeout of their own; wrap any other call in a
+    deadline (or set the client's total_timeout) to limit it. timeout can
+    be a number of seconds or a Deadline (eg to pass one to another thread).
+    A nested deadline can only shorten the time left; None keeps the current one.
+    """
+    previous = current_deadline()
+    if timeout is None:
+        new = previous
+    else:
+        new = timeout if isinstance(timeout, Deadline) else Deadline(timeout)
+        if previous is not None and previous.expires < new.expires:
+            new = previous
+    deadline_context.deadline = new
+    try:
+        yield new
+    finally:
+        deadline_context.deadline = previous
+
+def int64_typecode(signed=True):
+    """
+    The array typecode for 8-byte integers, or None if this build has none.
+    'q' and 'Q' need Python 3.3+; on 2.7, 'l' and 'L' are 8 bytes wide on
+    64-bit Unix builds.
+    """
+    for typecode in (('q', 'l') if signed else ('Q', 'L')):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+    return None
+
+def endpoint_template(path):
+    """
+    The endpoint a request path belongs to, with IDs replaced by {id} and
+    without the query string, eg /campaigns/{id}/orders/{id}/versions/{id}
+    """
+    path = path.split('?')[0]
+    return '/'.join('{id}' if re.search(r'\d', segment) else segment for segment in path.split('/'))
+
+class SingleFlight(object):
+    """
+    Lets concurrent callers asking for the same thing share a single call:
+    the first caller for a key does the work, and anyone asking for the same
+    key while it is in flight waits for and shares its result (or exception).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'event': threading.Event()}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            # followers get their own copy so nobody can change another caller's result
+            return copy.deepcopy(call['result'])
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['event'].set()
+
 class PATSAPIClient(object):
+    """
+    Base class for PATSBuyer and PATSSeller.
+
+    A client can be shared by any number of threads. Requests made at the
+    same time each get their own connection from the client's ConnectionPool
+    (or one passed in with pool=...), and header sets are only ever read once
+    built. In raw mode the shared session is written under a lock, but with
+    several threads it only tells you about *some* recent request - use
+    "with client.capture() as exchange:" to record the requests made by the
+    current thread inside the block. The mirror is safe to share as well.
+    """
     # controlled values for product catalogue
     possible_media_types = ['PRINT', 'DIGITAL']
     possible_media_subtypes_print = ['DISPLAY_PRINT', 'CLASSIFIED', 'INSERTS', 'PRINT_CUSTOM']
@@ -67,7 +243,40 @@ class PATSAPIClient(object):
     # session - if we need to write info to the session, it will be injected in the constructor
     session = None
 
-    def __init__(self, api_key, debug_mode=False, raw_mode=False, session=None):
+    # mirror - optional local PATSMirror that list_all_* results are written to
+    mirror = None
+
+    # coalesce_requests - share one network call between identical concurrent GETs
+    coalesce_requests = False
+
+    # rate_limiter - optional RateLimiter, shared by all clients acting for the same API key
+    rate_limiter = None
+
+    # reference_cache - optional ReferenceCache for sellers, users, media properties and products
+    reference_cache = None
+
+    # attachment_cache - optional AttachmentCache for order, RFP and proposal attachments
+    attachment_cache = None
+
+    # circuit_breakers - optional CircuitBreakers, one breaker per domain and endpoint
+    circuit_breakers = None
+
+    # hedging - optional Hedging policy for GET requests
+    hedging = None
+
+    # timeouts in seconds: to connect, to wait for data on a connected socket, and
+    # for one request including its retries (None for no total limit)
+    connect_timeout = DEFAULT_CONNECT_TIMEOUT
+    read_timeout = DEFAULT_READ_TIMEOUT
+    total_timeout = None
+
+    # lazy_json - return read-only lazy views (see pats.lazy) instead of dicts and lists
+    lazy_json = False
+
+    # api_domain - host that prewarm() connects to, set in subclasses
+    api_domain = None
+
+    def __init__(self, api_key, debug_mode=False, raw_mode=False, session=None, mirror=None, coalesce_requests=False, pool=None, rate_limiter=None, reference_cache=None, circuit_breakers=None, hedging=None, connect_timeout=None, read_timeout=None, total_timeout=None, prewarm=False, http2=False, lazy_json=False, attachment_cache=None):
         """
         Initialize a PATS instance.
         Parameters:
@@ -75,6 +284,34 @@ class PATSAPIClient(object):
         debug_mode: if True, output HTTP request and response.
         raw_mode: store curl equivalent of each command, and the raw output, in user session if provided
         session: handle to user session object which stores data in raw mode
+        mirror: PATSMirror in which to keep a local copy of orders, RFPs and proposals
+        coalesce_requests: if True, identical GET requests made at the same time from
+            different threads share one call to PATS
+        pool: Transport to send requests through - by default a new ConnectionPool;
+            pass one to share connections between clients, or eg a
+            RecordingTransport / ReplayTransport
+        rate_limiter: RateLimiter that every request made by this client must go through
+        reference_cache: ReferenceCache in which to keep reference data (sellers, users,
+            media property fields, products)
+        circuit_breakers: CircuitBreakers used to stop calling endpoints that keep
+            failing - requests to an endpoint whose breaker is open raise
+            PATSCircuitOpenError straight away
+        hedging: Hedging policy - slow GET requests get a second copy sent,
+            and the first response wins
+        connect_timeout / read_timeout: seconds to wait for a connection and for
+            each read from it (defaults DEFAULT_CONNECT_TIMEOUT / DEFAULT_READ_TIMEOUT)
+        total_timeout: seconds each request may take including retries - use
+            "with pats.deadline(seconds):" to limit a whole series of requests
+        prewarm: if True (or a number of connections), resolve and connect to the
+            API host straight away so the first request doesn't have to
+        http2: if True (and pool isn't given), talk HTTP/2 through an HTTP2Pool
+            when httpx is installed, otherwise HTTP/1.1 as usual
+        lazy_json: if True, responses are returned as read-only dict- and list-like
+            views that only decode the fields that are read (see pats.lazy); before
+            Python 3.11 (no possessive regex quantifiers) finding fields is somewhat
+            slower, though still without decoding what is stepped over
+        attachment_cache: AttachmentCache (see pats.attachment_cache) in which to keep
+            order, RFP and proposal attachments once fetched
         """
         self.api_key = api_key
         if debug_mode:
@@ -83,69 +320,364 @@ class PATSAPIClient(object):
             self.raw_mode = True
         if session:
             self.session = session
+        if mirror:
+            self.mirror = mirror
+        if coalesce_requests:
+            self.coalesce_requests = True
+        self.single_flight = SingleFlight()
+        self.identity_header_sets = {}
+        self.header_templates = {}
+        if pool is None:
+            if http2 and HTTP2Pool.available():
+                pool = HTTP2Pool()
+            else:
+                if http2:
+                    logger.warning("HTTP/2 needs httpx and h2 (pip install httpx[http2]), using HTTP/1.1")
+                pool = ConnectionPool()
+        self.pool = pool
+        if rate_limiter:
+            self.rate_limiter = rate_limiter
+        if reference_cache:
+            self.reference_cache = reference_cache
+        if circuit_breakers:
+            self.circuit_breakers = circuit_breakers
+        if hedging:
+            self.hedging = hedging
+        if connect_timeout:
+            self.connect_timeout = connect_timeout
+        if read_timeout:
+            self.read_timeout = read_timeout
+        if total_timeout:
+            self.total_timeout = total_timeout
+        if lazy_json:
+            self.lazy_json = True
+        if attachment_cache:
+            self.attachment_cache = attachment_cache
+        self.session_lock = threading.Lock()
+        self.capture_context = threading.local()
+        if prewarm:
+            try:
+                self.prewarm(int(prewarm))
+            except (socket.error, PATSException) as e:
+                # not being able to warm up mustn't stop the client being created
+                logger.warning("Could not pre-warm connections to %s: %s", self.api_domain, e)
+
+    def prewarm(self, connections=1):
+        """
+        Resolve the API host and open connections to it (TLS handshake
+        included) ready for the first requests. Returns the number opened.
+        """
+        if self.api_domain is None:
+            raise PATSException("This client has no API domain to pre-warm")
+        return self.pool.prewarm(self.api_domain, connections, self.connect_timeout)
+
+    @contextmanager
+    def capture(self):
+        """
+        Record the requests made by this thread inside the block:
+
+            with buyer.capture() as exchange:
+                buyer.list_orders(since_date=...)
+            print(exchange['curl_command'], exchange['response_status'])
+
+        The dict holds the curl command, response status and response text of
+        the last request made in the block.
+        """
+        previous = getattr(self.capture_context, 'exchange', None)
+        exchange = self.capture_context.exchange = {}
+        try:
+            yield exchange
+        finally:
+            self.capture_context.exchange = previous
+
+    def metrics(self):
+        """
+        Counters describing what this client has done so far.
+        """
+        metrics = {
+            'coalesced_requests': self.single_flight.coalesced,
+        }
+        metrics.update(self.pool.metrics())
+        if self.rate_limiter:
+            metrics['rate_limit_wait'] = self.rate_limiter.waited
+        if self.reference_cache:
+            metrics['reference_cache_hits'] = self.reference_cache.hits
+            metrics['reference_cache_misses'] = self.reference_cache.misses
+        if self.attachment_cache:
+            metrics.update(self.attachment_cache.metrics())
+        if self.circuit_breakers:
+            metrics['circuit_breakers'] = self.circuit_breakers.metrics()
+        if self.hedging:
+            metrics.update(self.hedging.metrics())
+        return metrics
+
+    def _organization_id(self):
+        """
+        ID of the agency or vendor this client acts for - overridden in subclasses.
+        """
+        return None
+
+    def _mirror_is_fresh(self, dataset, max_age, since_date=None):
+        if self.mirror is None:
+            raise PATSException("No mirror is attached to this client")
+        return self.mirror.is_fresh(self._organization_id(), dataset, max_age, since_date)
+
+    def mirror_orders(self, since_date=None, advertiser=None, campaign_id=None, max_age=300):
+        """
+        Orders from the local mirror, refreshed with list_all_orders() first if the
+        mirrored copy is older than max_age seconds (or doesn't go back to since_date).
+        """
+        if not self._mirror_is_fresh('orders', max_age, since_date):
+            if since_date is None:
+                raise PATSException("Since date is required to refresh the mirror")
+            self.list_all_orders(since_date=since_date)
+        return self.mirror.find_orders(self._organization_id(), advertiser=advertiser,
+                                       campaign_id=campaign_id, since_date=since_date)
+
+    def mirror_order_line_items(self, order_id=None, version=None):
+        """
+        Line items of an order (latest version unless one is given) from the local mirror.
+        """
+        if self.mirror is None:
+            raise PATSException("No mirror is attached to this client")
+        return self.mirror.find_line_items(self._organization_id(), order_id, version)
+
+    def mirror_rfps_due(self, start_date=None, end_date=None, max_age=300):
+        """
+        RFPs whose response is due between start_date and end_date (inclusive)
+        from the local mirror, refreshed first if older than max_age seconds.
+        """
+        if not self._mirror_is_fresh('rfps', max_age):
+            self._refresh_mirror_rfps()
+        return self.mirror.find_rfps_due(self._organization_id(), start_date, end_date)
+
+    def mirror_proposals_for_rfp(self, rfp_id=None, max_age=300):
+        """
+        Proposals sent in response to an RFP from the local mirror, refreshed
+        first if older than max_age seconds.
+        """
+        if rfp_id is None:
+            raise PATSException("RFP ID is required")
+        if not self._mirror_is_fresh('proposals:%s' % rfp_id, max_age):
+            self._refresh_mirror_proposals(rfp_id)
+        return self.mirror.find_proposals(self._organization_id(), rfp_id)
+
+    def _refresh_mirror_rfps(self):
+        raise PATSException("This client can't refresh RFPs")
+
+    def _refresh_mirror_proposals(self, rfp_id):
+        raise PATSException("This client can't refresh proposals")
+
+    def _identity_headers(self, accept, app=None, organization_id=None, agency_group_id=None, user_id=None):
+        """
+        Per-call headers (Accept type plus the X-MO-* identity headers) for a request.
+        Each distinct set is only built once per client and then shared, so the
+        dict returned must not be modified. Identity values of None are left out.
+        """
+        key = (accept, app, organization_id, agency_group_id, user_id)
+        headers = self.identity_header_sets.get(key)
+        if headers is None:
+            headers = {'Accept': accept}
+            if app:
+                headers['X-MO-App'] = app
+            if organization_id:
+                headers['X-MO-Organization-ID'] = organization_id
+            if agency_group_id:
+                headers['X-MO-Agency-Group-ID'] = agency_group_id
+            if user_id:
+                headers['X-MO-User-ID'] = user_id
+            if len(self.identity_header_sets) >= HEADER_TEMPLATE_LIMIT:
+                self.identity_header_sets.clear()
+                self.header_templates.clear()
+            self.identity_header_sets[key] = headers
+            self.header_templates[id(headers)] = (headers, self._build_headers(headers))
+        return headers
 
     def _get_headers(self, extra_headers):
+        """
+        Full set of request headers for the given per-call headers. Each distinct
+        set is only built once per client, so the dict returned is shared and
+        must not be modified. Ready-made sets from _identity_headers() are found
+        by identity, without looking at their contents.
+        """
+        template = self.header_templates.get(id(extra_headers))
+        if template is not None and template[0] is extra_headers:
+            return template[1]
+        key = tuple(extra_headers.items())
+        headers = self.header_templates.get(key)
+        if headers is None:
+            headers = self._build_headers(extra_headers)
+            if len(self.header_templates) >= 2 * HEADER_TEMPLATE_LIMIT:
+                self.identity_header_sets.clear()
+                self.header_templates.clear()
+            self.header_templates[key] = headers
+        return headers
+
+    def _build_headers(self, extra_headers):
         # Set user agent, API key and output type
         content_type = 'application/json'
         headers = {
             'User-Agent': "PATS Python Library/%s" % VERSION,
             'Content-Type': content_type,
-            'X-MO-API-Key': self.api_key,
-            'Connection': 'close'
+            'X-MO-API-Key': self.api_key
         }
         headers.update(extra_headers)
         return headers
 
-    def _send_request(self, method, domain, path, extra_headers, body=None):
-        # Create the http object
-        h = HTTPSConnection(domain)
+    def _send_reference_request(self, domain, path, extra_headers):
+        """
+        GET reference data, from the reference cache if there is one.
+        """
+        if self.reference_cache is None:
+            return self._send_request("GET", domain, path, extra_headers)
+        key = (self.api_key, domain, path, tuple(extra_headers.items()))
+        js = self.reference_cache.get(key)
+        if js is None:
+            js = self._send_request("GET", domain, path, extra_headers)
+            self.reference_cache.put(key, js)
+        return js
 
-        if self.debug_mode:
-            h.set_debuglevel(10)
+    def _send_attachment_request(self, domain, resource, attachment_id, extra_headers):
+        """
+        GET an attachment of an order, RFP or proposal (resource, eg
+        "/rfps/RFP-1"), from the attachment cache if there is one.
+        """
+        path = "%s/attachments/%s" % (resource, attachment_id)
+        if self.attachment_cache is None:
+            return self._send_request("GET", domain, path, extra_headers)
+        # one tenant mustn't be given another's attachments from a shared cache
+        key = "%s:%s%s" % (extra_headers.get('X-MO-Organization-ID') or self._organization_id(), domain, resource)
+        cached = self.attachment_cache.lookup(key, attachment_id)
+        if cached is not None:
+            metadata, contents = cached
+            js = dict(metadata, contents=base64.b64encode(contents).decode('ascii'))
+            return lazy.loads(json.dumps(js)) if self.lazy_json else js
+        js = self._send_request("GET", domain, path, extra_headers)
+        plain = js.to_python() if isinstance(js, lazy.JSONView) else js
+        if isinstance(plain, dict) and isinstance(plain.get('contents'), six.string_types):
+            # the file is stored once however it's named; the rest of the response goes in the index
+            try:
+                contents = base64.b64decode(plain['contents'])
+            except (TypeError, ValueError):
+                return js
+            metadata = dict((name, value) for name, value in plain.items() if name != 'contents')
+            self.attachment_cache.put(key, attachment_id, contents, metadata)
+        return js
+
+    def _send_request(self, method, domain, path, extra_headers, body=None):
+        if method == "GET" and self.coalesce_requests:
+            key = (domain, path, tuple(extra_headers.items()))
+            return self.single_flight.do(
+                key, lambda: self._perform_request(method, domain, path, extra_headers, body)
+            )
+        return self._perform_request(method, domain, path, extra_headers, body)
 
+    def _perform_request(self, method, domain, path, extra_headers, body=None):
         # Construct the request headers
         headers = self._get_headers(extra_headers)
+        streamed = body is not None and not isinstance(body, six.string_types + (bytes,))
+        if streamed:
+            # a streamed body (eg with attachments) is sent with its length, not chunked
+            headers = dict(headers, **{'Content-Length': str(len(body))})
 
         # In "raw mode", create the equivalent curl(1) command for this request
-        # and save it in the session provided in the constructor
+        # and save it in the session provided in the constructor. Anyone inside
+        # a capture() block gets the exchange recorded whether in raw mode or not.
+        exchange = getattr(self.capture_context, 'exchange', None)
+        record_session = self.raw_mode and self.session
         curl = ''
-        if self.raw_mode and self.session:
+        if record_session or exchange is not None:
             curl = 'curl -v -X "%s" ' % method
             for header_name, header_value in six.iteritems(headers):
                 curl += '-H "%s: %s" ' % (header_name, header_value)
             if body:
                 # we want to turn ' into '"'"' for curl output so we need to do this!
                 match = re.compile("'")
-                curl_body = match.sub("'\"'\"'", body)
+                curl_body = match.sub("'\"'\"'", body if not streamed else '<%d bytes streamed>' % len(body))
                 if method == "POST" or method == "PUT":
                     curl += "--data '%s' " % curl_body
             # escape the url in double-quotes because it might contain & characters
             curl += '"https://%s%s"' % (domain, path)
-            self.session['curl_command'] = curl
+            if exchange is not None:
+                exchange['curl_command'] = curl
+            if record_session:
+                with self.session_lock:
+                    self.session['curl_command'] = curl
              
         # Perform the request (with retries) and get the response headers and content
-        retries = RETRY_LIMIT; response = ''; response_status = 0; response_text = ''
+        retries = RETRY_LIMIT; response = None; response_status = 0; response_text = ''
+        endpoint = breaker = None
+        if self.circuit_breakers or self.hedging:
+            endpoint = (domain, endpoint_template(path))
+        if self.circuit_breakers:
+            breaker = self.circuit_breakers.get(endpoint)
+        current = current_deadline()
+        if self.total_timeout:
+            own = Deadline(self.total_timeout)
+            if current is None or own.expires < current.expires:
+                current = own
         for n in range(retries):
+            if current is not None:
+                # before the breaker lets us through as its probe, which must then be sent
+                current.check()
+            if breaker is not None and not breaker.allow():
+                raise PATSCircuitOpenError(
+                    "Circuit open for %s%s: it has been failing, not calling it for now" % endpoint)
             try:
-                h.request(method,
-                  path,
-                  body,
-                  headers)
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                timeouts = self._timeouts(current)
+            except BaseException:
+                if breaker is not None:
+                    breaker.release()
+                raise
+            started = time.time()
+            try:
+                if self.hedging and method == "GET":
+                    response = self.hedging.request(self.pool, endpoint,
+                      method, domain, path, body, headers, 10 if self.debug_mode else 0, timeouts)
+                else:
+                    response = self.pool.request(method,
+                      domain,
+                      path,
+                      body,
+                      headers,
+                      10 if self.debug_mode else 0,
+                      timeouts=timeouts)
             except gaierror: # if we got a socket exception, try again
-                time.sleep(5)
+                if breaker is not None:
+                    breaker.record(False, time.time() - started)
+                    if breaker.is_open():
+                        continue # no point waiting, the next attempt fails fast
+                self._sleep_before_retry(current)
                 continue
-            response = h.getresponse()
+            except socket.timeout:
+                if breaker is not None:
+                    breaker.record(False, time.time() - started)
+                raise PATSTimeoutError("Timed out waiting for %s%s" % (domain, path))
+            except Exception:
+                if breaker is not None:
+                    breaker.record(False, time.time() - started)
+                raise
             response_status = response.status
-            response_text = response.read().decode('utf-8')
+            response_text = response.body.decode('utf-8')
+            if breaker is not None:
+                # 4xx means the endpoint is working but didn't like our request
+                breaker.record(response_status < 500, time.time() - started)
             if response_status == 504:
                 # gateway timeout error: sleep then retry (up to retry limit)
-                time.sleep(5)
+                if breaker is None or not breaker.is_open():
+                    self._sleep_before_retry(current)
             else:
                 # go on
                 break
-        if self.raw_mode and self.session:
-            self.session['response_status'] = response_status
-            self.session['response_text'] = response_text
+        if exchange is not None:
+            exchange['response_status'] = response_status
+            exchange['response_text'] = response_text
+        if record_session:
+            with self.session_lock:
+                self.session['response_status'] = response_status
+                self.session['response_text'] = response_text
 
         if self.debug_mode:
             print ("DEBUG: response status is %d, full response is" % response_status)
@@ -173,7 +705,10 @@ class PATSAPIClient(object):
         if response_status == 422:
             self._relay_error(response_status, response_text)
 
-        js = json.JSONDecoder().decode(response_text)
+        if self.lazy_json:
+            js = lazy.loads(response_text)
+        else:
+            js = json.JSONDecoder().decode(response_text)
 
         if response_status == 422:
             if 'message' in js:
@@ -188,6 +723,23 @@ class PATSAPIClient(object):
 
         return js
 
+    def _timeouts(self, current):
+        """
+        (connect, read) timeouts for the next attempt, cut down to the time
+        left before the current deadline.
+        """
+        if current is None:
+            return (self.connect_timeout, self.read_timeout)
+        current.check()
+        remaining = current.remaining()
+        return (min(self.connect_timeout or remaining, remaining), min(self.read_timeout or remaining, remaining))
+
+    def _sleep_before_retry(self, current):
+        if current is not None and current.remaining() < 5:
+            # we'd run out of time before trying again
+            raise PATSTimeoutError("Deadline of %s seconds exceeded while retrying" % current.seconds)
+        time.sleep(5)
+
     def _relay_error(self, error_code, reason=""):
         """
         Errors from http://developer.mediaocean.com/docs/catalog_api/Save_print_products_to_catalog:
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Line item costs
+
+Works out what each line item of an order or proposal should cost from its
+units, rate and cost method, flags the ones whose cost doesn't match, and
+checks the totals against the campaign's budgets before anything is sent:
+
+    report = reconcile(line_items)               # LineItem objects or dicts
+    report.mismatches                            # [{'index', 'externalId', 'cost', 'expected', ...}]
+    report.check_budget(campaign_details)        # [('digital', budget, total)] for budgets exceeded
+    reconcile(line_items, fix=True)              # or set each cost to the expected one
+
+Amounts are worked out exactly, the way dict_repr() sends them: rates to 4
+decimal places and costs to 2, rounding halves up. Each batch is done as
+columns of scaled integers (with numpy when it is installed and the amounts
+fit in 64 bits), so there is no float rounding anywhere.
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping # 2.x
+from .core import PATSException, LineItemPrint
+
+try:
+    import numpy # optional, for whole-batch arithmetic
+except ImportError:
+    numpy = None
+
+# cost = units / divisor * rate, for cost methods priced per so many units
+COST_METHOD_DIVISORS = {
+    'CPM': 1000,
+    'vCPM': 1000,
+    'CPT': 1000,
+}
+FLAT_COST_METHODS = ('Flat', 'Flat Rate', 'Fixed') # cost = rate, whatever the units
+RATE_PLACES = 4
+COST_PLACES = 2
+UNIT_PLACES = 4 # finest fraction of a unit (eg column cms) worked with exactly
+INT64_MAX = 2 ** 63 - 1
+
+def _getter(item):
+    """
+    get(name) for a line item dict (or lazy view) or LineItem object.
+    """
+    if isinstance(item, dict) or isinstance(item, Mapping):
+        return item.get
+    return lambda name: getattr(item, name, None)
+
+def _get(item, name):
+    return _getter(item)(name)
+
+def _decimal(value, name, item):
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(value if isinstance(value, (int, str)) else str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise PATSException("Line item %s: %s %r is not a number" % (_get(item, 'externalId'), name, value))
+
+def scaled_int(value, places, name, item):
+    """
+    value * 10**places as an exact int (rounded half up past that many
+    places), or None.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value * 10 ** places
+    # the usual "123.45" (or float 123.45) without going through Decimal
+    text = value if isinstance(value, str) else repr(value)
+    whole, point, fraction = text.partition('.')
+    if len(fraction) <= places and (fraction.isdigit() or not fraction) and whole.lstrip('-').isdigit():
+        return int(whole + fraction.ljust(places, '0'))
+    number = _decimal(value, name, item)
+    return int(number.scaleb(places).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def _divide(dividend, divisor):
+    """
+    dividend / divisor rounded half up (half away from zero when negative).
+    """
+    magnitude = (2 * abs(dividend) + divisor) // (2 * divisor)
+    return -magnitude if dividend < 0 else magnitude
+
+def _media(item, get):
+    if isinstance(item, LineItemPrint) or get('coverDate') is not None or get('saleDate') is not None:
+        return 'print'
+    return 'digital'
+
+def _expected_cents(units, rates, divisors, use_numpy):
+    """
+    Expected costs in hundredths, from units and rates scaled by 10**UNIT_PLACES
+    and 10**RATE_PLACES: units * rate / divisor, rounded half up (half away from
+    zero for negative amounts, eg credits).
+    """
+    scale = 10 ** (UNIT_PLACES + RATE_PLACES - COST_PLACES)
+    # the largest intermediate is 2 * |units * rate| + divisor * scale
+    if use_numpy and units and \
+            2 * max(max(units), -min(units)) * max(max(rates), -min(rates)) + max(divisors) * scale <= INT64_MAX:
+        product = numpy.array(units, dtype=numpy.int64) * numpy.array(rates, dtype=numpy.int64)
+        d = numpy.array(divisors, dtype=numpy.int64) * scale
+        magnitude = (2 * numpy.abs(product) + d) // (2 * d)
+        return numpy.where(product < 0, -magnitude, magnitude).tolist()
+    return [_divide(u * r, d * scale) for u, r, d in zip(units, rates, divisors)]
+
+class CostReport(object):
+    """
+    What reconcile() found: the expected cost of each line item (None where
+    it isn't worked out from a rate, eg package children and print fees),
+    mismatches, and totals by media ('digital', 'print' and 'total').
+    """
+    def __init__(self, expected, mismatches, totals):
+        self.expected = expected
+        self.mismatches = mismatches
+        self.totals = totals
+
+    @property
+    def ok(self):
+        return not self.mismatches
+
+    def check_budget(self, campaign_details=None, campaign_budget=None, print_budget=None, digital_budget=None):
+        """
+        Budgets the totals go over, as a list of (budget name, budget, total).
+        Budgets come from a CampaignDetails (campaign_budget,
+        print_campaign_budget and digital_campaign_budget) or are given
+        directly; blank or zero budgets aren't checked.
+        """
+        if campaign_details is not None:
+            campaign_budget = campaign_details.campaign_budget
+            print_budget = campaign_details.print_campaign_budget
+            digital_budget = campaign_details.digital_campaign_budget
+        exceeded = []
+        for name, budget in (('total', campaign_budget), ('print', print_budget), ('digital', digital_budget)):
+            if not budget:
+                continue
+            budget = _decimal(budget, 'budget', {'externalId': name})
+            if budget > 0 and self.totals[name] > budget:
+                exceeded.append((name, budget, self.totals[name]))
+        return exceeded
+
+def reconcile(line_items, fix=False, tolerance=0, use_numpy=None):
+    """
+    Work out the cost each line item (LineItem objects or dicts) should have,
+    and return a CostReport.
+
+    fix: set each line item's cost to its expected cost (as a float rounded
+        to 2 places, as dict_repr() sends it) instead of reporting mismatches;
+        the line items can't then be read-only lazy views
+    tolerance: difference allowed between a given and expected cost
+    use_numpy: force (True) or avoid (False) numpy - by default it's used if installed
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    elif use_numpy and numpy is None:
+        raise PATSException("numpy is not installed")
+    if fix:
+        for item in line_items:
+            if isinstance(item, Mapping) and not isinstance(item, MutableMapping):
+                raise PATSException("Can't fix the costs of read-only line items (eg lazy views): "
+                                    "pass dicts, eg from view.to_python()")
+    # given costs are compared to expected ones in 10**-RATE_PLACES
+    given_scale = 10 ** (RATE_PLACES - COST_PLACES)
+    tolerance = scaled_int(tolerance, RATE_PLACES, 'tolerance', {})
+    # columns of the line items that are priced from a rate
+    getters = [_getter(item) for item in line_items]
+    priced, units, rates, divisors = [], [], [], []
+    for n, get in enumerate(getters):
+        item = line_items[n]
+        cost_method = get('costMethod')
+        if not cost_method or get('packageType') == 'Child' or get('buyType') == 'Print Fee':
+            continue
+        rate = scaled_int(get('rate'), RATE_PLACES, 'rate', item)
+        if rate is None:
+            continue
+        if cost_method in FLAT_COST_METHODS:
+            unit_count = 10 ** UNIT_PLACES
+        else:
+            unit_count = scaled_int(get('units') or 0, UNIT_PLACES, 'units', item)
+        priced.append(n)
+        units.append(unit_count)
+        rates.append(rate)
+        divisors.append(COST_METHOD_DIVISORS.get(cost_method, 1))
+    expected_cents = [None] * len(line_items)
+    for n, value in zip(priced, _expected_cents(units, rates, divisors, use_numpy)):
+        expected_cents[n] = value
+    mismatches = []
+    totals = {'digital': 0, 'print': 0}
+    for n, item in enumerate(line_items):
+        get = getters[n]
+        given = scaled_int(get('cost'), RATE_PLACES, 'cost', item)
+        cost = expected_cents[n]
+        if cost is None:
+            cost = _divide(given, given_scale) if given is not None else 0
+        elif fix:
+            if isinstance(item, Mapping):
+                item['cost'] = float(Decimal(cost).scaleb(-COST_PLACES))
+            else:
+                item.cost = float(Decimal(cost).scaleb(-COST_PLACES))
+        elif given is None or abs(given - cost * given_scale) > tolerance:
+            mismatches.append({
+                'index': n,
+                'externalId': get('externalId'),
+                'costMethod': get('costMethod'),
+                'units': get('units'),
+                'rate': get('rate'),
+                'cost': None if given is None else Decimal(given).scaleb(-RATE_PLACES),
+                'expected': Decimal(cost).scaleb(-COST_PLACES),
+            })
+        totals[_media(item, get)] += cost
+    totals['total'] = totals['digital'] + totals['print']
+    expected = [None if cost is None else Decimal(cost).scaleb(-COST_PLACES) for cost in expected_cents]
+    return CostReport(expected, mismatches,
+                      dict((name, Decimal(total).scaleb(-COST_PLACES)) for name, total in totals.items()))
+
+def reconcile_payload(payload, **kwargs):
+    """
+    reconcile() all the line items of an order or proposal payload.
+    """
+    line_items = []
+    for key in ('digitalLineItems', 'printLineItems'):
+        line_items.extend(payload.get(key) or ())
+    return reconcile(line_items, **kwargs)
@@ -0,0 +1,637 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Push event notification receiver
+
+PATS can push event notifications (new orders, revisions, RFPs, proposals...)
+to an HTTP endpoint instead of us polling for them. EventReceiver is that
+endpoint: it accepts the notifications, drops duplicates, queues them and
+hands them to the handlers registered for each event type.
+
+After an outage, reprocess_events() makes PATS re-send everything since a
+date. ReplayPipeline absorbs that flood: it skips events already processed
+(remembered on disk in SeenEvents), handles each order's events in order
+and pushes back on the sender when the handlers fall behind.
+
+https://developer.mediaocean.com/docs/read/event_notification/
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+import hashlib
+import heapq
+import json
+import logging
+import os
+import struct
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.request import Request, urlopen
+    import queue
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer # 2.x
+    from SocketServer import ThreadingMixIn
+    from urllib2 import Request, urlopen
+    import Queue as queue
+from .core import PATSException, payload_value, ORDER_ID_FIELDS, VERSION_FIELDS, \
+    CAMPAIGN_ID_FIELDS, RFP_ID_FIELDS, PROPOSAL_ID_FIELDS, int64_typecode
+
+logger = logging.getLogger(__name__)
+
+EVENT_ID_FIELDS = ('eventId', 'id', 'notificationId')
+EVENT_TYPE_FIELDS = ('eventType', 'type', 'event')
+ENTITY_TYPE_FIELDS = ('entityType', 'resourceType')
+PARTITION_FIELDS = ('orderId', 'proposalId', 'rfpId', 'entityId')
+
+DEFAULT_QUEUE_SIZE = 10000      # events waiting for a handler before we push back on the sender
+DEFAULT_RECENT_EVENTS = 100000  # event IDs remembered for de-duplication
+RETRY_AFTER = 5                 # seconds we ask the sender to wait when the queue is full
+DEFAULT_PARTITIONS = 4          # replay lanes; events for one order always use the same lane
+DEFAULT_LANE_SIZE = 1000        # events waiting in each replay lane
+DEFAULT_REPORT_EVERY = 10000    # handled events between replay progress reports
+SEEN_MERGE_MIN = 100000         # new event IDs held in memory before SeenEvents merges and saves
+
+def event_id(event):
+    return payload_value(event, EVENT_ID_FIELDS)
+
+def event_type(event):
+    return payload_value(event, EVENT_TYPE_FIELDS)
+
+def parse_events(body):
+    """
+    Turn a notification request body (one event object or a list of them) into
+    a list of event dicts.
+    """
+    try:
+        js = json.loads(body.decode('utf-8') if isinstance(body, bytes) else body)
+    except ValueError:
+        raise PATSException("Event notification is not valid JSON")
+    if isinstance(js, dict):
+        # some notifications wrap the list of events in an envelope
+        js = js.get('events', [js])
+    if not isinstance(js, list) or not all(isinstance(event, dict) for event in js):
+        raise PATSException("Event notification should be an event object or a list of them")
+    return js
+
+def fetch_event_detail(client, event):
+    """
+    Fetch the full order version, RFP or proposal that an event is about, using
+    a PATSBuyer or PATSSeller. Returns None for events about anything else.
+    """
+    entity = (payload_value(event, ENTITY_TYPE_FIELDS) or event_type(event) or '').lower()
+    if 'order' in entity:
+        order_id = payload_value(event, ORDER_ID_FIELDS[:1] + ('entityId',))
+        version = payload_value(event, VERSION_FIELDS)
+        campaign_id = payload_value(event, CAMPAIGN_ID_FIELDS)
+        return client.view_order_version_detail(campaign_id=campaign_id, order_id=order_id, version=version)
+    if 'proposal' in entity:
+        return client.view_proposal_detail(proposal_id=payload_value(event, PROPOSAL_ID_FIELDS[:1] + ('entityId',)))
+    if 'rfp' in entity:
+        return client.view_rfp_detail(rfp_id=payload_value(event, RFP_ID_FIELDS[:1] + ('entityId',)))
+    return None
+
+def post_events(url, events, timeout=10):
+    """
+    Stand-in for PATS: POST events to a receiver, eg for local testing.
+    Returns the HTTP status.
+    """
+    request = Request(url, json.dumps(events).encode('utf-8'), {'Content-Type': 'application/json'})
+    response = urlopen(request, timeout=timeout)
+    try:
+        return response.getcode()
+    finally:
+        response.close()
+
+class RecentEvents(object):
+    """
+    Bounded set of recently seen event IDs (oldest forgotten first).
+    """
+    def __init__(self, size=DEFAULT_RECENT_EVENTS):
+        self.size = size
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, event_id):
+        """
+        Remember an event ID, returning False if it was already known.
+        """
+        with self.lock:
+            if event_id in self.ids:
+                return False
+            self.ids[event_id] = True
+            if len(self.ids) > self.size:
+                self.ids.popitem(last=False)
+            return True
+
+    def __contains__(self, event_id):
+        with self.lock:
+            return event_id in self.ids
+
+    def discard(self, event_id):
+        with self.lock:
+            self.ids.pop(event_id, None)
+
+# no 8-byte array type (eg 2.7 on Windows): SeenEvents keeps a plain list instead
+DIGEST_TYPECODE = int64_typecode(signed=False)
+
+class SeenEvents(object):
+    """
+    Persistent set of processed event IDs, compact enough for millions of
+    events: each ID is kept as an 8-byte digest in a sorted array (8MB per
+    million events) and looked up by bisection.
+
+    New IDs are held in a small set and merged into the array (and saved to
+    path) once there are enough of them, and on flush(). IDs added since the
+    last save are lost if the process dies, so those events are handled again
+    by the next replay.
+    """
+    def __init__(self, path=None, merge_min=SEEN_MERGE_MIN):
+        self.path = path
+        self.merge_min = merge_min
+        self.digests = self._digest_array([])
+        self.pending = set()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                if DIGEST_TYPECODE:
+                    self.digests.fromfile(f, os.path.getsize(path) // 8)
+                else:
+                    data = f.read()
+                    self.digests = list(struct.unpack('=%dQ' % (len(data) // 8), data))
+
+    @staticmethod
+    def _digest_array(digests):
+        return array(DIGEST_TYPECODE, digests) if DIGEST_TYPECODE else list(digests)
+
+    @staticmethod
+    def digest(event_id):
+        return struct.unpack('<Q', hashlib.sha1(str(event_id).encode('utf-8')).digest()[:8])[0]
+
+    def _contains(self, digest):
+        if digest in self.pending:
+            return True
+        n = bisect_left(self.digests, digest)
+        return n < len(self.digests) and self.digests[n] == digest
+
+    def __contains__(self, event_id):
+        digest = self.digest(event_id)
+        with self.lock:
+            return self._contains(digest)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.digests) + len(self.pending)
+
+    def add(self, event_id):
+        """
+        Remember an event ID, returning False if it was already known.
+        """
+        digest = self.digest(event_id)
+        with self.lock:
+            if self._contains(digest):
+                return False
+            self.pending.add(digest)
+            # merging rewrites the whole array, so wait until the new IDs are a
+            # good fraction of it - that keeps adds cheap however big it gets
+            if len(self.pending) >= max(self.merge_min, len(self.digests) // 4):
+                self._merge()
+            return True
+
+    def _merge(self):
+        # streamed merge, so we never hold the whole set as Python ints
+        self.digests = self._digest_array(heapq.merge(self.digests, sorted(self.pending)))
+        self.pending.clear()
+        if self.path:
+            with open(self.path + '.partial', 'wb') as f:
+                if DIGEST_TYPECODE:
+                    self.digests.tofile(f)
+                else:
+                    f.write(struct.pack('=%dQ' % len(self.digests), *self.digests))
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(self.path + '.partial', self.path)
+
+    def flush(self):
+        """
+        Merge and save any IDs added since the last save.
+        """
+        with self.lock:
+            if self.pending:
+                self._merge()
+
+class ReplayPipeline(object):
+    """
+    Handles a flood of (mostly re-sent) events: events already processed are
+    skipped, events for the same order are handled one at a time in the order
+    they arrived, and submit() blocks while the handlers are behind.
+
+        pipeline = ReplayPipeline(handle, SeenEvents('seen-events.bin')).start()
+        pipeline.run(events)
+        pipeline.close()
+
+    Events are spread over "partitions" lanes by order ID (or proposal / RFP
+    ID), each with one worker thread and a queue of lane_size events. An event
+    is only remembered as processed once dispatch(event) returns without
+    returning False, so failed events are tried again by the next replay.
+    """
+    def __init__(self, dispatch, seen=None, partitions=DEFAULT_PARTITIONS, lane_size=DEFAULT_LANE_SIZE,
+                 report_every=DEFAULT_REPORT_EVERY, progress_callback=None):
+        """
+        dispatch: called with each event to handle it
+        seen: SeenEvents of already processed events (in memory only by default)
+        partitions: number of lanes (and worker threads)
+        lane_size: events that can wait in each lane before submit() blocks
+        report_every: handled events between progress reports
+        progress_callback: called with progress() at each report (logged by default)
+        """
+        self.dispatch = dispatch
+        self.seen = seen if seen is not None else SeenEvents()
+        self.lanes = [queue.Queue(maxsize=lane_size) for n in range(partitions)]
+        self.report_every = report_every
+        self.progress_callback = progress_callback
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.threads = []
+        self.started = None
+        self.stats = {'submitted': 0, 'skipped': 0, 'handled': 0, 'failed': 0}
+
+    def _lane(self, event):
+        key = payload_value(event, PARTITION_FIELDS)
+        if key is None:
+            key = event_id(event)
+        return self.lanes[hash(key) % len(self.lanes)]
+
+    def submit(self, event, timeout=None):
+        """
+        Queue one event, waiting up to timeout seconds (forever by default) for
+        room in its lane. Returns False if the event was already processed or
+        is already queued, and raises queue.Full if the lane stayed full.
+        """
+        eid = event_id(event)
+        if eid is not None:
+            with self.lock:
+                if eid in self.in_flight or eid in self.seen:
+                    self.stats['skipped'] += 1
+                    return False
+                self.in_flight.add(eid)
+        try:
+            self._lane(event).put(event, timeout=timeout)
+        except queue.Full:
+            with self.lock:
+                self.in_flight.discard(eid)
+            raise
+        with self.lock:
+            self.stats['submitted'] += 1
+        return True
+
+    def run(self, events):
+        """
+        Submit every event from an iterable, then wait for them all to be handled.
+        """
+        for event in events:
+            self.submit(event)
+        self.join()
+        return self.progress()
+
+    def _work(self, lane):
+        while True:
+            event = lane.get()
+            try:
+                if event is None:
+                    return
+                self._handle(event)
+            finally:
+                lane.task_done()
+
+    def _handle(self, event):
+        eid = event_id(event)
+        try:
+            ok = self.dispatch(event) is not False
+        except Exception:
+            logger.exception("Replay failed for event %s", eid)
+            ok = False
+        if ok and eid is not None:
+            self.seen.add(eid)
+        with self.lock:
+            self.in_flight.discard(eid)
+            self.stats['handled' if ok else 'failed'] += 1
+            done = self.stats['handled'] + self.stats['failed']
+        if self.report_every and done % self.report_every == 0:
+            self.report()
+
+    def start(self):
+        """
+        Start a worker thread for each lane.
+        """
+        if self.threads:
+            raise PATSException("Replay pipeline is already running")
+        self.started = time.time()
+        self.threads = [threading.Thread(target=self._work, args=(lane,)) for lane in self.lanes]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def join(self):
+        """
+        Wait until every submitted event has been handled.
+        """
+        for lane in self.lanes:
+            lane.join()
+
+    def close(self):
+        """
+        Finish the queued events, stop the workers and save the seen events.
+        """
+        for lane in self.lanes:
+            lane.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.seen.flush()
+        self.report()
+
+    def progress(self):
+        """
+        Counts so far, the number of events waiting and the handling rate in
+        events per second.
+        """
+        with self.lock:
+            progress = dict(self.stats)
+        progress['queued'] = sum(lane.qsize() for lane in self.lanes)
+        progress['elapsed'] = time.time() - self.started if self.started else 0.0
+        done = progress['handled'] + progress['failed']
+        progress['events_per_second'] = done / progress['elapsed'] if progress['elapsed'] else 0.0
+        return progress
+
+    def report(self):
+        progress = self.progress()
+        if self.progress_callback is not None:
+            self.progress_callback(progress)
+        else:
+            logger.info("Replay: %(handled)d handled, %(failed)d failed, %(skipped)d skipped, "
+                        "%(queued)d queued, %(events_per_second).0f events/s", progress)
+
+class _ReceiverServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        receiver = self.server.receiver
+        if receiver.path and self.path.split('?')[0] != receiver.path:
+            return self._reply(404, {'message': 'Not found'})
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            events = parse_events(self.rfile.read(length))
+        except PATSException as e:
+            return self._reply(400, {'message': str(e)})
+        accepted = receiver.receive(events)
+        if accepted is None:
+            return self._reply(503, {'message': 'Queue full, try again later'}, {'Retry-After': str(RETRY_AFTER)})
+        return self._reply(200, {'accepted': accepted})
+
+    def _reply(self, status, js, headers=None):
+        body = json.dumps(js).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+class EventReceiver(object):
+    """
+    Embeddable HTTP endpoint for PATS event notifications.
+
+        receiver = EventReceiver(port=8080)
+        receiver.on('ORDER_SENT', lambda event, receiver: handle(fetch_event_detail(buyer, event)))
+        receiver.start()
+
+    Handlers are called as handler(event, receiver) on the receiver's worker
+    threads; a handler registered for '*' gets every event. When the queue is
+    full the sender gets 503 with Retry-After, so PATS backs off and re-sends
+    rather than us running out of memory.
+
+    Re-sends of an event that is queued or being handled are dropped, but an
+    event is only remembered as seen once its handlers have all succeeded, so
+    one whose handler failed is handled again if PATS re-sends it.
+
+    For a reprocess_events() backfill, call replay() before asking PATS to
+    re-send: events then go through a ReplayPipeline instead of the queue.
+    """
+    def __init__(self, host='127.0.0.1', port=0, path='/', workers=4, queue_size=DEFAULT_QUEUE_SIZE,
+                 recent_events=DEFAULT_RECENT_EVENTS, enqueue_timeout=1.0):
+        """
+        host / port: address to listen on (port 0 picks a free port - see .url)
+        path: URL path notifications are posted to (None accepts any path)
+        workers: number of threads running handlers
+        queue_size: events that can wait for a handler before we push back
+        recent_events: number of event IDs remembered for de-duplication
+        enqueue_timeout: seconds a request waits for queue space before we push back
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.recent = RecentEvents(recent_events)
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        self.enqueue_timeout = enqueue_timeout
+        self.handlers = {}
+        self.server = None
+        self.threads = []
+        self.pipeline = None
+        self.stats_lock = threading.Lock()
+        self.stats = {'received': 0, 'duplicates': 0, 'rejected': 0, 'handled': 0, 'handler_errors': 0}
+
+    def on(self, event_type, handler):
+        """
+        Register handler(event, receiver) for an event type ('*' for all events).
+        """
+        self.handlers.setdefault(event_type, []).append(handler)
+        return handler
+
+    def _count(self, name, n=1):
+        with self.stats_lock:
+            self.stats[name] += n
+
+    def _claim(self, eid):
+        """
+        Mark an event as in flight, returning False if it already is or has
+        been handled.
+        """
+        with self.in_flight_lock:
+            if eid in self.in_flight or eid in self.recent:
+                return False
+            self.in_flight.add(eid)
+            return True
+
+    def _release(self, eid, handled):
+        with self.in_flight_lock:
+            if handled:
+                self.recent.add(eid)
+            self.in_flight.discard(eid)
+
+    def receive(self, events):
+        """
+        De-duplicate and queue a batch of events. Returns the number queued, or
+        None if the queue stayed full (the whole batch should then be re-sent).
+        """
+        self._count('received', len(events))
+        accepted = 0
+        for n, event in enumerate(events):
+            eid = event_id(event)
+            if eid is not None and not self._claim(eid):
+                self._count('duplicates')
+                continue
+            try:
+                if self.pipeline is None:
+                    self.queue.put(event, timeout=self.enqueue_timeout)
+                elif not self.pipeline.submit(event, timeout=self.enqueue_timeout):
+                    # processed before the outage
+                    self._release(eid, True)
+                    self._count('duplicates')
+                    continue
+            except queue.Full:
+                # forget the event we couldn't queue so the re-send isn't dropped as a duplicate
+                self._release(eid, False)
+                self._count('rejected', len(events) - n)
+                return None
+            accepted += 1
+        return accepted
+
+    def dispatch(self, event):
+        """
+        Call the handlers for one event. Returns False if any of them failed,
+        in which case the event isn't remembered as seen.
+        """
+        ok = True
+        for handler in self.handlers.get(event_type(event), []) + self.handlers.get('*', []):
+            try:
+                handler(event, self)
+            except Exception:
+                ok = False
+                self._count('handler_errors')
+                logger.exception("Event handler failed for event %s", event_id(event))
+        eid = event_id(event)
+        if eid is not None:
+            self._release(eid, ok)
+        self._count('handled')
+        return ok
+
+    def replay(self, seen_path=None, **kwargs):
+        """
+        Send incoming events through a ReplayPipeline (see there for the
+        keyword arguments) that skips events listed in the seen_path file.
+        Returns the running pipeline; end_replay() goes back to normal.
+        """
+        if self.pipeline is not None:
+            raise PATSException("Receiver is already replaying")
+        self.pipeline = ReplayPipeline(self.dispatch, SeenEvents(seen_path), **kwargs).start()
+        return self.pipeline
+
+    def end_replay(self):
+        """
+        Finish the replayed events and return the pipeline's final progress.
+        """
+        pipeline, self.pipeline = self.pipeline, None
+        if pipeline is None:
+            return None
+        pipeline.close()
+        return pipeline.progress()
+
+    def _work(self):
+        while True:
+            event = self.queue.get()
+            try:
+                if event is None:
+                    return
+                self.dispatch(event)
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        """
+        Start listening and handling events in background threads.
+        """
+        if self.server is not None:
+            raise PATSException("Receiver is already running")
+        self.server = _ReceiverServer((self.host, self.port), _NotificationHandler)
+        self.server.receiver = self
+        self.port = self.server.server_address[1]
+        self.threads = [threading.Thread(target=self.server.serve_forever)]
+        self.threads += [threading.Thread(target=self._work) for n in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+    @property
+    def url(self):
+        return 'http://%s:%s%s' % (self.host, self.port, self.path or '/')
+
+    def join(self):
+        """
+        Wait until every queued event has been handled.
+        """
+        self.queue.join()
+        if self.pipeline is not None:
+            self.pipeline.join()
+
+    def stop(self):
+        """
+        Stop accepting events, finish the queued ones and stop the workers.
+        """
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.end_replay()
+        self.server.server_close()
+        for thread in self.threads[1:]:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.server = None
+        self.threads = []
+
+    def metrics(self):
+        with self.stats_lock:
+            metrics = dict(self.stats)
+        metrics['queued'] = self.queue.qsize()
+        if self.pipeline is not None:
+            metrics['replay'] = self.pipeline.progress()
+        return metrics
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Resumable JSONL export
+
+Streams the orders, RFPs or proposals of one or more tenants to a JSONL file
+(gzipped if wanted), one {"tenant": ..., "order": ...} line per record:
+
+    JSONLExport('orders', clients, 'orders.jsonl.gz', since_date=since_date).run()
+
+Tenants are fetched at the same time, and each tenant's next few pages are
+requested ahead. Pages are written as soon as they arrive, in page order,
+and after each one a cursor file records how far every tenant has got and
+how much of the output is complete - so running the same export again after
+an interruption picks up where it left off. "python -m pats export" runs one
+from the command line.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import io
+import json
+import os
+import threading
+from .core import PATSException
+from .lazy import json_default
+from .seller import PATSSeller
+
+DEFAULT_WORKERS = 4   # tenants exported at once
+DEFAULT_PAGES_AHEAD = 4 # pages of one tenant requested at once
+PAGE_SIZE = 25
+# kinds listed PAGE_SIZE at a time; proposals come in PATS's own page size,
+# so only an empty page shows that there are no more
+SIZED_KINDS = ('orders', 'rfps')
+KINDS = {
+    # kind: record key in each output line
+    'orders': 'order',
+    'rfps': 'rfp',
+    'proposals': 'proposal',
+}
+
+def fetch_page(client, kind, page, since_date=None, end_date=None):
+    """
+    One page of a tenant's orders (updated since since_date), RFPs (between
+    since_date and end_date) or proposals (since since_date; buyers only).
+    """
+    if kind == 'orders':
+        return client.list_orders(since_date=since_date, page_size=PAGE_SIZE, page=page)
+    if kind == 'rfps':
+        return client.list_rfps(start_date=since_date, end_date=end_date, page_size=PAGE_SIZE, page=page)
+    if kind == 'proposals':
+        if isinstance(client, PATSSeller):
+            raise PATSException("Sellers can only list proposals by RFP, so they can't be exported")
+        return client.list_proposals(start_date=since_date, page=page)
+    raise PATSException("Kind must be one of %s" % ', '.join(sorted(KINDS)))
+
+class JSONLExport(object):
+    """
+    One resumable export of one kind of record for a list of clients.
+    """
+    def __init__(self, kind, clients, output_path, since_date=None, end_date=None, cursor_path=None,
+                 compress=None, workers=DEFAULT_WORKERS, pages_ahead=DEFAULT_PAGES_AHEAD):
+        """
+        kind: 'orders', 'rfps' or 'proposals'
+        clients: PATSBuyer / PATSSeller clients, one per agency or vendor
+        output_path: JSONL file to write
+        since_date / end_date: dates to export (orders need since_date)
+        cursor_path: where progress is kept (output_path + '.cursor' by default)
+        compress: gzip the output (by default, if output_path ends in .gz)
+        workers: tenants exported at once
+        pages_ahead: pages of one tenant requested at once
+        """
+        if kind not in KINDS:
+            raise PATSException("Kind must be one of %s" % ', '.join(sorted(KINDS)))
+        if kind == 'orders' and since_date is None:
+            raise PATSException("Since date is required to export orders")
+        # the cursor and output lines are keyed by agency or vendor ID, so two
+        # clients for the same one (eg with different user IDs) would share a cursor
+        tenant_ids = [client._organization_id() for client in clients]
+        for n, tenant_id in enumerate(tenant_ids):
+            if tenant_id in tenant_ids[:n]:
+                raise PATSException("More than one client for %s: export with one per agency or vendor" % tenant_id)
+        self.kind = kind
+        self.clients = clients
+        self.output_path = output_path
+        self.cursor_path = cursor_path or output_path + '.cursor'
+        self.since_date = since_date
+        self.end_date = end_date
+        self.compress = output_path.endswith('.gz') if compress is None else compress
+        self.workers = workers
+        self.pages_ahead = pages_ahead
+        self.lock = threading.Lock()
+
+    def _settings(self):
+        return {
+            'kind': self.kind,
+            'since_date': self.since_date.strftime("%Y-%m-%d") if self.since_date else None,
+            'end_date': self.end_date.strftime("%Y-%m-%d") if self.end_date else None,
+            'compress': self.compress,
+        }
+
+    def _load_cursor(self):
+        """
+        The saved cursor, if this export was started before; otherwise a new one.
+        """
+        if not os.path.exists(self.cursor_path):
+            return dict(self._settings(), offset=0, tenants={})
+        with open(self.cursor_path) as f:
+            cursor = json.load(f)
+        for key, value in self._settings().items():
+            if cursor.get(key) != value:
+                raise PATSException("Cursor %s is for a different export (%s %r, not %r)" % (
+                    self.cursor_path, key, cursor.get(key), value))
+        return cursor
+
+    def _save_cursor(self):
+        with open(self.cursor_path + '.partial', 'w') as f:
+            json.dump(self.cursor, f)
+        os.rename(self.cursor_path + '.partial', self.cursor_path)
+
+    def _write_page(self, tenant, records, next_page, done):
+        """
+        Append one page to the output and move the tenant's cursor past it.
+        """
+        record_key = KINDS[self.kind]
+        text = ''.join(json.dumps({'tenant': tenant, record_key: record}, default=json_default) + '\n'
+                       for record in records).encode('utf-8')
+        if self.compress and text:
+            # one gzip member per page: the file is complete at every page boundary
+            buffer = io.BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode='wb') as member:
+                member.write(text)
+            text = buffer.getvalue()
+        with self.lock:
+            self.output.write(text)
+            self.output.flush()
+            os.fsync(self.output.fileno())
+            state = self.cursor['tenants'][tenant]
+            state['page'] = next_page
+            state['done'] = done
+            state['records'] += len(records)
+            self.cursor['offset'] = self.output.tell()
+            self._save_cursor()
+
+    def _export_tenant(self, client, page_pool):
+        tenant = client._organization_id()
+        with self.lock:
+            state = self.cursor['tenants'].setdefault(tenant, {'page': 1, 'done': False, 'records': 0})
+        page = state['page']
+        while not state['done']:
+            # ask for the next few pages at once, and write them in order
+            futures = [page_pool.submit(fetch_page, client, self.kind, page + n, self.since_date, self.end_date)
+                       for n in range(self.pages_ahead)]
+            for future in futures:
+                records = future.result()
+                done = len(records) < PAGE_SIZE if self.kind in SIZED_KINDS else not records
+                page += 1
+                self._write_page(tenant, records, page, done)
+                if done:
+                    break
+        return state['records']
+
+    def run(self):
+        """
+        Export (or carry on exporting) every tenant. Returns
+        {tenant: records exported}, counting any exported by earlier runs.
+        """
+        self.cursor = self._load_cursor()
+        mode = 'r+b' if os.path.exists(self.output_path) else 'wb'
+        with open(self.output_path, mode) as output:
+            # anything after the cursor's offset is from a page that was never finished
+            output.seek(0, os.SEEK_END)
+            if output.tell() < self.cursor['offset']:
+                raise PATSException("Output %s is shorter than its cursor says" % self.output_path)
+            output.truncate(self.cursor['offset'])
+            output.seek(self.cursor['offset'])
+            self.output = output
+            with ThreadPoolExecutor(max_workers=max(1, self.workers * self.pages_ahead)) as page_pool:
+                with ThreadPoolExecutor(max_workers=max(1, self.workers)) as tenant_pool:
+                    futures = [tenant_pool.submit(self._export_tenant, client, page_pool) for client in self.clients]
+                    for future in futures:
+                        future.result()
+        return dict((tenant, state['records']) for tenant, state in self.cursor['tenants'].items())
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Flighting
+
+Splits the units of a batch of digital placements across the months of
+their flights, giving the [{"month", "year", "units"}] lists that
+LineItemDigital.flighting passes through to PATS:
+
+    set_flighting(line_items)                     # pro rata by days in each month
+    set_flighting(line_items, method='even')      # the same units every month
+
+Units are split by cumulative rounding, so each placement's months always
+add up to exactly its units. With numpy installed whole batches are worked
+out with array arithmetic; otherwise the same split is done month by month.
+"""
+
+import datetime
+from decimal import Decimal
+import six
+from .core import PATSException
+try:
+    import numpy # optional, for whole-batch arithmetic
+except ImportError:
+    numpy = None
+
+METHODS = ('days', 'even', 'weights')
+
+def _date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    except (ValueError, TypeError):
+        raise PATSException("Can't parse flight date %r" % (value,))
+
+def _whole(units):
+    # units often come straight from payloads, as strings or Decimals
+    try:
+        value = Decimal(units.strip()) if isinstance(units, six.string_types) else units
+        whole = int(value)
+    except (ValueError, TypeError, ArithmeticError):
+        whole = None
+    if whole is None or whole != value or whole < 0:
+        raise PATSException("Units to flight must be whole numbers, not %r" % (units,))
+    return whole
+
+def _check(n, end_dates, units, method, weights):
+    if len(end_dates) != n or len(units) != n:
+        raise PATSException("Start dates, end dates and units must be the same length")
+    if method not in METHODS:
+        raise PATSException("Flighting method must be one of %s" % ', '.join(METHODS))
+    if (method == 'weights') != (weights is not None):
+        raise PATSException("Weights are needed for (and only for) the 'weights' method")
+    if weights is not None and len(weights) != n:
+        raise PATSException("Weights must be given for each placement")
+
+def _split_python(start_dates, end_dates, units, method, weights):
+    """
+    (placement index, year, month, units) columns, one placement at a time.
+    """
+    rows, years, months, allocated = [], [], [], []
+    for n, (start, end, total) in enumerate(zip(start_dates, end_dates, units)):
+        start, end = _date(start), _date(end)
+        if end < start:
+            raise PATSException("Flight ends before it starts (%s to %s)" % (start, end))
+        year, month = start.year, start.month
+        first_index = len(months)
+        month_weights = []
+        while (year, month) <= (end.year, end.month):
+            next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+            if method == 'days':
+                first = max(start, datetime.date(year, month, 1))
+                last = min(end + datetime.timedelta(days=1), datetime.date(next_year, next_month, 1))
+                month_weights.append((last - first).days)
+            else:
+                month_weights.append(1)
+            rows.append(n)
+            years.append(year)
+            months.append(month)
+            year, month = next_year, next_month
+        if method == 'weights':
+            month_weights = list(weights[n])
+            if len(month_weights) != len(months) - first_index:
+                raise PATSException("Placement %d needs one weight per month of its flight" % n)
+        allocated.extend(round_cumulative(total, month_weights))
+    return rows, years, months, allocated
+
+def round_cumulative(total, month_weights):
+    """
+    Split total by the weights, rounding running totals so the parts add up.
+    """
+    weight_total = sum(month_weights)
+    if weight_total <= 0:
+        raise PATSException("Flighting weights must add up to more than zero")
+    parts, done, running = [], 0, 0
+    integral = all(isinstance(w, int) for w in month_weights)
+    for weight in month_weights:
+        running += weight
+        if integral:
+            upto = (2 * total * running + weight_total) // (2 * weight_total)
+        else:
+            upto = int(round(float(total) * (float(running) / float(weight_total))))
+        parts.append(upto - done)
+        done = upto
+    parts[-1] += total - done
+    return parts
+
+def _split_numpy(start_dates, end_dates, units, method, weights):
+    """
+    (placement index, year, month, units) columns, for the whole batch at once.
+    """
+    # via day ordinals: much quicker than numpy converting date objects itself
+    epoch = datetime.date(1970, 1, 1).toordinal()
+    starts = (numpy.fromiter((_date(d).toordinal() for d in start_dates), numpy.int64, len(start_dates))
+              - epoch).astype('datetime64[D]')
+    ends = (numpy.fromiter((_date(d).toordinal() for d in end_dates), numpy.int64, len(end_dates))
+            - epoch).astype('datetime64[D]')
+    if (ends < starts).any():
+        raise PATSException("Flight ends before it starts")
+    totals = numpy.fromiter(units, numpy.int64, len(units))
+    first_months = starts.astype('datetime64[M]')
+    counts = (ends.astype('datetime64[M]') - first_months).astype(numpy.int64) + 1
+    offsets = numpy.cumsum(counts) - counts # where each placement's months start
+    rows = numpy.repeat(numpy.arange(len(counts)), counts)
+    months = first_months[rows] + (numpy.arange(len(rows)) - offsets[rows])
+    if method == 'days':
+        month_starts = months.astype('datetime64[D]')
+        first = numpy.maximum(starts[rows], month_starts)
+        last = numpy.minimum(ends[rows] + 1, (months + 1).astype('datetime64[D]'))
+        month_weights = (last - first).astype(numpy.int64)
+    elif method == 'even':
+        month_weights = numpy.ones(len(rows), dtype=numpy.int64)
+    else:
+        month_weights = numpy.concatenate([numpy.asarray(w) for w in weights])
+        if month_weights.dtype.kind not in 'iuf':
+            month_weights = month_weights.astype(float) # eg Decimal weights
+        if len(month_weights) != len(rows) or \
+                (numpy.array([len(w) for w in weights]) != counts).any():
+            raise PATSException("Each placement needs one weight per month of its flight")
+    running = numpy.cumsum(month_weights)
+    running = running - numpy.repeat(running[offsets] - month_weights[offsets], counts)
+    weight_totals = running[offsets + counts - 1]
+    if (weight_totals <= 0).any():
+        raise PATSException("Flighting weights must add up to more than zero")
+    if month_weights.dtype.kind in 'iu':
+        # exact integer rounding (half up) of units * running / weight total
+        upto = (2 * totals[rows] * running + weight_totals[rows]) // (2 * weight_totals[rows])
+    else:
+        upto = numpy.rint(totals[rows] * (running / weight_totals[rows])).astype(numpy.int64)
+    upto[offsets + counts - 1] = totals
+    allocated = numpy.diff(upto, prepend=0)
+    allocated[offsets] = upto[offsets]
+    month_numbers = months.astype(numpy.int64)
+    return rows, month_numbers // 12 + 1970, month_numbers % 12 + 1, allocated
+
+def flighting_columns(start_dates, end_dates, units, method='days', weights=None, use_numpy=None):
+    """
+    The monthly split of a batch of placements as four equal-length columns:
+    placement index, year, month and units (numpy arrays when numpy is used,
+    otherwise lists).
+
+    start_dates / end_dates: flight dates (date objects or "YYYY-MM-DD"), end inclusive
+    units: total (whole) units of each placement
+    method: 'days' (pro rata by flight days in each month), 'even', or
+        'weights' (with weights: one sequence per placement, of one weight per
+        month of its flight)
+    use_numpy: force (True) or avoid (False) numpy - by default it's used if installed
+    """
+    n = len(start_dates)
+    _check(n, end_dates, units, method, weights)
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    elif use_numpy and numpy is None:
+        raise PATSException("numpy is not installed")
+    if n == 0:
+        return [], [], [], []
+    units = [_whole(u) for u in units]
+    if use_numpy:
+        return _split_numpy(start_dates, end_dates, units, method, weights)
+    return _split_python(start_dates, end_dates, units, method, weights)
+
+def flighting(start_dates, end_dates, units, method='days', weights=None, use_numpy=None):
+    """
+    A LineItemDigital.flighting list for each placement (see flighting_columns).
+    """
+    rows, years, months, allocated = flighting_columns(start_dates, end_dates, units, method, weights, use_numpy)
+    if use_numpy is not False and numpy is not None and len(rows):
+        rows, years, months, allocated = rows.tolist(), years.tolist(), months.tolist(), allocated.tolist()
+    result = [[] for n in range(len(start_dates))]
+    for row, year, month, month_units in zip(rows, years, months, allocated):
+        result[row].append({'month': month, 'year': year, 'units': month_units})
+    return result
+
+def set_flighting(line_items, method='days', weights=None, use_numpy=None):
+    """
+    Fill in the flighting of a batch of LineItemDigital objects (or line item
+    dicts) from their flightStartDate, flightEndDate and units.
+    """
+    get = lambda item, name: item.get(name) if isinstance(item, dict) else getattr(item, name)
+    splits = flighting([get(item, 'flightStartDate') for item in line_items],
+                       [get(item, 'flightEndDate') for item in line_items],
+                       [get(item, 'units') for item in line_items], method, weights, use_numpy)
+    for item, split in zip(line_items, splits):
+        if isinstance(item, dict):
+            item['flighting'] = split
+        else:
+            item.flighting = split
+    return line_items
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Historical order harvester
+
+Splits a long order history pull into shards (one per tenant), fetches the
+shards in a process pool and merges the results into one de-duplicated
+JSONL file. Each finished shard is kept on disk, so a harvest that crashes
+part way through picks up where it left off.
+
+PATS only lets us ask for orders updated *since* a date, and doesn't say
+in what order they come back, so each tenant is fetched in one pass from
+the start date: splitting a tenant's history into date windows would have
+every window page through all the orders of the windows after it.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import os
+import re
+from .core import PATSException, payload_value, ORDER_ID_FIELDS, VERSION_FIELDS, UPDATED_FIELDS
+from .lazy import json_default
+from .buyer import PATSBuyer
+from .seller import PATSSeller
+
+PAGE_SIZE = 25
+
+def make_client(tenant):
+    """
+    Build a client (with its own connection pool) from a picklable tenant spec:
+    either {'side': 'buyer' or 'seller', ...constructor arguments...} or
+    {'factory': callable, ...arguments for the callable...}
+    """
+    kwargs = dict(tenant)
+    factory = kwargs.pop('factory', None)
+    side = kwargs.pop('side', None)
+    if factory is None:
+        if side == 'buyer':
+            factory = PATSBuyer
+        elif side == 'seller':
+            factory = PATSSeller
+        else:
+            raise PATSException("Tenant side must be 'buyer' or 'seller'")
+    return factory(**kwargs)
+
+def _harvest_shard(shard):
+    """
+    Fetch one shard and write it to its file. Runs in a worker process.
+    """
+    client = make_client(shard['tenant'])
+    organization_id = client._organization_id()
+    start = datetime.datetime.strptime(shard['start'], "%Y-%m-%d").date()
+    partial_path = shard['path'] + '.partial'
+    count = 0
+    with open(partial_path, 'w') as f:
+        page = 1
+        while True:
+            orders = client.list_orders(since_date=start, page_size=PAGE_SIZE, page=page)
+            for order in orders:
+                # PATS only lets us ask for orders *since* a date, so drop the
+                # ones updated after the end of the harvest
+                updated = payload_value(order, UPDATED_FIELDS)
+                if shard['end'] and updated and updated[:10] >= shard['end']:
+                    continue
+                f.write(json.dumps({'tenant': organization_id, 'order': order}, default=json_default))
+                f.write('\n')
+                count += 1
+            if len(orders) < PAGE_SIZE:
+                break
+            page += 1
+    # the finished file is the checkpoint for this shard
+    os.rename(partial_path, shard['path'])
+    return count
+
+class OrderHarvester(object):
+    """
+    Harvest all orders for one or more tenants from start_date to end_date:
+
+        harvester = OrderHarvester(
+            [{'side': 'buyer', 'agency_id': ..., 'agency_group_id': ..., 'user_id': ..., 'api_key': ...}],
+            start_date=datetime.date(2016, 1, 1), workdir='harvest-2016')
+        harvester.run('orders.jsonl')
+
+    Each output line is {"tenant": agency or vendor ID, "order": order payload},
+    with one line per order ID and version.
+    """
+    def __init__(self, tenants, start_date=None, end_date=None, workdir='pats-harvest', processes=None):
+        """
+        tenants: list of tenant specs (see make_client), which must be picklable
+        start_date / end_date: range to harvest (by default there is no end date,
+            so everything updated until each shard is fetched is kept)
+        workdir: directory where finished shards are kept between runs
+        processes: size of the process pool (defaults to the number of CPUs);
+            0 fetches the shards one by one in this process
+        """
+        if start_date is None:
+            raise PATSException("Start date is required")
+        if not tenants:
+            raise PATSException("At least one tenant is required")
+        self.tenants = tenants
+        self.start_date = start_date
+        self.end_date = end_date
+        self.workdir = workdir
+        self.processes = processes
+
+    def shards(self):
+        """
+        One shard per tenant. Their file names only depend on the arguments
+        given, so a harvest resumed on a later day finds its finished shards.
+        """
+        shards = []
+        end = self.end_date.strftime("%Y%m%d") if self.end_date else 'open'
+        for n, tenant in enumerate(self.tenants):
+            name = '%03d-%s-%s-%s' % (n, re.sub(r'[^\w-]', '_', str(tenant.get('agency_id') or tenant.get('vendor_id') or 'tenant')),
+                                      self.start_date.strftime("%Y%m%d"), end)
+            shards.append({
+                'tenant': tenant,
+                'start': self.start_date.strftime("%Y-%m-%d"),
+                'end': self.end_date.strftime("%Y-%m-%d") if self.end_date else None,
+                'path': os.path.join(self.workdir, name + '.jsonl'),
+            })
+        return shards
+
+    def run(self, output_path):
+        """
+        Fetch any shards not already on disk, then merge them all into output_path.
+        Returns counts of shards fetched and skipped and of orders written.
+        """
+        if not os.path.isdir(self.workdir):
+            os.makedirs(self.workdir)
+        shards = self.shards()
+        pending = [shard for shard in shards if not os.path.exists(shard['path'])]
+        if self.processes == 0:
+            for shard in pending:
+                _harvest_shard(shard)
+        elif pending:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                # list() so that a failed shard raises here
+                list(executor.map(_harvest_shard, pending))
+        written = self.merge(shards, output_path)
+        return {
+            'shards_fetched': len(pending),
+            'shards_skipped': len(shards) - len(pending),
+            'orders_written': written,
+        }
+
+    def merge(self, shards, output_path):
+        """
+        Stream all shard files into output_path, keeping the first copy of each
+        (tenant, order ID, version).
+        """
+        seen = set()
+        written = 0
+        with open(output_path + '.partial', 'w') as out:
+            for shard in shards:
+                with open(shard['path']) as f:
+                    for line in f:
+                        record = json.loads(line)
+                        order = record['order']
+                        key = (record['tenant'], payload_value(order, ORDER_ID_FIELDS),
+                               payload_value(order, VERSION_FIELDS))
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        out.write(line)
+                        written += 1
+        os.rename(output_path + '.partial', output_path)
+        return written
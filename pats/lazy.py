@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Lazy JSON views
+
+Read-only, dict- and list-like views over the text of a JSON response. A
+view only finds a field when it is asked for: scanning stops at the
+requested key or index, nested objects and arrays are stepped over by a
+regex without building anything, and values are only decoded (objects and
+arrays as views in turn) when accessed. Reading a few fields from a wide
+order needs a fraction of the memory of json.loads(), and finding fields
+ahead of a long line item list a fraction of the time.
+"""
+
+import json
+import json.decoder
+import json.scanner
+import re
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence # 2.x
+
+MAX_SKIP_DEPTH = 12 # nesting handled by the scanning regexes - deeper values are decoded to skip them
+
+def _patterns(depth, possessive=True):
+    # One array item or object field, with the value's span as a group. A
+    # nested object or array is matched (up to "depth" deep) without being
+    # decoded. Every loop is "unrolled" (each repeat starts with a character
+    # the part before it can't match), so even without possessive quantifiers
+    # a failed match has little to backtrack into; they just save the work.
+    star = '*+' if possessive else '*'
+    string = r'"[^"\\]' + star + r'(?:\\.[^"\\]' + star + r')' + star + r'"'
+    content = r'[^\[\]{}"]' + star + r'(?:' + string + r'[^\[\]{}"]' + star + r')' + star
+    for n in range(depth):
+        content = r'[^\[\]{}"]' + star + r'(?:(?:' + string + r'|[\[{]' + content + r'[\]}])[^\[\]{}"]' + star + r')' + star
+    value = r'(?:[\[{]' + content + r'[\]}]|' + string + r'|[^,\]}\[{\s"][^,\]}\s]' + star + r')'
+    item = re.compile(r'[ \t\n\r]*(' + value + r')[ \t\n\r]*,?')
+    field = re.compile(r'[ \t\n\r]*(' + string + r')[ \t\n\r]*:[ \t\n\r]*(' + value + r')[ \t\n\r]*,?')
+    return item, field
+
+try:
+    ITEM, FIELD = _patterns(MAX_SKIP_DEPTH)
+except re.error: # no possessive quantifiers before Python 3.11
+    ITEM, FIELD = _patterns(MAX_SKIP_DEPTH, possessive=False)
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+scan_once = json.scanner.make_scanner(json.JSONDecoder())
+scanstring = json.decoder.scanstring
+
+def _decode(text, start, end):
+    """
+    The value at text[start:end]: a view for an object or array, otherwise
+    the decoded scalar.
+    """
+    char = text[start]
+    if char == '{':
+        return JSONObjectView(text, start, end)
+    if char == '[':
+        return JSONArrayView(text, start, end)
+    return scan_once(text, start)[0]
+
+def loads(text):
+    """
+    Lazy equivalent of json.loads: a view for an object or array, otherwise
+    the decoded value.
+    """
+    start = WHITESPACE.match(text, 0).end()
+    end = len(text.rstrip(' \t\n\r'))
+    if start >= end:
+        raise ValueError("No JSON object could be decoded")
+    if text[start] in '{[':
+        return _decode(text, start, end)
+    return json.loads(text)
+
+class JSONView(object):
+    """
+    Base class for views over the JSON text[start:end].
+    """
+    __slots__ = ('text', 'start', 'end', 'pos', 'complete')
+
+    def __init__(self, text, start, end):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.pos = start + 1 # where scanning carries on
+        self.complete = False
+
+    def _matches(self, pattern):
+        """
+        Consecutive item or field matches from the scan position onwards. Stops
+        at the end, or at a value nested too deeply for the pattern to match.
+        """
+        pos = self.pos
+        for match in pattern.finditer(self.text, pos, self.end - 1):
+            if match.start() != pos:
+                break
+            pos = match.end()
+            yield match
+
+    def _deep_value(self):
+        """
+        After _matches() stops: None at the end of the object or array,
+        otherwise the position of the deeply nested value it stopped at.
+        """
+        pos = WHITESPACE.match(self.text, self.pos).end()
+        if pos >= self.end - 1:
+            self.complete = True
+            return None
+        return pos
+
+    def _skip_deep(self, pos):
+        """
+        Decode the value at pos to find its end, and carry on after it.
+        """
+        end = scan_once(self.text, pos)[1]
+        self.pos = WHITESPACE.match(self.text, end).end()
+        if self.text[self.pos] == ',':
+            self.pos += 1
+        return end
+
+    def json(self):
+        """
+        The JSON text of this value.
+        """
+        return self.text[self.start:self.end]
+
+    def to_python(self):
+        """
+        Fully decoded copy as ordinary dicts and lists.
+        """
+        return json.loads(self.json())
+
+    def __repr__(self):
+        text = self.json()
+        return '%s(%s)' % (self.__class__.__name__, text if len(text) <= 60 else text[:57] + '...')
+
+    def __deepcopy__(self, memo):
+        # a view finds its fields as they're read, so each copy scans the
+        # (immutable) text for itself rather than sharing that state
+        return type(self)(self.text, self.start, self.end)
+
+    def __copy__(self):
+        return type(self)(self.text, self.start, self.end)
+
+class JSONObjectView(JSONView, Mapping):
+    """
+    Read-only dict-like view of a JSON object. Fields are only found when
+    asked for, and nested objects and arrays are returned as views.
+    """
+    __slots__ = ('spans', 'values')
+
+    def __init__(self, text, start, end):
+        JSONView.__init__(self, text, start, end)
+        self.spans = {}  # key: (start, end) of the value
+        self.values = {} # key: value or view, once asked for
+
+    def _scan(self, wanted=None):
+        """
+        Find fields until the wanted key (or the end of the object).
+        """
+        spans = self.spans
+        while not self.complete:
+            for match in self._matches(FIELD):
+                self.pos = match.end()
+                key = match.group(1)
+                key = scanstring(key, 1)[0] if '\\' in key else key[1:-1]
+                spans[key] = match.span(2)
+                if key == wanted:
+                    return True
+            pos = self._deep_value()
+            if pos is not None:
+                key, pos = scanstring(self.text, pos + 1)
+                pos = WHITESPACE.match(self.text, WHITESPACE.match(self.text, pos).end() + 1).end()
+                spans[key] = (pos, self._skip_deep(pos))
+                if key == wanted:
+                    return True
+        return False
+
+    def __getitem__(self, key):
+        try:
+            return self.values[key]
+        except KeyError:
+            pass
+        span = self.spans.get(key)
+        if span is None:
+            if not self._scan(key):
+                raise KeyError(key)
+            span = self.spans[key]
+        value = self.values[key] = _decode(self.text, span[0], span[1])
+        return value
+
+    def __contains__(self, key):
+        return key in self.spans or self._scan(key)
+
+    def __iter__(self):
+        self._scan()
+        return iter(self.spans)
+
+    def __len__(self):
+        self._scan()
+        return len(self.spans)
+
+class JSONArrayView(JSONView, Sequence):
+    """
+    Read-only list-like view of a JSON array. Items are only found as far as
+    needed, and only decoded (objects and arrays as views) when asked for.
+    """
+    __slots__ = ('spans', 'values')
+
+    def __init__(self, text, start, end):
+        JSONView.__init__(self, text, start, end)
+        self.spans = []  # (start, end) of each item
+        self.values = {} # index: value or view, once asked for
+
+    def _scan(self, wanted=None):
+        """
+        Find items until there are more than "wanted" (or the end of the array).
+        """
+        spans = self.spans
+        while not self.complete and (wanted is None or len(spans) <= wanted):
+            for match in self._matches(ITEM):
+                self.pos = match.end()
+                spans.append(match.span(1))
+                if wanted is not None and len(spans) > wanted:
+                    return
+            pos = self._deep_value()
+            if pos is not None:
+                spans.append((pos, self._skip_deep(pos)))
+
+    def _item(self, index):
+        try:
+            return self.values[index]
+        except KeyError:
+            span = self.spans[index]
+            value = self.values[index] = _decode(self.text, span[0], span[1])
+            return value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            self._scan()
+            return [self._item(n) for n in range(len(self.spans))[index]]
+        if index < 0:
+            self._scan()
+            index += len(self.spans)
+        elif index >= len(self.spans):
+            self._scan(index)
+        if not 0 <= index < len(self.spans):
+            raise IndexError("list index out of range")
+        return self._item(index)
+
+    def __iter__(self):
+        n = 0
+        while True:
+            if n >= len(self.spans):
+                self._scan(n)
+                if n >= len(self.spans):
+                    return
+            yield self._item(n)
+            n += 1
+
+    def __len__(self):
+        self._scan()
+        return len(self.spans)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, JSONArrayView)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+def json_default(value):
+    """
+    For json.dumps(..., default=json_default), so payloads holding views can
+    be serialised.
+    """
+    if isinstance(value, JSONView):
+        return value.to_python()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+def dumps(value):
+    """
+    json.dumps that also takes views (whose JSON text is used as it is).
+    """
+    if isinstance(value, JSONView):
+        return value.json()
+    return json.dumps(value, default=json_default)
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Local SQLite mirror of orders, RFPs and proposals
+
+The mirror is fed by list_all_orders(), search_rfps() / list_all_rfps() and
+list_all_proposals() / list_proposals() on a client created with mirror=...,
+and answers the query helpers on PATSAPIClient (mirror_orders() etc).
+"""
+
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from .core import PATSException, payload_value, ORDER_ID_FIELDS, VERSION_FIELDS, \
+    CAMPAIGN_ID_FIELDS, ADVERTISER_FIELDS, VENDOR_ID_FIELDS, STATUS_FIELDS, \
+    UPDATED_FIELDS, RFP_ID_FIELDS, PROPOSAL_ID_FIELDS, RESPONSE_DUE_FIELDS
+from .lazy import dumps
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    organization_id TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    campaign_id TEXT,
+    advertiser TEXT,
+    vendor_id TEXT,
+    status TEXT,
+    version INTEGER,
+    updated TEXT,
+    PRIMARY KEY (organization_id, order_id)
+);
+CREATE INDEX IF NOT EXISTS orders_advertiser ON orders (organization_id, advertiser);
+CREATE INDEX IF NOT EXISTS orders_campaign ON orders (organization_id, campaign_id);
+CREATE INDEX IF NOT EXISTS orders_updated ON orders (organization_id, updated);
+
+CREATE TABLE IF NOT EXISTS order_versions (
+    organization_id TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    status TEXT,
+    updated TEXT,
+    payload TEXT,
+    PRIMARY KEY (organization_id, order_id, version)
+);
+
+CREATE TABLE IF NOT EXISTS line_items (
+    organization_id TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    line_item_id TEXT,
+    media TEXT,
+    external_id TEXT,
+    name TEXT,
+    buy_type TEXT,
+    buy_category TEXT,
+    section TEXT,
+    cost_method TEXT,
+    units REAL,
+    rate REAL,
+    cost REAL,
+    start_date TEXT,
+    end_date TEXT,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS line_items_order ON line_items (organization_id, order_id, version);
+
+CREATE TABLE IF NOT EXISTS rfps (
+    organization_id TEXT NOT NULL,
+    rfp_id TEXT NOT NULL,
+    campaign_id TEXT,
+    advertiser TEXT,
+    status TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    response_due_date TEXT,
+    payload TEXT,
+    PRIMARY KEY (organization_id, rfp_id)
+);
+CREATE INDEX IF NOT EXISTS rfps_due ON rfps (organization_id, response_due_date);
+
+CREATE TABLE IF NOT EXISTS proposals (
+    organization_id TEXT NOT NULL,
+    proposal_id TEXT NOT NULL,
+    rfp_id TEXT,
+    vendor_id TEXT,
+    status TEXT,
+    updated TEXT,
+    payload TEXT,
+    PRIMARY KEY (organization_id, proposal_id)
+);
+CREATE INDEX IF NOT EXISTS proposals_rfp ON proposals (organization_id, rfp_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    organization_id TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    since TEXT,
+    refreshed_at REAL NOT NULL,
+    PRIMARY KEY (organization_id, dataset)
+);
+"""
+
+def _date_string(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+class PATSMirror(object):
+    """
+    Local copy of orders (with their versions and line items), RFPs and
+    proposals held in SQLite, indexed for the common reporting queries.
+
+    Rows are kept per organization (agency or vendor ID) so one mirror can be
+    shared by several clients. The mirror can be used from several threads.
+    """
+    def __init__(self, path=':memory:'):
+        """
+        path: SQLite database file, or ':memory:' (the default) for a mirror that
+        only lasts as long as this process.
+        """
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _mark_refreshed(self, organization_id, dataset, since_date=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state (organization_id, dataset, since, refreshed_at) VALUES (?, ?, ?, ?)",
+            (organization_id, dataset, _date_string(since_date), time.time())
+        )
+
+    def age(self, organization_id, dataset):
+        """
+        Seconds since the dataset was last completely refreshed, or None if never.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT refreshed_at FROM sync_state WHERE organization_id = ? AND dataset = ?",
+                (organization_id, dataset)
+            ).fetchone()
+        if row is None:
+            return None
+        return time.time() - row['refreshed_at']
+
+    def is_fresh(self, organization_id, dataset, max_age, since_date=None):
+        """
+        True if the dataset was refreshed less than max_age seconds ago and (for
+        orders) the refresh went back at least as far as since_date.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT since, refreshed_at FROM sync_state WHERE organization_id = ? AND dataset = ?",
+                (organization_id, dataset)
+            ).fetchone()
+        if row is None or time.time() - row['refreshed_at'] > max_age:
+            return False
+        if since_date is not None and row['since'] and _date_string(since_date) < row['since']:
+            return False
+        return True
+
+    def store_orders(self, organization_id, orders, since_date=None):
+        """
+        Write a list of order payloads (as returned by list_orders) to the mirror.
+        If since_date is given the set is treated as complete from that date.
+        """
+        with self.lock:
+            with self.conn:
+                for order in orders:
+                    self._store_order(organization_id, order)
+                if since_date is not None:
+                    self._mark_refreshed(organization_id, 'orders', since_date)
+
+    def _store_order(self, organization_id, order):
+        order_id = payload_value(order, ORDER_ID_FIELDS)
+        if order_id is None:
+            raise PATSException("Can't mirror an order without an ID: %s" % order)
+        version = int(payload_value(order, VERSION_FIELDS, 0))
+        status = payload_value(order, STATUS_FIELDS)
+        updated = payload_value(order, UPDATED_FIELDS)
+        current = self.conn.execute(
+            "SELECT version FROM orders WHERE organization_id = ? AND order_id = ?",
+            (organization_id, order_id)
+        ).fetchone()
+        if current is None or current['version'] <= version:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO orders (organization_id, order_id, campaign_id, advertiser, vendor_id, status, version, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (organization_id, order_id, payload_value(order, CAMPAIGN_ID_FIELDS),
+                 payload_value(order, ADVERTISER_FIELDS), payload_value(order, VENDOR_ID_FIELDS),
+                 status, version, updated)
+            )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO order_versions (organization_id, order_id, version, status, updated, payload) VALUES (?, ?, ?, ?, ?, ?)",
+            (organization_id, order_id, version, status, updated, dumps(order))
+        )
+        self.conn.execute(
+            "DELETE FROM line_items WHERE organization_id = ? AND order_id = ? AND version = ?",
+            (organization_id, order_id, version)
+        )
+        rows = []
+        for media, key in (('digital', 'digitalLineItems'), ('print', 'printLineItems')):
+            for line_item in order.get(key) or []:
+                rows.append((
+                    organization_id, order_id, version, line_item.get('id'), media,
+                    line_item.get('externalId'), line_item.get('name'),
+                    line_item.get('buyType'), line_item.get('buyCategory'),
+                    line_item.get('section'), line_item.get('costMethod'),
+                    line_item.get('units'), line_item.get('rate'), line_item.get('cost'),
+                    line_item.get('flightStartDate') or line_item.get('coverDate'),
+                    line_item.get('flightEndDate') or line_item.get('coverDate'),
+                    dumps(line_item)
+                ))
+        self.conn.executemany(
+            "INSERT INTO line_items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def store_rfps(self, organization_id, rfps, complete=False):
+        """
+        Write a list of RFP payloads to the mirror. "complete" means this is every
+        RFP for the organization, so the RFP dataset counts as refreshed.
+        """
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO rfps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(organization_id, payload_value(rfp, RFP_ID_FIELDS),
+                      payload_value(rfp, CAMPAIGN_ID_FIELDS), payload_value(rfp, ADVERTISER_FIELDS),
+                      payload_value(rfp, STATUS_FIELDS), rfp.get('startDate'), rfp.get('endDate'),
+                      payload_value(rfp, RESPONSE_DUE_FIELDS), dumps(rfp)) for rfp in rfps]
+                )
+                if complete:
+                    self._mark_refreshed(organization_id, 'rfps')
+
+    def store_proposals(self, organization_id, proposals, rfp_id=None, complete=False):
+        """
+        Write a list of proposal payloads to the mirror. "complete" means this is
+        every proposal for rfp_id, so that RFP's proposals count as refreshed.
+        """
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO proposals VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(organization_id, payload_value(proposal, PROPOSAL_ID_FIELDS),
+                      proposal.get('rfpId') or rfp_id, payload_value(proposal, VENDOR_ID_FIELDS),
+                      payload_value(proposal, STATUS_FIELDS), payload_value(proposal, UPDATED_FIELDS),
+                      dumps(proposal)) for proposal in proposals]
+                )
+                if complete and rfp_id:
+                    self._mark_refreshed(organization_id, 'proposals:%s' % rfp_id)
+
+    def find_orders(self, organization_id, advertiser=None, campaign_id=None, since_date=None):
+        """
+        Latest version of each mirrored order, optionally filtered by advertiser,
+        campaign or last updated date.
+        """
+        query = "SELECT v.payload FROM orders o JOIN order_versions v USING (organization_id, order_id, version) WHERE o.organization_id = ?"
+        params = [organization_id]
+        if advertiser is not None:
+            query += " AND o.advertiser = ?"
+            params.append(advertiser)
+        if campaign_id is not None:
+            query += " AND o.campaign_id = ?"
+            params.append(campaign_id)
+        if since_date is not None:
+            query += " AND (o.updated IS NULL OR o.updated >= ?)"
+            params.append(_date_string(since_date))
+        query += " ORDER BY o.updated, o.order_id"
+        return self._payloads(query, params)
+
+    def find_line_items(self, organization_id, order_id=None, version=None):
+        """
+        Line items of an order version (the latest mirrored version by default).
+        """
+        if order_id is None:
+            raise PATSException("Order ID is required")
+        if version is None:
+            query = "SELECT l.payload FROM line_items l JOIN orders o USING (organization_id, order_id, version) WHERE l.organization_id = ? AND l.order_id = ?"
+            params = [organization_id, order_id]
+        else:
+            query = "SELECT payload FROM line_items WHERE organization_id = ? AND order_id = ? AND version = ?"
+            params = [organization_id, order_id, int(version)]
+        return self._payloads(query, params)
+
+    def find_rfps_due(self, organization_id, start_date=None, end_date=None):
+        """
+        RFPs whose response due date falls between start_date and end_date (inclusive).
+        """
+        query = "SELECT payload FROM rfps WHERE organization_id = ?"
+        params = [organization_id]
+        if start_date is not None:
+            query += " AND response_due_date >= ?"
+            params.append(_date_string(start_date))
+        if end_date is not None:
+            # due dates may carry a time, so only compare the date part
+            query += " AND substr(response_due_date, 1, 10) <= ?"
+            params.append(_date_string(end_date))
+        query += " ORDER BY response_due_date"
+        return self._payloads(query, params)
+
+    def find_proposals(self, organization_id, rfp_id):
+        """
+        Proposals mirrored for the given RFP.
+        """
+        return self._payloads(
+            "SELECT payload FROM proposals WHERE organization_id = ? AND rfp_id = ? ORDER BY proposal_id",
+            [organization_id, rfp_id]
+        )
+
+    def _payloads(self, query, params):
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Typed read-side models
+
+Compact, read-only models of the order versions, RFPs and proposals that
+come back from the API, with dates and amounts parsed once:
+
+    orders = load_orders(buyer.list_all_orders(since_date))
+    orders[0].line_item('LI-123').rate   # Decimal('12.50')
+
+Unlike the LineItem classes in core (used to build payloads to send), these
+are built from payloads we receive. The load_*() functions share parsed
+dates, amounts and repeated strings between all the models they build, so a
+list of models takes far less memory than the dicts it was made from.
+"""
+
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+from .core import PATSException, payload_value, ORDER_ID_FIELDS, VERSION_FIELDS, \
+    CAMPAIGN_ID_FIELDS, ADVERTISER_FIELDS, VENDOR_ID_FIELDS, STATUS_FIELDS, \
+    UPDATED_FIELDS, RFP_ID_FIELDS, PROPOSAL_ID_FIELDS, RESPONSE_DUE_FIELDS
+
+# what can follow the seconds of a timestamp: fraction, then Z or an offset from UTC
+TIME_SUFFIX = re.compile(r'(?:\.(\d+))?(?:Z|([+-])(\d\d):?(\d\d)?)?$')
+
+LINE_ITEM_KEYS = (('digital', 'digitalLineItems'), ('print', 'printLineItems'), (None, 'lineItems'))
+
+class Parser(object):
+    """
+    Parses dates, amounts and strings out of payloads, remembering what it has
+    parsed so that models built by the same Parser share equal values.
+    """
+    def __init__(self):
+        self.dates = {}
+        self.numbers = {}
+        self.strings = {}
+
+    def text(self, value):
+        if value is None:
+            return None
+        return self.strings.setdefault(value, value)
+
+    def date(self, value):
+        """
+        datetime.date for "YYYY-MM-DD", naive datetime.datetime in UTC for
+        "YYYY-MM-DDTHH:MM[:SS[.fff]][Z|+HH:MM|-HHMM]", None for None.
+        """
+        if value is None:
+            return None
+        parsed = self.dates.get(value)
+        if parsed is None:
+            try:
+                if len(value) == 10:
+                    parsed = datetime.date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+                else:
+                    seconds, rest = (value[17:19], value[19:]) if value[16:17] == ':' else ('0', value[16:])
+                    fraction, zone, hours, minutes = TIME_SUFFIX.match(rest).groups()
+                    parsed = datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                                               int(value[11:13]), int(value[14:16]), int(seconds),
+                                               int(((fraction or '') + '000000')[:6]))
+                    if hours is not None:
+                        offset = datetime.timedelta(hours=int(hours), minutes=int(minutes or 0))
+                        parsed = parsed - offset if zone == '+' else parsed + offset
+            except (ValueError, TypeError, AttributeError):
+                raise PATSException("Can't parse date %r" % (value,))
+            self.dates[value] = parsed
+        return parsed
+
+    def decimal(self, value):
+        """
+        Decimal for an amount sent as a string or number, None for None or "".
+        """
+        if value is None or value == '':
+            return None
+        key = (value.__class__, value)
+        parsed = self.numbers.get(key)
+        if parsed is None:
+            try:
+                parsed = Decimal(value if isinstance(value, (int, str)) else str(value))
+            except (InvalidOperation, TypeError, ValueError):
+                raise PATSException("Can't parse amount %r" % (value,))
+            self.numbers[key] = parsed
+        return parsed
+
+    def count(self, value):
+        """
+        int for whole numbers (eg units, impressions), otherwise as decimal().
+        """
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        number = self.decimal(value)
+        if number is not None and number == number.to_integral_value():
+            return int(number)
+        return number
+
+class LineItemModel(object):
+    """
+    One line item of an order version or proposal.
+    """
+    __slots__ = ('id', 'external_id', 'reference_id', 'parent_external_id', 'name', 'media',
+                 'buy_type', 'buy_category', 'section', 'cost_method', 'units', 'rate', 'cost',
+                 'start_date', 'end_date')
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+
+    @classmethod
+    def from_payload(cls, payload, media=None, parser=None):
+        p = parser or Parser()
+        item = cls.__new__(cls)
+        item.id = p.text(payload.get('id'))
+        item.external_id = p.text(payload.get('externalId') or payload.get('lineItemExternalId'))
+        item.reference_id = p.text(payload.get('referenceId'))
+        item.parent_external_id = p.text(payload.get('parentExternalId'))
+        item.name = payload.get('name')
+        item.media = media or p.text((payload.get('mediaType') or '').lower() or None)
+        item.buy_type = p.text(payload.get('buyType'))
+        item.buy_category = p.text(payload.get('buyCategory'))
+        item.section = p.text(payload.get('section'))
+        item.cost_method = p.text(payload.get('costMethod'))
+        item.units = p.count(payload.get('units'))
+        item.rate = p.decimal(payload.get('rate'))
+        item.cost = p.decimal(payload.get('cost'))
+        item.start_date = p.date(payload.get('flightStartDate') or payload.get('coverDate'))
+        item.end_date = p.date(payload.get('flightEndDate') or payload.get('coverDate'))
+        return item
+
+    def __repr__(self):
+        return 'LineItemModel(%s, %s)' % (self.id or self.external_id, self.name)
+
+class _WithLineItems(object):
+    """
+    Shared by order versions and proposals: line items in payload order,
+    looked up by ID (or external ID) through an index built when first needed.
+    """
+    __slots__ = ()
+
+    def _read_line_items(self, payload, parser):
+        items = []
+        for media, key in LINE_ITEM_KEYS:
+            for line_item in payload.get(key) or ():
+                items.append(LineItemModel.from_payload(line_item, media, parser))
+        self.line_items = tuple(items)
+        self._index = None
+
+    def line_item(self, line_item_id):
+        """
+        The line item with this ID or external ID (KeyError if there's none).
+        """
+        if self._index is None:
+            index = {}
+            for item in self.line_items:
+                if item.external_id is not None:
+                    index.setdefault(item.external_id, item)
+                if item.id is not None:
+                    index[item.id] = item
+            self._index = index
+        return self._index[line_item_id]
+
+    def total_cost(self):
+        return sum((item.cost for item in self.line_items if item.cost is not None), Decimal(0))
+
+class OrderModel(_WithLineItems):
+    """
+    One version of an order.
+    """
+    __slots__ = ('order_id', 'version', 'campaign_id', 'advertiser', 'vendor_id', 'status',
+                 'updated', 'line_items', '_index')
+
+    @classmethod
+    def from_payload(cls, payload, parser=None):
+        p = parser or Parser()
+        order = cls.__new__(cls)
+        order.order_id = payload_value(payload, ORDER_ID_FIELDS)
+        order.version = int(payload_value(payload, VERSION_FIELDS, 0))
+        order.campaign_id = p.text(payload_value(payload, CAMPAIGN_ID_FIELDS))
+        order.advertiser = p.text(payload_value(payload, ADVERTISER_FIELDS))
+        order.vendor_id = p.text(payload_value(payload, VENDOR_ID_FIELDS))
+        order.status = p.text(payload_value(payload, STATUS_FIELDS))
+        order.updated = p.date(payload_value(payload, UPDATED_FIELDS))
+        order._read_line_items(payload, p)
+        return order
+
+    def __repr__(self):
+        return 'OrderModel(%s v%s, %s)' % (self.order_id, self.version, self.status)
+
+class RFPModel(object):
+    """
+    One RFP.
+    """
+    __slots__ = ('rfp_id', 'campaign_id', 'advertiser', 'name', 'status', 'start_date', 'end_date',
+                 'response_due_date', 'budget')
+
+    @classmethod
+    def from_payload(cls, payload, parser=None):
+        p = parser or Parser()
+        rfp = cls.__new__(cls)
+        rfp.rfp_id = payload_value(payload, RFP_ID_FIELDS)
+        rfp.campaign_id = p.text(payload_value(payload, CAMPAIGN_ID_FIELDS))
+        rfp.advertiser = p.text(payload_value(payload, ADVERTISER_FIELDS))
+        rfp.name = payload.get('name') or payload.get('campaignName')
+        rfp.status = p.text(payload_value(payload, STATUS_FIELDS))
+        rfp.start_date = p.date(payload.get('startDate'))
+        rfp.end_date = p.date(payload.get('endDate'))
+        rfp.response_due_date = p.date(payload_value(payload, RESPONSE_DUE_FIELDS))
+        rfp.budget = p.decimal(payload.get('budgetAmount') or payload.get('budget'))
+        return rfp
+
+    def __repr__(self):
+        return 'RFPModel(%s, %s)' % (self.rfp_id, self.status)
+
+class ProposalModel(_WithLineItems):
+    """
+    One proposal sent in response to an RFP.
+    """
+    __slots__ = ('proposal_id', 'rfp_id', 'vendor_id', 'status', 'updated', 'line_items', '_index')
+
+    @classmethod
+    def from_payload(cls, payload, parser=None):
+        p = parser or Parser()
+        proposal = cls.__new__(cls)
+        proposal.proposal_id = payload_value(payload, PROPOSAL_ID_FIELDS)
+        proposal.rfp_id = p.text(payload.get('rfpId'))
+        proposal.vendor_id = p.text(payload_value(payload, VENDOR_ID_FIELDS))
+        proposal.status = p.text(payload_value(payload, STATUS_FIELDS))
+        proposal.updated = p.date(payload_value(payload, UPDATED_FIELDS))
+        proposal._read_line_items(payload, p)
+        return proposal
+
+    def __repr__(self):
+        return 'ProposalModel(%s, %s)' % (self.proposal_id, self.status)
+
+def load_orders(payloads, parser=None):
+    """
+    Models for a list of order payloads (eg from list_all_orders()).
+    """
+    parser = parser or Parser()
+    return [OrderModel.from_payload(payload, parser) for payload in payloads]
+
+def load_rfps(payloads, parser=None):
+    """
+    Models for a list of RFP payloads.
+    """
+    parser = parser or Parser()
+    return [RFPModel.from_payload(payload, parser) for payload in payloads]
+
+def load_proposals(payloads, parser=None):
+    """
+    Models for a list of proposal payloads.
+    """
+    parser = parser or Parser()
+    return [ProposalModel.from_payload(payload, parser) for payload in payloads]
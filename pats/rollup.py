@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Spend roll-up
+
+Keeps the line item amounts of the latest version of each order in compact
+columns, and totals them by any of campaign, advertiser, vendor, media type,
+buy type, section and month:
+
+    rollup = SpendRollup()
+    rollup.add_orders(buyer.list_all_orders(since_date=since_date))
+    rollup.totals('campaign', 'month')   # {(campaign ID, 'YYYY-MM'): Decimal}
+
+Adding a newer version of an order replaces the amounts of the older one,
+so the roll-up can be kept up to date from the orders changed since the
+last run (or from event notifications) instead of being rebuilt.
+"""
+
+from array import array
+from decimal import Decimal
+from .core import PATSException, payload_value, ORDER_ID_FIELDS, VERSION_FIELDS, CAMPAIGN_ID_FIELDS, \
+    ADVERTISER_FIELDS, VENDOR_ID_FIELDS, int64_typecode
+from .costs import scaled_int
+from .flighting import round_cumulative
+
+DIMENSIONS = ('campaign', 'advertiser', 'vendor', 'media', 'buy_type', 'section', 'month')
+MEDIA_KEYS = (('digitalLineItems', 'Online'), ('printLineItems', 'Print'))
+COST_PLACES = 2
+COMPACT_MIN = 10000 # dead rows kept before compacting at all
+# no 8-byte array type (eg 2.7 on Windows): amounts are kept in a plain list instead
+AMOUNT_TYPECODE = int64_typecode()
+
+def _amount_array(amounts):
+    return array(AMOUNT_TYPECODE, amounts) if AMOUNT_TYPECODE else list(amounts)
+
+class SpendRollup(object):
+    """
+    Line item amounts, one row per line item and month, with each dimension
+    stored as integer codes into a table of its values and amounts as whole
+    hundredths. Rows of replaced order versions are marked dead and dropped
+    when they outnumber the live ones.
+    """
+    def __init__(self):
+        self.values = dict((name, []) for name in DIMENSIONS)  # code: value
+        self.codes = dict((name, {}) for name in DIMENSIONS)   # value: code
+        self.columns = dict((name, array('i')) for name in DIMENSIONS)
+        self.amounts = _amount_array([])
+        self.live = bytearray()
+        self.dead = 0
+        self.orders = {} # order ID: (version, first row, number of rows) - an order's rows are together
+        self.aggregates = {} # dimensions: {codes: [amount, rows]}, kept up to date once asked for
+
+    def _code(self, name, value):
+        codes = self.codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.values[name])
+            self.values[name].append(value)
+        return code
+
+    def _line_item_rows(self, line_item, order_codes, media):
+        """
+        (codes, amount) for each month of one line item. The cost is split
+        over the months of its flighting in proportion to their units, if it
+        has any, otherwise it all goes to its flight start or cover date.
+        """
+        get = line_item.get
+        cost = scaled_int(get('cost') or 0, COST_PLACES, 'cost', line_item)
+        codes = order_codes + (self._code('media', media), self._code('buy_type', get('buyType')),
+                               self._code('section', get('section')))
+        flighting = get('flighting')
+        if flighting:
+            try:
+                months = ['%04d-%02d' % (int(f.get('year')), int(f.get('month'))) for f in flighting]
+                weights = [int(f.get('units') or 0) for f in flighting]
+            except (TypeError, ValueError):
+                weights = () # not monthly flighting: fall back to the flight start
+            if sum(weights) > 0:
+                return [(codes + (self._code('month', month),), amount)
+                        for month, amount in zip(months, round_cumulative(cost, weights))]
+        date = get('flightStartDate') or get('coverDate')
+        return [(codes + (self._code('month', date[:7] if date else None),), cost)]
+
+    def add(self, order):
+        """
+        Add one order version (a payload dict or lazy view). Returns False, and
+        changes nothing, if a later or the same version is already there.
+        """
+        order_id = payload_value(order, ORDER_ID_FIELDS)
+        version = int(payload_value(order, VERSION_FIELDS, 0))
+        known = self.orders.get(order_id)
+        if known is not None and known[0] >= version:
+            return False
+        order_codes = (self._code('campaign', payload_value(order, CAMPAIGN_ID_FIELDS)),
+                       self._code('advertiser', payload_value(order, ADVERTISER_FIELDS)),
+                       self._code('vendor', payload_value(order, VENDOR_ID_FIELDS)))
+        rows = []
+        for key, media in MEDIA_KEYS:
+            for line_item in order.get(key) or ():
+                rows.extend(self._line_item_rows(line_item, order_codes, order.get('mediaType') or media))
+        if known is not None:
+            self._remove(known[1], known[2])
+        tracked = [(totals, [DIMENSIONS.index(name) for name in dimensions])
+                   for dimensions, totals in self.aggregates.items()]
+        appends = [self.columns[name].append for name in DIMENSIONS]
+        first = len(self.amounts)
+        for codes, amount in rows:
+            for append, code in zip(appends, codes):
+                append(code)
+            self.amounts.append(amount)
+            self.live.append(1)
+            for totals, positions in tracked:
+                key = tuple(codes[n] for n in positions)
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = [amount, 1]
+                else:
+                    total[0] += amount
+                    total[1] += 1
+        self.orders[order_id] = (version, first, len(rows))
+        if self.dead > max(COMPACT_MIN, len(self.amounts) - self.dead):
+            self.compact()
+        return True
+
+    def add_orders(self, orders):
+        """
+        add() each of a list or stream of orders; returns how many were added.
+        """
+        return sum(1 for order in orders if self.add(order))
+
+    def _remove(self, first, count):
+        for n in range(first, first + count):
+            self.live[n] = 0
+            amount = self.amounts[n]
+            for dimensions, totals in self.aggregates.items():
+                key = tuple(self.columns[name][n] for name in dimensions)
+                total = totals[key]
+                total[0] -= amount
+                total[1] -= 1
+                if not total[1]:
+                    del totals[key]
+        self.dead += count
+
+    def compact(self):
+        """
+        Drop the rows of replaced order versions.
+        """
+        keep = [n for n in range(len(self.amounts)) if self.live[n]]
+        renumber = dict((n, m) for m, n in enumerate(keep))
+        for name in DIMENSIONS:
+            column = self.columns[name]
+            self.columns[name] = array('i', [column[n] for n in keep])
+        self.amounts = _amount_array([self.amounts[n] for n in keep])
+        self.live = bytearray(b'\x01' * len(keep))
+        self.dead = 0
+        for order_id, (version, first, count) in self.orders.items():
+            self.orders[order_id] = (version, renumber[first] if count else 0, count)
+
+    def _aggregate(self, dimensions):
+        """
+        {codes: [amount, rows]} over the live rows, grouped by hashing the
+        codes of the given dimensions.
+        """
+        totals = {}
+        get = totals.get
+        for row in zip(self.amounts, self.live, *[self.columns[name] for name in dimensions]):
+            if row[1]:
+                key = row[2:]
+                total = get(key)
+                if total is None:
+                    totals[key] = [row[0], 1]
+                else:
+                    total[0] += row[0]
+                    total[1] += 1
+        return totals
+
+    def totals(self, *dimensions):
+        """
+        Total amounts grouped by the given dimensions (any of DIMENSIONS), as
+        {(value, ...): Decimal}. With no dimensions, the grand total. The
+        grouping is kept up to date by add() from then on, so asking again is
+        quick.
+        """
+        for name in dimensions:
+            if name not in DIMENSIONS:
+                raise PATSException("Unknown dimension %r (must be one of %s)" % (name, ', '.join(DIMENSIONS)))
+        if not dimensions:
+            return Decimal(sum(amount for amount, alive in zip(self.amounts, self.live) if alive)).scaleb(-COST_PLACES)
+        totals = self.aggregates.get(dimensions)
+        if totals is None:
+            totals = self.aggregates[dimensions] = self._aggregate(dimensions)
+        values = [self.values[name] for name in dimensions]
+        return dict((tuple(v[code] for v, code in zip(values, key)), Decimal(total[0]).scaleb(-COST_PLACES))
+                    for key, total in totals.items())
+
+    def __len__(self):
+        return len(self.amounts) - self.dead
@@ -33,15 +33,17 @@ import json
 import os
 import re
 import string
-from .core import PATSAPIClient, PATSException, JSONSerializable, Product
+from .core import PATSAPIClient, PATSException, JSONSerializable, Product, deadline
+from .attachments import Base64File, json_body
 
 PUBLISHER_API_DOMAIN = 'demo-publishers.api.mediaocean.com'
 
 class PATSSeller(PATSAPIClient):
+    api_domain = PUBLISHER_API_DOMAIN
     vendor_id = None
     user_id = None
 
-    def __init__(self, vendor_id=None, api_key=None, user_id=None, debug_mode=False, raw_mode=False, session=None):
+    def __init__(self, vendor_id=None, api_key=None, user_id=None, debug_mode=False, raw_mode=False, session=None, **kwargs):
         """
         Create a new seller-side PATS API object.
 
@@ -53,8 +55,9 @@ class PATSSeller(PATSAPIClient):
         - raw_mode (boolean) : Store output of request (as 'curl' equivalent) and
                                response (JSON payload) when making requests
         - session (optional) : User session in which to write curl and response objects in raw mode
+        - other keyword arguments (eg mirror) are passed through to PATSAPIClient
         """
-        super(PATSSeller, self).__init__(api_key, debug_mode, raw_mode, session)
+        super(PATSSeller, self).__init__(api_key, debug_mode, raw_mode, session, **kwargs)
         if vendor_id == None:
             raise PATSException("Vendor (aka publisher) ID is required")
         self.vendor_id = vendor_id
@@ -63,6 +66,15 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("User ID (email address) is required")
         self.user_id = user_id
 
+    def _organization_id(self):
+        return self.vendor_id
+
+    def _refresh_mirror_rfps(self):
+        self.list_all_rfps()
+
+    def _refresh_mirror_proposals(self, rfp_id):
+        self.list_proposals(rfp_id=rfp_id)
+
     def save_product_data(self, data=None): 
         """
         Save a new or updated product to a vendor's product catalogue.
@@ -77,8 +89,8 @@ class PATSSeller(PATSAPIClient):
             "POST",
             PUBLISHER_API_DOMAIN,
             "/vendors/%s/products/" % self.vendor_id,
-            { 'Accept': 'application/vnd.mediaocean.catalog-v1+json' },
-            json.dumps(data)
+            self._identity_headers('application/vnd.mediaocean.catalog-v1+json'),
+            json_body(data)
         )
         if js['validationResults']:
             raise PATSException("Product ID "+js['validationResults'][0]['productId']+": error is "+js['validationResults'][0]['message'])
@@ -206,7 +218,12 @@ class PATSSeller(PATSAPIClient):
                 }
             ]
         }
-        if image_encoded:
+        if isinstance(image_encoded, Base64File):
+            # streamed from the file as the request is sent
+            data['products'][0]['standardAttributes'].update({
+                "productLogo":Base64File(image_encoded.source, prefix="data:image/jpeg;base64,"),
+            })
+        elif image_encoded:
             data['products'][0]['standardAttributes'].update({
                 "productLogo":"data:image/jpeg;base64,"+image_encoded,
             })
@@ -290,16 +307,15 @@ class PATSSeller(PATSAPIClient):
             organisation_id = self.vendor_id
         if user_id == None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.catalog-v1+json',
-            'X-MO-User-ID': user_id,
-            'X-MO-Organization-ID': self.vendor_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.catalog-v1+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=user_id
+        )
         # a publisher can query another publisher's properties if they are allowed
         path = '/vendors/%s/mediaproperties/fields' % organisation_id
-        js = self._send_request(
-            "GET",
+        js = self._send_reference_request(
             PUBLISHER_API_DOMAIN,
             path,
             extra_headers
@@ -320,12 +336,12 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("field_family is required")
         if user_id == None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.catalog-v1+json',
-            'X-MO-User-ID': user_id,
-            'X-MO-Organization-ID': self.vendor_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.catalog-v1+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=user_id
+        )
         # can a publisher update another publisher's properties if they want...? TODO check permissions
         path = '/vendors/%s/mediaproperties/%s/%s' % (organisation_id, media_property_id, field_family)
         js = self._send_request(
@@ -349,16 +365,15 @@ class PATSSeller(PATSAPIClient):
             organisation_id = self.vendor_id
         if user_id == None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.catalog-v1+json',
-            'X-MO-User-ID': user_id,
-            'X-MO-Organization-ID': self.vendor_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.catalog-v1+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=user_id
+        )
         # a publisher can query another publisher's properties if they want...
         path = '/vendors/%s/products' % organisation_id
-        js = self._send_request(
-            "GET",
+        js = self._send_reference_request(
             PUBLISHER_API_DOMAIN,
             path,
             extra_headers
@@ -379,12 +394,12 @@ class PATSSeller(PATSAPIClient):
             user_id = self.user_id
         if type(product) != Product:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.catalog-v1+json',
-            'X-MO-User-ID': user_id,
-            'X-MO-Organization-ID': self.vendor_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.catalog-v1+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=user_id
+        )
         # the product data to be updated
         data = ''
         if product:
@@ -435,12 +450,12 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("Product ID is required")
         if type(product) != Product:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.catalog-v1+json',
-            'X-MO-User-ID': user_id,
-            'X-MO-Organization-ID': self.vendor_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.catalog-v1+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=user_id
+        )
         # the product data to be updated
         data = product.dict_repr()
 
@@ -464,11 +479,11 @@ class PATSSeller(PATSAPIClient):
         """
         if user_id == None:
             user_id = self.user_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.security-v1+json',
-            'X-MO-Organization-Id': self.vendor_id,
-            'X-MO-User-ID': user_id
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.security-v1+json',
+            organization_id=self.vendor_id,
+            user_id=user_id
+        )
         path = '/agencies?'
         if agency_id:
             path += "agencyId=%s" % agency_id
@@ -476,8 +491,7 @@ class PATSSeller(PATSAPIClient):
             path += "&name=%s" % name
         if last_updated_date:
             path += "&updatedAfter=%s" % last_updated_date
-        js = self._send_request(
-            "GET",
+        js = self._send_reference_request(
             PUBLISHER_API_DOMAIN,
             path,
             extra_headers
@@ -494,12 +508,12 @@ class PATSSeller(PATSAPIClient):
         if since_date == None:
             raise PATSException("Since date is required")
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Organization-Id': self.vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=self.user_id
+        )
 
         path = '/orders?since=%s&size=%s&page=%s' % (since_date.strftime("%Y-%m-%d"), page_size, page)
         js = self._send_request(
@@ -511,20 +525,24 @@ class PATSSeller(PATSAPIClient):
         # TODO: Parse the response and return something more intelligible
         return js
 
-    def list_all_orders(self, since_date=None):
+    def list_all_orders(self, since_date=None, timeout=None):
         """
         Loop over the list_orders method until we definitely have all orders in an array
+        timeout: seconds the whole loop may take (see pats.deadline)
         """
         page_size = 25
         page = 1
         full_json_list = []
         remaining_content = True 
-        while (remaining_content):
-            partial_json_list = self.list_orders(since_date=since_date, page_size=page_size, page=page)
-            full_json_list.extend(partial_json_list)
-            page = page + 1
-            remaining_content = (len(partial_json_list) == page_size)
-
+        with deadline(timeout):
+            while (remaining_content):
+                partial_json_list = self.list_orders(since_date=since_date, page_size=page_size, page=page)
+                full_json_list.extend(partial_json_list)
+                page = page + 1
+                remaining_content = (len(partial_json_list) == page_size)
+
+        if self.mirror:
+            self.mirror.store_orders(self.vendor_id, full_json_list, since_date=since_date)
         return full_json_list
 
     def list_order_versions(self, campaign_id=None, order_id=None, user_id=None, vendor_id=None):
@@ -542,12 +560,12 @@ class PATSSeller(PATSAPIClient):
             user_id = self.user_id
         if vendor_id == None:
             vendor_id = self.vendor_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Organization-Id': vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='pats',
+            organization_id=vendor_id,
+            user_id=self.user_id
+        )
         js = self._send_request(
             "GET",
             PUBLISHER_API_DOMAIN,
@@ -568,12 +586,12 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("Order ID is required")
         if version == None:
             raise PATSException("Version is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Organization-Id': self.vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=self.user_id
+        )
         js = self._send_request(
             "GET",
             PUBLISHER_API_DOMAIN,
@@ -599,12 +617,12 @@ class PATSSeller(PATSAPIClient):
             user_id = self.user_id
         if vendor_id == None:
             vendor_id = self.vendor_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Organization-Id': vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='pats',
+            organization_id=vendor_id,
+            user_id=self.user_id
+        )
         js = self._send_request(
             "GET",
             PUBLISHER_API_DOMAIN,
@@ -626,12 +644,12 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("Version is required")
         if revision == None:
             raise PATSException("Revision is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Organization-Id': self.vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=self.user_id
+        )
         js = self._send_request(
             "GET",
             PUBLISHER_API_DOMAIN,
@@ -651,12 +669,12 @@ class PATSSeller(PATSAPIClient):
         """
         if order_id == None:
             raise PATSException("order ID is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Organization-Id': self.vendor_id,
-            'X-MO-User-ID': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=self.user_id
+        )
         path = '/orders/%s/events' % order_id
         js = self._send_request(
             "GET",
@@ -681,16 +699,16 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("Order ID is required")
         if attachment_id == None:
             raise PATSException("Attachment ID is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-Organization-Id': vendor_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'pats'
-        }
-        js = self._send_request(
-            "GET",
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='pats',
+            organization_id=vendor_id,
+            user_id=user_id
+        )
+        js = self._send_attachment_request(
             PUBLISHER_API_DOMAIN,
-            "/orders/%s/attachments/%s" % (order_id, attachment_id),
+            "/orders/%s" % order_id,
+            attachment_id,
             extra_headers
         )
         return js
@@ -756,15 +774,10 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("Order ID is required")
         if version == None:
             raise PATSException("version is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v2+json'
-        }
         if user_id:
-            extra_headers.update({
-                'X-MO-User-Id': user_id,
-                'X-MO-Organization-Id': vendor_id,
-                'X-MO-App': 'pats'
-            })
+            extra_headers = self._identity_headers('application/vnd.mediaocean.order-v2+json', app='pats', organization_id=vendor_id, user_id=user_id)
+        else:
+            extra_headers = self._identity_headers('application/vnd.mediaocean.order-v2+json')
 
         path = '/orders/%s/versions/%s/revisions?operation=send' % (order_id, version)
 
@@ -800,12 +813,12 @@ class PATSSeller(PATSAPIClient):
         if comment == None or comment == "":
             raise PATSException("comment is required for accepting or rejecting an order")
 
-        extra_headers = {
-            'X-MO-User-Id': user_id,
-            'X-MO-Organization-Id': self.vendor_id,
-            'Accept': 'application/vnd.mediaocean.order-v2+json',
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v2+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=user_id
+        )
         data = {
             "comment": comment
         }
@@ -848,12 +861,12 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("Order ID is required")
         if vendor_id == None:
             vendor_id = self.vendor_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.order-v1+json',
-            'X-MO-Organization-Id': vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.order-v1+json',
+            app='pats',
+            organization_id=vendor_id,
+            user_id=self.user_id
+        )
         path = '/orders/%s?operation=compareToPrevious' % order_id
         if start_date:
             path += "startDate=%s" % start_date.strftime("%Y-%m-%d")
@@ -867,12 +880,12 @@ class PATSSeller(PATSAPIClient):
 
         https://developer.mediaocean.com/docs/read/seller_proposals/Find_RFPs
         """
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v2+json',
-            'X-MO-Organization-Id': self.vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v2+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=self.user_id
+        )
         path = '/rfps?' 
         if start_date:
             path += "startDate=%s" % start_date.strftime("%Y-%m-%d")
@@ -890,20 +903,24 @@ class PATSSeller(PATSAPIClient):
         )
         return js
 
-    def list_all_rfps(self, start_date=None, end_date=None):
+    def list_all_rfps(self, start_date=None, end_date=None, timeout=None):
         """
         Loop over the list_rfps method until we definitely have all RFPs in an array
+        timeout: seconds the whole loop may take (see pats.deadline)
         """
         page_size = 25
         page = 1
         full_json_list = []
         remaining_content = True
-        while (remaining_content):
-            partial_json_list = self.list_rfps(start_date=start_date, end_date=end_date, page_size=page_size, page=page)
-            full_json_list.extend(partial_json_list)
-            page = page + 1
-            remaining_content = (len(partial_json_list) == page_size)
-
+        with deadline(timeout):
+            while (remaining_content):
+                partial_json_list = self.list_rfps(start_date=start_date, end_date=end_date, page_size=page_size, page=page)
+                full_json_list.extend(partial_json_list)
+                page = page + 1
+                remaining_content = (len(partial_json_list) == page_size)
+
+        if self.mirror:
+            self.mirror.store_rfps(self.vendor_id, full_json_list, complete=not (start_date or end_date))
         return full_json_list
 
     def find_proposals(self, blah):
@@ -921,12 +938,12 @@ class PATSSeller(PATSAPIClient):
         if rfp_id == None:
             raise PATSException("RFP ID is required")
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v2+json',
-            'X-MO-Organization-Id': self.vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v2+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=self.user_id
+        )
 
         js = self._send_request(
             "GET",
@@ -934,6 +951,8 @@ class PATSSeller(PATSAPIClient):
             "/rfps/%s/proposals" % rfp_id,
             extra_headers
         )
+        if self.mirror:
+            self.mirror.store_proposals(self.vendor_id, js, rfp_id=rfp_id, complete=True)
         return js
 
     def view_proposal(self, rfp_id=None, proposal_id=None):
@@ -948,12 +967,12 @@ class PATSSeller(PATSAPIClient):
         if proposal_id == None:
             raise PATSException("Proposal ID is required")
 
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v2+json',
-            'X-MO-Organization-Id': self.vendor_id,
-            'X-MO-User-Id': self.user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v2+json',
+            app='pats',
+            organization_id=self.vendor_id,
+            user_id=self.user_id
+        )
 
         js = self._send_request(
             "GET",
@@ -1001,12 +1020,12 @@ class PATSSeller(PATSAPIClient):
             user_id = self.user_id
         if organization_id is None:
             organization_id = self.vendor_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v2+json',
-            'X-MO-Organization-ID': organization_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v2+json',
+            app='pats',
+            organization_id=organization_id,
+            user_id=user_id
+        )
         js = self._send_request(
             "GET",
             PUBLISHER_API_DOMAIN,
@@ -1030,17 +1049,17 @@ class PATSSeller(PATSAPIClient):
             user_id = self.user_id
         if organization_id is None:
             organization_id = self.vendor_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.rfp-v2+json',
-            'X-MO-Organization-ID': organization_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.rfp-v2+json',
+            app='pats',
+            organization_id=organization_id,
+            user_id=user_id
+        )
 
-        js = self._send_request(
-            "GET",
+        js = self._send_attachment_request(
             PUBLISHER_API_DOMAIN,
-            "/rfps/%s/attachments/%s" % (rfp_id, attachment_id),
+            "/rfps/%s" % rfp_id,
+            attachment_id,
             extra_headers
         )
         return js
@@ -1060,7 +1079,9 @@ class PATSSeller(PATSAPIClient):
         digital_line_items: Digital line items to be sent as part of proposal
         print_line_items: Print line items to be sent as part of proposal
         (Note that unlike orders, proposals can have both print and digital line items)
-        attachments (optional): Data for any files to be attached to the proposal
+        attachments (optional): Data for any files to be attached to the proposal, as
+            dicts of "fileName", "mimeType" and "contents" or as Attachment objects
+            (pats.attachments), which are read and encoded as the request is sent
 
         https://developer.mediaocean.com/docs/read/seller_proposals/Send_proposal
         https://developer.mediaocean.com/docs/read/seller_proposals/Send_seller_initiated_proposal
@@ -1113,12 +1134,12 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("Vendor (aka publisher) ID is required")
         #if rfp_id == None and proposal_id == None:
         #    raise PATSException("Either RFP ID (for a new proposal) or Proposal ID (for a proposal revision) is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v2+json',
-            'X-MO-Organization-Id': vendor_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v2+json',
+            app='pats',
+            organization_id=vendor_id,
+            user_id=user_id
+        )
 
         path = ''
         if proposal_id:
@@ -1134,7 +1155,7 @@ class PATSSeller(PATSAPIClient):
             PUBLISHER_API_DOMAIN,
             path,
             extra_headers,
-            json.dumps(data)
+            json_body(data)
         )
 
         match = re.search('https?://(.+)?/proposals/(.+?)$', proposal_uri)
@@ -1158,12 +1179,12 @@ class PATSSeller(PATSAPIClient):
             user_id = self.user_id
         if organization_id is None:
             organization_id = self.vendor_id
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v2+json',
-            'X-MO-Organization-ID': organization_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'pats'
-        }
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v2+json',
+            app='pats',
+            organization_id=organization_id,
+            user_id=user_id
+        )
         js = self._send_request(
             "GET",
             PUBLISHER_API_DOMAIN,
@@ -1187,16 +1208,16 @@ class PATSSeller(PATSAPIClient):
             raise PATSException("Proposal ID is required")
         if attachment_id is None:
             raise PATSException("Attachment ID is required")
-        extra_headers = {
-            'Accept': 'application/vnd.mediaocean.proposal-v2+json',
-            'X-MO-Organization-ID': vendor_id,
-            'X-MO-User-Id': user_id,
-            'X-MO-App': 'pats'
-        }
-        js = self._send_request(
-            "GET",
+        extra_headers = self._identity_headers(
+            'application/vnd.mediaocean.proposal-v2+json',
+            app='pats',
+            organization_id=vendor_id,
+            user_id=user_id
+        )
+        js = self._send_attachment_request(
             PUBLISHER_API_DOMAIN,
-            "/proposals/%s/attachments/%s" % (proposal_id, attachment_id),
+            "/proposals/%s" % proposal_id,
+            attachment_id,
             extra_headers
         )
         return js
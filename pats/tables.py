@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Columnar export
+
+Flattens order versions and their digital and print line items into two
+typed tables and writes them as Parquet files or Arrow IPC streams, a row
+group at a time, so any number of orders can be exported in bounded memory:
+
+    with TableExporter('orders.parquet', 'line_items.parquet') as exporter:
+        exporter.add_orders(buyer.list_all_orders(since_date=since_date))
+
+Repeated strings (vendor IDs, statuses, buy types and so on) are dictionary
+encoded, dates are dates, and amounts are decimals. Needs pyarrow
+("pip install pats[arrow]").
+"""
+
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from .core import PATSException, payload_value, ORDER_ID_FIELDS, VERSION_FIELDS, CAMPAIGN_ID_FIELDS, \
+    ADVERTISER_FIELDS, VENDOR_ID_FIELDS, STATUS_FIELDS, UPDATED_FIELDS
+from .models import Parser
+try:
+    import pyarrow # optional, for TableExporter
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_ROW_GROUP_SIZE = 50000
+AMOUNT_PLACES = Decimal('0.0001')
+
+# (column, type) - "dict" is a dictionary-encoded string
+ORDER_COLUMNS = (
+    ('tenant', 'dict'), ('order_id', 'string'), ('version', 'int32'), ('external_id', 'string'),
+    ('campaign_id', 'dict'), ('advertiser', 'dict'), ('vendor_id', 'dict'), ('status', 'dict'),
+    ('media_type', 'dict'), ('currency_code', 'dict'), ('updated', 'timestamp'),
+    ('digital_line_items', 'int32'), ('print_line_items', 'int32'),
+)
+LINE_ITEM_COLUMNS = (
+    ('tenant', 'dict'), ('order_id', 'string'), ('version', 'int32'), ('media', 'dict'),
+    ('id', 'string'), ('external_id', 'string'), ('reference_id', 'string'),
+    ('parent_external_id', 'string'), ('name', 'string'), ('package_type', 'dict'),
+    ('buy_type', 'dict'), ('buy_category', 'dict'), ('section', 'dict'), ('subsection', 'dict'),
+    ('cost_method', 'dict'), ('unit_type', 'dict'), ('units', 'decimal'), ('rate', 'decimal'),
+    ('cost', 'decimal'), ('flight_start_date', 'date'), ('flight_end_date', 'date'),
+    ('cover_date', 'date'), ('sale_date', 'date'),
+)
+MEDIA_KEYS = (('digitalLineItems', 'digital'), ('printLineItems', 'print'))
+
+def _amount(parser, value):
+    if value is None:
+        return None
+    key = (value.__class__, value, AMOUNT_PLACES)
+    amount = parser.numbers.get(key)
+    if amount is None:
+        number = parser.decimal(value)
+        amount = parser.numbers[key] = None if number is None else number.quantize(AMOUNT_PLACES, rounding=ROUND_HALF_UP)
+    return amount
+
+def _timestamp(value):
+    if value is not None and not isinstance(value, datetime.datetime):
+        return datetime.datetime(value.year, value.month, value.day)
+    return value
+
+def order_rows(order, tenant=None, parser=None):
+    """
+    One order version (dict or lazy view) as an ORDER_COLUMNS row and a list
+    of LINE_ITEM_COLUMNS rows, as tuples.
+    """
+    p = parser or Parser()
+    order_id = payload_value(order, ORDER_ID_FIELDS)
+    version = int(payload_value(order, VERSION_FIELDS, 0))
+    line_items = []
+    counts = {}
+    for key, media in MEDIA_KEYS:
+        items = order.get(key) or ()
+        for item in items:
+            get = item.get
+            line_items.append((
+                tenant, order_id, version, media,
+                get('id'), get('externalId'), get('referenceId'), get('parentExternalId'), get('name'),
+                get('packageType'), get('buyType'), get('buyCategory'), get('section'), get('subsection'),
+                get('costMethod'), get('unitType'),
+                _amount(p, get('units')), _amount(p, get('rate')), _amount(p, get('cost')),
+                p.date(get('flightStartDate') or None), p.date(get('flightEndDate') or None),
+                p.date(get('coverDate') or None), p.date(get('saleDate') or None),
+            ))
+        counts[media] = len(items)
+    order_row = (
+        tenant, order_id, version, order.get('externalId'),
+        payload_value(order, CAMPAIGN_ID_FIELDS), payload_value(order, ADVERTISER_FIELDS),
+        payload_value(order, VENDOR_ID_FIELDS), payload_value(order, STATUS_FIELDS),
+        order.get('mediaType'), order.get('currencyCode'),
+        _timestamp(p.date(payload_value(order, UPDATED_FIELDS))),
+        counts['digital'], counts['print'],
+    )
+    return order_row, line_items
+
+def _schema(columns):
+    types = {
+        'dict': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+        'string': pyarrow.string(),
+        'int32': pyarrow.int32(),
+        'decimal': pyarrow.decimal128(20, 4),
+        'date': pyarrow.date32(),
+        'timestamp': pyarrow.timestamp('us'),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+class _TableWriter(object):
+    """
+    Buffers rows and writes them out as one record batch (row group) at a time.
+    """
+    def __init__(self, path, columns, file_format, row_group_size):
+        self.schema = _schema(columns)
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.written = 0
+        if file_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, use_dictionary=True,
+                                                        compression='zstd')
+        else:
+            # the streaming format, as an IPC file can't change dictionaries between batches
+            self.writer = pyarrow.ipc.new_stream(path, self.schema)
+
+    def add(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = [pyarrow.array(column, type=field.type) if not pyarrow.types.is_dictionary(field.type)
+                   else pyarrow.array(column, type=pyarrow.string()).dictionary_encode()
+                   for column, field in zip(zip(*self.rows), self.schema)]
+        batch = pyarrow.record_batch(columns, schema=self.schema)
+        if isinstance(self.writer, pyarrow.parquet.ParquetWriter):
+            self.writer.write_table(pyarrow.Table.from_batches([batch]), row_group_size=len(self.rows))
+        else:
+            self.writer.write_batch(batch)
+        self.written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+class TableExporter(object):
+    """
+    Writes order versions to an orders table and their line items to a line
+    items table, each a Parquet (file_format='parquet') or Arrow IPC stream
+    (file_format='arrow', read with pyarrow.ipc.open_stream) file, a row
+    group of row_group_size rows at a time.
+    """
+    def __init__(self, orders_path, line_items_path, file_format='parquet', row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        if pyarrow is None:
+            raise ImportError("Columnar export needs pyarrow: pip install pats[arrow]")
+        if file_format not in ('parquet', 'arrow'):
+            raise PATSException("File format must be 'parquet' or 'arrow'")
+        self.orders = _TableWriter(orders_path, ORDER_COLUMNS, file_format, row_group_size)
+        self.line_items = _TableWriter(line_items_path, LINE_ITEM_COLUMNS, file_format, row_group_size)
+        self.parser = Parser()
+
+    def add(self, order, tenant=None):
+        """
+        Add one order version (a dict or lazy view), optionally with the agency
+        or vendor ID it was fetched for.
+        """
+        order_row, line_item_rows = order_rows(order, tenant, self.parser)
+        self.orders.add([order_row])
+        self.line_items.add(line_item_rows)
+        if len(self.parser.numbers) > self.line_items.row_group_size:
+            self.parser = Parser() # only a cache: keep it from growing without limit
+
+    def add_orders(self, orders, tenant=None):
+        """
+        add() each of a list or stream of orders; returns how many there were.
+        """
+        count = 0
+        for order in orders:
+            self.add(order, tenant)
+            count += 1
+        return count
+
+    def close(self):
+        """
+        Write any rows still buffered and finish both files.
+        """
+        self.orders.close()
+        self.line_items.close()
+        return {'orders_written': self.orders.written, 'line_items_written': self.line_items.written}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
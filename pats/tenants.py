@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Multi-tenant client manager
+
+For integrations acting on behalf of many agencies and/or vendors: one
+manager hands out a client per tenant, and all of them share one connection
+pool, rate limiter and reference data cache.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from .core import PATSException, current_deadline, deadline
+from .buyer import PATSBuyer
+from .seller import PATSSeller
+from .transport import ConnectionPool, ReferenceCache
+
+DEFAULT_FAN_OUT_WORKERS = 8 # tenants worked on at the same time by fan_out()
+
+class PATSTenantManager(object):
+    """
+    Hands out PATSBuyer and PATSSeller clients for individual tenants, all
+    sharing the manager's transport, and runs calls across many tenants at once.
+
+        manager = PATSTenantManager(buyer_api_key=KEY, rate_limiter=RateLimiter(20))
+        for agency_id, agency_group_id in agencies:
+            manager.buyer(agency_id, agency_group_id, user_id)
+        orders = manager.list_orders(since_date)   # {agency_id: [orders]}
+    """
+    def __init__(self, buyer_api_key=None, seller_api_key=None, pool=None, rate_limiter=None,
+                 reference_cache=None, max_workers=DEFAULT_FAN_OUT_WORKERS, **client_kwargs):
+        """
+        buyer_api_key / seller_api_key: API keys for buyer and seller tenants
+        pool: ConnectionPool shared by every tenant (a new one by default)
+        rate_limiter: RateLimiter shared by every tenant (none by default)
+        reference_cache: ReferenceCache shared by every tenant (a new one by default)
+        max_workers: default number of tenants fan_out() works on at once
+        other keyword arguments (eg coalesce_requests, mirror, circuit_breakers) are passed to each client
+        """
+        self.buyer_api_key = buyer_api_key
+        self.seller_api_key = seller_api_key
+        self.pool = pool or ConnectionPool()
+        self.rate_limiter = rate_limiter
+        self.reference_cache = reference_cache or ReferenceCache()
+        self.max_workers = max_workers
+        self.client_kwargs = client_kwargs
+        self.lock = threading.Lock()
+        self.clients = OrderedDict()
+
+    def _client(self, key, factory):
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = factory()
+            return client
+
+    def _shared(self):
+        kwargs = dict(self.client_kwargs)
+        kwargs.update({
+            'pool': self.pool,
+            'rate_limiter': self.rate_limiter,
+            'reference_cache': self.reference_cache,
+        })
+        return kwargs
+
+    def buyer(self, agency_id=None, agency_group_id=None, user_id=None):
+        """
+        Client for one agency, created the first time it is asked for.
+        """
+        if self.buyer_api_key is None:
+            raise PATSException("A buyer API key is required for buyer tenants")
+        return self._client(
+            ('buyer', agency_id, agency_group_id, user_id),
+            lambda: PATSBuyer(agency_id=agency_id, agency_group_id=agency_group_id, user_id=user_id,
+                              api_key=self.buyer_api_key, **self._shared())
+        )
+
+    def seller(self, vendor_id=None, user_id=None):
+        """
+        Client for one vendor, created the first time it is asked for.
+        """
+        if self.seller_api_key is None:
+            raise PATSException("A seller API key is required for seller tenants")
+        return self._client(
+            ('seller', vendor_id, user_id),
+            lambda: PATSSeller(vendor_id=vendor_id, user_id=user_id,
+                               api_key=self.seller_api_key, **self._shared())
+        )
+
+    def tenants(self):
+        """
+        All clients handed out so far, in the order they were created.
+        """
+        with self.lock:
+            return list(self.clients.values())
+
+    def fan_out(self, fn, clients=None, max_workers=None, return_exceptions=False):
+        """
+        Call fn(client) for each client (all tenants by default), at most
+        max_workers at a time, and return the results in the same order.
+
+        If any call raises, the first exception is re-raised once all calls have
+        finished - or with return_exceptions=True, exceptions are returned in
+        place of the results. A pats.deadline() around fan_out() applies to
+        the calls made in every thread.
+        """
+        if clients is None:
+            clients = self.tenants()
+        if not clients:
+            return []
+        # calls made by the workers share the caller's deadline, if any
+        caller_deadline = current_deadline()
+        def call(client):
+            with deadline(caller_deadline):
+                return fn(client)
+        with ThreadPoolExecutor(max_workers=min(max_workers or self.max_workers, len(clients))) as executor:
+            futures = [executor.submit(call, client) for client in clients]
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is not None and not return_exceptions:
+                raise error
+            results.append(error if error is not None else future.result())
+        return results
+
+    def _by_tenant(self, fn, clients, max_workers, return_exceptions):
+        if clients is None:
+            clients = self.tenants()
+        # results are keyed by agency or vendor ID, so two clients for the same
+        # one (eg with different user IDs) would overwrite each other
+        tenant_ids = [client._organization_id() for client in clients]
+        for n, tenant_id in enumerate(tenant_ids):
+            if tenant_id in tenant_ids[:n]:
+                raise PATSException("More than one client for %s: pass clients= with one per agency or vendor" % tenant_id)
+        results = self.fan_out(fn, clients, max_workers, return_exceptions)
+        return OrderedDict(zip(tenant_ids, results))
+
+    def list_orders(self, since_date=None, clients=None, max_workers=None, return_exceptions=False):
+        """
+        list_all_orders(since_date) for every tenant, as {agency or vendor ID: [orders]}.
+        """
+        return self._by_tenant(lambda client: client.list_all_orders(since_date=since_date),
+                               clients, max_workers, return_exceptions)
+
+    def list_rfps(self, start_date=None, end_date=None, clients=None, max_workers=None, return_exceptions=False):
+        """
+        list_all_rfps(start_date, end_date) for every tenant, as {agency or vendor ID: [RFPs]}.
+        """
+        return self._by_tenant(lambda client: client.list_all_rfps(start_date=start_date, end_date=end_date),
+                               clients, max_workers, return_exceptions)
+
+    def close(self):
+        """
+        Close the shared connection pool.
+        """
+        self.pool.close()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test local attachment cache
+
+"""
+
+import base64
+import os
+from .buyer import PATSBuyer
+from .attachment_cache import AttachmentCache
+
+class StubBuyer(PATSBuyer):
+    calls = 0
+
+    def _send_request(self, method, domain, path, extra_headers, body=None):
+        StubBuyer.calls += 1
+        return {'fileName': path.split('/')[1] + '.pdf', 'contents': 'JVBERi0x' * 100, 'path': path}
+
+def test_blobs_are_shared_and_evicted(tmpdir):
+    cache = AttachmentCache(str(tmpdir), max_bytes=250)
+    first = cache.put('/orders/O-1', 'A-1', b'x' * 100)
+    assert cache.put('/orders/O-2', 'A-7', b'x' * 100) == first
+    cache.put('/rfps/R-1', 'A-2', b'y' * 100)
+    assert cache.metrics()['attachment_cache_blobs'] == 2
+    assert cache.metrics()['attachment_cache_bytes'] == 200
+    blob = cache.open('/orders/O-2', 'A-7')
+    assert blob[:3] == b'xxx' and len(blob) == 100
+    blob.close()
+    # over max_bytes: the least recently used blob goes, with every attachment using it
+    cache.put('/rfps/R-2', 'A-3', b'z' * 100)
+    assert cache.get('/rfps/R-1', 'A-2') is None
+    assert cache.get('/orders/O-1', 'A-1') == b'x' * 100
+    assert sum(len(files) for _, _, files in os.walk(str(tmpdir))) == 3 # index.db and two blobs
+    cache.close()
+    # the cache lasts between runs
+    cache = AttachmentCache(str(tmpdir), max_bytes=250)
+    assert cache.get('/rfps/R-2', 'A-3') == b'z' * 100
+    assert cache.metrics()['attachment_cache_bytes'] == 200
+
+def test_empty_files_are_cached(tmpdir):
+    cache = AttachmentCache(str(tmpdir))
+    cache.put('/orders/O-1', 'A-1', b'', {'fileName': 'empty.txt'})
+    assert cache.lookup('/orders/O-1', 'A-1') == ({'fileName': 'empty.txt'}, b'')
+    blob = cache.open('/orders/O-1', 'A-1')
+    assert len(blob) == 0 and blob[:] == b''
+    blob.close()
+    metrics = cache.metrics()
+    assert (metrics['attachment_cache_hits'], metrics['attachment_cache_blobs']) == (2, 1)
+
+def test_client_serves_repeats_from_cache(tmpdir):
+    cache = AttachmentCache(str(tmpdir))
+    buyer = StubBuyer(agency_id='35-AGENCY-1', agency_group_id='35-GROUP', api_key='key', attachment_cache=cache)
+    other = StubBuyer(agency_id='35-AGENCY-2', agency_group_id='35-GROUP', api_key='key', attachment_cache=cache)
+    StubBuyer.calls = 0
+    js = buyer.get_order_attachment(campaign_id='C-1', order_id='O-1', attachment_id='A-1')
+    assert buyer.get_order_attachment(campaign_id='C-1', order_id='O-1', attachment_id='A-1') == js
+    assert js['path'] == '/campaigns/C-1/orders/O-1/attachments/A-1'
+    assert StubBuyer.calls == 1
+    # another tenant asks PATS itself, and the same file under another name is
+    # another attachment, but the file itself is only stored once
+    assert other.get_order_attachment(campaign_id='C-1', order_id='O-1', attachment_id='A-1') == js
+    rfp = buyer.get_rfp_attachment(rfp_id='R-1', attachment_id='A-9')
+    assert rfp['fileName'] == 'rfps.pdf' and rfp['contents'] == js['contents']
+    assert buyer.get_rfp_attachment(rfp_id='R-1', attachment_id='A-9') == rfp
+    assert StubBuyer.calls == 3
+    metrics = buyer.metrics()
+    assert metrics['attachment_cache_hits'] == 2
+    assert metrics['attachment_cache_attachments'] == 3 and metrics['attachment_cache_blobs'] == 1
+    # what's on disk is the decoded file
+    resource, = cache.conn.execute("SELECT resource FROM attachments WHERE attachment_id = 'A-9'").fetchone()
+    blob = cache.open(resource, 'A-9')
+    assert blob[:] == base64.b64decode(js['contents']) and blob[:8] == b'%PDF-1%P'
+    blob.close()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test streamed attachment uploads
+
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import tracemalloc
+from .buyer import PATSBuyer
+from .attachments import Attachment, Base64File, json_body
+from .test_transport import EchoHandler, PlainConnectionPool, start_server
+
+class HashingHandler(EchoHandler):
+    # reads the body a piece at a time and answers with its length and hash
+    def do_POST(self):
+        remaining = int(self.headers['Content-Length'])
+        digest = hashlib.sha1()
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 65536))
+            digest.update(chunk)
+            remaining -= len(chunk)
+        body = json.dumps({'length': self.headers['Content-Length'], 'sha1': digest.hexdigest()}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_json_body_streams_base64(tmpdir):
+    assert json_body({'attachments': [], 'name': u'caf\xe9'}) == json.dumps({'attachments': [], 'name': u'caf\xe9'})
+    contents = os.urandom(200001)
+    path = str(tmpdir.join('media-kit.pdf'))
+    with open(path, 'wb') as f:
+        f.write(contents)
+    with open(path, 'rb') as f:
+        f.seek(1)
+        body = json_body({'attachments': [Attachment(path), Attachment(f, file_name='rates.bin')],
+                          'logo': Base64File(io.BytesIO(b'logo'), prefix='data:image/jpeg;base64,')})
+        value = body.getvalue()
+        assert len(value) == len(body)
+        # read() in odd sizes gives the same bytes, and rewinding starts again
+        body.seek(0)
+        pieces = iter(lambda: body.read(7919), b'')
+        assert b''.join(pieces) == value
+        body.seek(0)
+        assert body.read() == value
+    data = json.loads(value.decode('utf-8'))
+    assert [(a['fileName'], a['mimeType']) for a in data['attachments']] == \
+        [('media-kit.pdf', 'application/pdf'), ('rates.bin', 'application/octet-stream')]
+    assert base64.b64decode(data['attachments'][0]['contents']) == contents
+    assert base64.b64decode(data['attachments'][1]['contents']) == contents[1:]
+    assert data['logo'] == 'data:image/jpeg;base64,' + base64.b64encode(b'logo').decode('ascii')
+
+def test_upload_memory_does_not_grow_with_file(tmpdir):
+    size = 16 * 1024 * 1024
+    path = str(tmpdir.join('big.bin'))
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    with open(path, 'rb') as f:
+        expected = (b'{"attachments": [{"fileName": "big.bin", "mimeType": "application/octet-stream", '
+                                b'"contents": "' + base64.b64encode(f.read()) + b'"}]}')
+    expected_length, expected_sha1 = len(expected), hashlib.sha1(expected).hexdigest()
+    del expected
+    server, domain = start_server(HashingHandler)
+    try:
+        buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', pool=PlainConnectionPool())
+        headers = buyer._identity_headers('application/json')
+        tracemalloc.start()
+        try:
+            with buyer.capture() as exchange:
+                js = buyer._send_request("POST", domain, '/upload', headers, json_body({'attachments': [Attachment(path)]}))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert js == {'length': str(expected_length), 'sha1': expected_sha1}
+        assert peak < size // 8
+        assert "--data '<%d bytes streamed>'" % expected_length in exchange['curl_command']
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test proposal to order conversion
+
+"""
+
+import datetime
+import json
+import pytest
+from .core import PATSException, InsertionOrderLineItemDigital
+from .lazy import loads
+from .convert import proposal_to_orders, proposals_to_orders
+
+def proposal_payload():
+    return {
+        'proposalId': 'PRP-1',
+        'vendorId': 'VEN-1',
+        'currencyCode': 'GBP',
+        'digitalLineItems': [
+            {'id': 'PLI-1', 'lineNumber': 1, 'externalId': 'PKG-1', 'name': 'Sport package', 'packageType': 'Package',
+             'buyType': 'Display', 'buyCategory': 'Package', 'costMethod': 'CPM', 'units': 150000, 'rate': 33.333333,
+             'cost': 4999.99995, 'unitType': 'N/A', 'flightStartDate': '2017-06-01', 'flightEndDate': '2017-06-30',
+             'primaryPlacement': False, 'servedBy': 'Site'},
+            {'id': 'PLI-2', 'lineNumber': 2, 'externalId': 'CHILD-1', 'name': 'Sport MPU', 'packageType': 'Child',
+             'parentExternalId': 'PKG-1', 'buyType': 'Display', 'buyCategory': 'Standard', 'section': 'Sport',
+             'dimensions': '300x250', 'position': 'Right', 'servedBy': 'Site', 'creativeType': 'GIF',
+             'primaryPlacement': True, 'units': 0, 'rate': 0.0, 'cost': 0.0},
+            {'id': 'PLI-3', 'lineNumber': 3, 'externalId': 'FEE-1', 'name': 'Ad serving', 'packageType': 'Standalone',
+             'buyType': 'Fee', 'buyCategory': 'Ad Serving', 'costMethod': 'Flat', 'units': 1, 'rate': 100.0,
+             'cost': 100.0, 'unitType': 'N/A', 'flightStartDate': '2017-06-01', 'flightEndDate': '2017-06-30',
+             'primaryPlacement': False, 'section': 'Run of site', 'flighting': [{'month': 6, 'year': 2017, 'units': 1}]},
+        ],
+    }
+
+def test_proposal_becomes_ready_to_send_order():
+    order, = proposal_to_orders(proposal_payload(), external_order_id='ORD-EXT-1',
+                                respond_by_date=datetime.date(2017, 5, 20), comment='As agreed')
+    assert (order['mediaType'], order['vendorId'], order['currencyCode'], order['externalId'],
+            order['respondByDate'], order['comment']) == ('Online', 'VEN-1', 'GBP', 'ORD-EXT-1', '2017-05-20', 'As agreed')
+    package, child, fee = order['digitalLineItems']
+    assert [item['referenceId'] for item in order['digitalLineItems']] == ['PLI-1', 'PLI-2', 'PLI-3']
+    assert not any('id' in item or 'lineNumber' in item for item in order['digitalLineItems'])
+    assert child['parentExternalId'] == 'PKG-1' and 'cost' not in child and 'flightStartDate' not in child
+    assert 'buyType' not in package and 'parentExternalId' not in package
+    assert 'section' not in fee and fee['flighting'] == [{'month': 6, 'year': 2017, 'units': 1}]
+    assert (package['rate'], package['cost']) == (33.3333, 5000.0)
+    # the same fields as building InsertionOrderLineItemDigital objects by hand
+    for item, converted in zip(proposal_payload()['digitalLineItems'], order['digitalLineItems']):
+        expected = InsertionOrderLineItemDigital(dict(item, id=None, lineNumber=None, referenceId=item['id'])).dict_repr()
+        assert converted == dict((k, v) for k, v in expected.items() if v not in (None, ''))
+    json.dumps(order)
+
+def test_lazy_proposals_and_orphaned_children():
+    (proposal_id, orders), = proposals_to_orders([loads(json.dumps(proposal_payload()))])
+    assert proposal_id == 'PRP-1'
+    assert orders == proposal_to_orders(proposal_payload())
+    json.dumps(orders)
+    proposal = proposal_payload()
+    del proposal['digitalLineItems'][0]
+    with pytest.raises(PATSException):
+        proposal_to_orders(proposal)
+
+def test_print_fees_optional_order_fields_and_one_id_per_proposal():
+    proposal = proposal_payload()
+    proposal['digitalLineItems'][2]['mediaProperty'] = 'Sport site'
+    proposal['printLineItems'] = [
+        {'id': 'PLI-4', 'externalId': 'PFEE-1', 'name': 'Insert production', 'buyType': 'Fee',
+         'buyCategory': 'Production', 'costMethod': 'Flat', 'units': 1, 'rate': 80.0, 'cost': 80.0,
+         'section': 'News', 'position': 'Front half', 'coverDate': '2017-06-15', 'saleDate': '2017-06-15'},
+    ]
+    del proposal['currencyCode']
+    digital, printed = proposal_to_orders(proposal)
+    assert 'respondByDate' not in digital and 'currencyCode' not in digital and 'externalId' not in digital
+    assert 'mediaProperty' not in digital['digitalLineItems'][2]
+    # a print "Fee" line keeps its position (digital fees and "Print Fee" lines lose it), not its section
+    fee, = printed['printLineItems']
+    assert fee['position'] == 'Front half' and 'section' not in fee
+    other = dict(proposal_payload(), proposalId='PRP-2')
+    results = proposals_to_orders([proposal_payload(), other], external_order_id='ORD')
+    assert [(proposal_id, orders[0]['externalId']) for proposal_id, orders in results] == \
+        [('PRP-1', 'ORD-PRP-1'), ('PRP-2', 'ORD-PRP-2')]
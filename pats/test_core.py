@@ -29,3 +29,49 @@ PATS Python library - Test core functions - Brendan Quinn May 2017
 
 def test_product():
     assert True
+
+def test_coalesced_gets_share_one_request():
+    import threading
+    import time
+    from .buyer import PATSBuyer
+
+    class SlowBuyer(PATSBuyer):
+        calls = 0
+        def _perform_request(self, method, domain, path, extra_headers, body=None):
+            self.calls += 1
+            time.sleep(0.2)
+            return {'path': path}
+
+    buyer = SlowBuyer(agency_id='35-AGENCY-1', api_key='key', coalesce_requests=True)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(buyer.view_rfp_detail(rfp_id='RFP-1')))
+               for n in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert buyer.calls == 1
+    assert results == [{'path': '/rfps/RFP-1'}] * 5
+    assert buyer.metrics()['coalesced_requests'] == 4
+
+def test_identity_headers_are_built_once_and_shared():
+    from .buyer import PATSBuyer
+
+    class HeaderBuyer(PATSBuyer):
+        def _perform_request(self, method, domain, path, extra_headers, body=None):
+            self.sent = self._get_headers(extra_headers)
+            return {}
+
+    buyer = HeaderBuyer(agency_id='35-AGENCY-1', agency_group_id='35-GROUP', api_key='key')
+    buyer.view_rfp_detail(rfp_id='RFP-1')
+    first = buyer.sent
+    assert first['X-MO-API-Key'] == 'key' and first['X-MO-Organization-ID'] == '35-AGENCY-1'
+    assert first['X-MO-Agency-Group-ID'] == '35-GROUP' and 'X-MO-User-ID' not in first
+    buyer.view_rfp_detail(rfp_id='RFP-2')
+    assert buyer.sent is first
+    buyer.view_rfp_detail(rfp_id='RFP-1', user_id='someone')
+    assert buyer.sent is not first and buyer.sent['X-MO-User-ID'] == 'someone'
+    # ad-hoc header dicts are cached by content
+    adhoc = buyer._get_headers({'Accept': 'application/json', 'X-MO-App': 'prisma'})
+    assert buyer._get_headers({'Accept': 'application/json', 'X-MO-App': 'prisma'}) is adhoc
+    assert adhoc['X-MO-App'] == 'prisma' and adhoc['User-Agent'].startswith('PATS Python Library/')
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test line item costs
+
+"""
+
+import datetime
+import json
+import random
+from decimal import Decimal
+import pytest
+from .core import CampaignDetails, InsertionOrderLineItemDigital, PATSException
+from .lazy import loads
+from . import costs
+from .costs import reconcile, reconcile_payload
+
+def line_items():
+    return [
+        {'externalId': 'CPM-1', 'costMethod': 'CPM', 'units': 250000, 'rate': 12.5, 'cost': 3125.0,
+         'flightStartDate': '2017-06-01'},
+        # 333333 / 1000 * 2.225 = 741.665925, so 741.67
+        {'externalId': 'CPM-2', 'costMethod': 'CPM', 'units': 333333, 'rate': '2.225', 'cost': '741.66'},
+        {'externalId': 'FLAT-1', 'costMethod': 'Flat', 'units': 0, 'rate': 500, 'cost': 500},
+        {'externalId': 'CHILD-1', 'packageType': 'Child', 'costMethod': 'CPM', 'units': 10, 'rate': 1},
+        {'externalId': 'PRINT-1', 'costMethod': 'CPC', 'units': 2, 'rate': '1000.0075', 'cost': 2000.02,
+         'coverDate': '2017-06-15'},
+        {'externalId': 'FEE-1', 'buyType': 'Print Fee', 'cost': '99.995', 'coverDate': '2017-06-15'},
+    ]
+
+def test_reconcile_flags_mismatches_and_rolls_up_totals():
+    report = reconcile(line_items(), use_numpy=False)
+    assert report.expected == [Decimal('3125.00'), Decimal('741.67'), Decimal('500.00'), None,
+                               Decimal('2000.02'), None]
+    assert [m['externalId'] for m in report.mismatches] == ['CPM-2'] and not report.ok
+    assert report.totals == {'digital': Decimal('4366.67'), 'print': Decimal('2100.02'), 'total': Decimal('6466.69')}
+    assert reconcile(line_items(), tolerance='0.01', use_numpy=False).ok
+    campaign = CampaignDetails(start_date=datetime.date(2017, 6, 1), end_date=datetime.date(2017, 6, 30),
+                               campaign_budget=10000, digital_campaign_budget='4000.00')
+    assert report.check_budget(campaign) == [('digital', Decimal('4000.00'), Decimal('4366.67'))]
+    assert report.check_budget(campaign_budget=6000) == [('total', Decimal('6000'), Decimal('6466.69'))]
+
+def test_fix_sets_costs_on_objects_and_dicts():
+    items = line_items()
+    assert reconcile(items, fix=True, use_numpy=False).ok
+    assert items[1]['cost'] == 741.67
+    line_item = InsertionOrderLineItemDigital(name='MPU', buyCategory='Standard', costMethod='CPM',
+                                              units=1500, rate=3.3333, cost=0)
+    report = reconcile_payload({'digitalLineItems': [line_item]}, fix=True)
+    assert line_item.cost == 5.0 and report.totals['digital'] == Decimal('5.00')
+
+def test_fix_refuses_lazy_views():
+    items = loads(json.dumps(line_items()))
+    with pytest.raises(PATSException):
+        reconcile(items, fix=True, use_numpy=False)
+    assert not reconcile(items, use_numpy=False).ok
+    fixed = items.to_python()
+    assert reconcile(fixed, fix=True, use_numpy=False).ok and fixed[1]['cost'] == 741.67
+
+def test_numpy_matches_python():
+    if costs.numpy is None:
+        pytest.skip("numpy is not installed")
+    rand = random.Random(7)
+    items = [{'costMethod': rand.choice(['CPM', 'CPC', 'Flat']), 'units': rand.randint(0, 10 ** 8),
+              'rate': '%d.%04d' % (rand.randint(-5, 500), rand.randint(0, 9999)), 'cost': 0}
+             for n in range(5000)]
+    assert reconcile(items, use_numpy=True).expected == reconcile(items, use_numpy=False).expected
+    # too big for 64 bits: worked out with Python ints instead
+    huge = [{'costMethod': 'CPC', 'units': 10 ** 12, 'rate': '99999.9999', 'cost': 0}]
+    assert reconcile(huge, use_numpy=True).expected == [Decimal('99999999900000000.00')]
+
+def test_realistic_batch_uses_numpy(monkeypatch):
+    if costs.numpy is None:
+        pytest.skip("numpy is not installed")
+    items = [{'costMethod': 'CPM', 'units': 100000 + n, 'rate': '12.50', 'cost': 0} for n in range(1000)]
+    items.append({'costMethod': 'CPC', 'units': 2000000, 'rate': '1500.0075', 'cost': 0})
+    expected = reconcile(items, use_numpy=False).expected
+
+    def python_path(dividend, divisor):
+        raise AssertionError("worked out without numpy")
+    monkeypatch.setattr(costs, '_divide', python_path)
+    assert reconcile(items, use_numpy=True).expected == expected
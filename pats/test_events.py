@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test push event notification receiver
+
+"""
+
+from .events import EventReceiver, ReplayPipeline, SeenEvents, post_events
+
+def test_receiver_dedupes_and_dispatches():
+    receiver = EventReceiver(workers=2).start()
+    handled = []
+    receiver.on('ORDER_SENT', lambda event, receiver: handled.append(event['eventId']))
+    everything = []
+    receiver.on('*', lambda event, receiver: everything.append(event['eventId']))
+    try:
+        assert post_events(receiver.url, [
+            {'eventId': 'E-1', 'eventType': 'ORDER_SENT', 'orderId': 'O-1'},
+            {'eventId': 'E-2', 'eventType': 'RFP_SENT', 'rfpId': 'RFP-1'},
+        ]) == 200
+        # PATS re-sends: the duplicate is dropped
+        assert post_events(receiver.url, {'eventId': 'E-1', 'eventType': 'ORDER_SENT'}) == 200
+        receiver.join()
+    finally:
+        receiver.stop()
+    assert handled == ['E-1']
+    assert sorted(everything) == ['E-1', 'E-2']
+    assert receiver.metrics()['duplicates'] == 1
+
+def test_receiver_forgets_events_whose_handler_failed():
+    receiver = EventReceiver()
+    attempts = []
+
+    def handle(event, receiver):
+        attempts.append(event['eventId'])
+        if len(attempts) == 1:
+            raise ValueError("database down")
+    receiver.on('ORDER_SENT', handle)
+    event = {'eventId': 'E-1', 'eventType': 'ORDER_SENT', 'orderId': 'O-1'}
+    assert receiver.receive([event]) == 1
+    # a re-send while the first is still queued is a duplicate
+    assert receiver.receive([event]) == 0
+    assert receiver.dispatch(receiver.queue.get()) is False
+    assert 'E-1' not in receiver.recent and not receiver.in_flight
+    # handled when PATS re-sends it, and only then remembered
+    assert receiver.receive([event]) == 1
+    assert receiver.dispatch(receiver.queue.get()) is True
+    assert receiver.receive([event]) == 0
+    assert attempts == ['E-1', 'E-1']
+    assert receiver.metrics()['duplicates'] == 2
+
+def test_receiver_pushes_back_when_full():
+    receiver = EventReceiver(queue_size=1, enqueue_timeout=0.01)
+    assert receiver.receive([{'eventId': 'E-1'}]) == 1
+    assert receiver.receive([{'eventId': 'E-2'}, {'eventId': 'E-3'}]) is None
+    # the rejected events can be re-sent later
+    receiver.queue.get()
+    assert receiver.receive([{'eventId': 'E-2'}]) == 1
+
+def test_seen_events_persist(tmpdir):
+    path = str(tmpdir.join('seen.bin'))
+    seen = SeenEvents(path, merge_min=2)
+    assert seen.add('E-1')
+    assert not seen.add('E-1')
+    assert seen.add('E-2') # merged and saved
+    seen.add('E-3')
+    seen.flush()
+    reloaded = SeenEvents(path)
+    assert len(reloaded) == 3
+    assert 'E-2' in reloaded and 'E-4' not in reloaded
+
+def test_seen_events_without_8_byte_arrays(tmpdir, monkeypatch):
+    # as on 2.7 builds where no array type is 8 bytes wide: same file, plain list
+    path = str(tmpdir.join('seen.bin'))
+    seen = SeenEvents(path, merge_min=1)
+    seen.add('E-1')
+    monkeypatch.setattr('pats.events.DIGEST_TYPECODE', None)
+    reloaded = SeenEvents(path, merge_min=1)
+    assert isinstance(reloaded.digests, list) and 'E-1' in reloaded
+    assert reloaded.add('E-2') and not reloaded.add('E-1')
+    monkeypatch.undo()
+    assert len(SeenEvents(path)) == 2
+
+def test_replay_skips_seen_and_keeps_order_per_order_id():
+    seen = SeenEvents()
+    seen.add('E-0')
+    handled = []
+    def dispatch(event):
+        if event['eventId'] == 'E-bad':
+            return False
+        handled.append((event['orderId'], event['eventId']))
+    reports = []
+    pipeline = ReplayPipeline(dispatch, seen, partitions=3, lane_size=2,
+                              report_every=5, progress_callback=reports.append).start()
+    events = [{'eventId': 'E-%d' % n, 'orderId': 'O-%d' % (n % 4)} for n in range(20)]
+    events.append({'eventId': 'E-bad', 'orderId': 'O-1'})
+    progress = pipeline.run(events + events[:5])
+    pipeline.close()
+    assert progress['skipped'] == 6 # E-0, plus the five re-sent
+    assert progress['handled'] == 19 and progress['failed'] == 1
+    for order_id in ('O-0', 'O-1', 'O-2', 'O-3'):
+        ids = [int(eid[2:]) for oid, eid in handled if oid == order_id]
+        assert ids == sorted(ids)
+    assert 'E-bad' not in seen and 'E-19' in seen
+    assert reports
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test JSONL export
+
+"""
+
+import datetime
+import gzip
+import json
+import pytest
+from .core import PATSException
+from .buyer import PATSBuyer
+from .seller import PATSSeller
+from .export import JSONLExport
+from .__main__ import main
+
+SINCE = datetime.date(2017, 1, 1)
+
+class StubBuyer(PATSBuyer):
+    ORDERS = [{"orderId": "O-%d" % n, "version": 1} for n in range(60)]
+    PROPOSALS = [{"proposalId": "P-%d" % n} for n in range(35)]
+    fail_on_page = None
+
+    def list_orders(self, since_date=None, page_size=25, page=1, **kwargs):
+        if page == self.fail_on_page:
+            raise PATSException("Connection reset")
+        return self.ORDERS[(page - 1) * page_size:page * page_size]
+
+    def list_proposals(self, start_date=None, page=1, **kwargs):
+        # pages of 10, whatever we'd like
+        return self.PROPOSALS[(page - 1) * 10:page * 10]
+
+def read_lines(path, compressed=False):
+    with (gzip.open(path, 'rt') if compressed else open(path)) as f:
+        return [json.loads(line) for line in f]
+
+def test_export_resumes_after_interruption(tmpdir):
+    output = str(tmpdir.join('orders.jsonl.gz'))
+    buyer = StubBuyer(agency_id='35-AGENCY-1', api_key='key')
+    other = StubBuyer(agency_id='35-AGENCY-2', api_key='key')
+    buyer.fail_on_page = 3
+    with pytest.raises(PATSException):
+        JSONLExport('orders', [buyer, other], output, since_date=SINCE, pages_ahead=2).run()
+    # some tenant got part of the way: a half-written page is dropped when we carry on
+    with open(output, 'ab') as f:
+        f.write(b'garbage')
+    buyer.fail_on_page = None
+    counts = JSONLExport('orders', [buyer, other], output, since_date=SINCE, pages_ahead=2).run()
+    assert counts == {'35-AGENCY-1': 60, '35-AGENCY-2': 60}
+    records = read_lines(output, compressed=True)
+    assert sorted((r['tenant'], r['order']['orderId']) for r in records) == \
+        sorted((tenant, o['orderId']) for tenant in counts for o in StubBuyer.ORDERS)
+    # finished: running it again fetches nothing more
+    assert JSONLExport('orders', [buyer, other], output, since_date=SINCE).run() == counts
+    assert len(read_lines(output, compressed=True)) == 120
+
+def test_export_checks_cursor_and_kind(tmpdir):
+    output = str(tmpdir.join('orders.jsonl'))
+    buyer = StubBuyer(agency_id='35-AGENCY-1', api_key='key')
+    JSONLExport('orders', [buyer], output, since_date=SINCE).run()
+    assert len(read_lines(output)) == 60
+    with pytest.raises(PATSException):
+        JSONLExport('orders', [buyer], output, since_date=datetime.date(2017, 2, 1)).run()
+    with pytest.raises(PATSException):
+        JSONLExport('proposals', [PATSSeller(vendor_id='35-VENDOR-1', api_key='key')],
+                    str(tmpdir.join('proposals.jsonl'))).run()
+    with pytest.raises(PATSException):
+        JSONLExport('orders', [buyer, StubBuyer(agency_id='35-AGENCY-1', user_id='other', api_key='key')],
+                    str(tmpdir.join('other.jsonl')), since_date=SINCE)
+
+def test_export_proposals_until_an_empty_page(tmpdir):
+    output = str(tmpdir.join('proposals.jsonl'))
+    buyer = StubBuyer(agency_id='35-AGENCY-1', api_key='key')
+    assert JSONLExport('proposals', [buyer], output, since_date=SINCE).run() == {'35-AGENCY-1': 35}
+    assert [r['proposal']['proposalId'] for r in read_lines(output)] == [p['proposalId'] for p in StubBuyer.PROPOSALS]
+
+def test_command_line(tmpdir, monkeypatch, capsys):
+    monkeypatch.setattr('pats.harvest.PATSBuyer', StubBuyer)
+    output = str(tmpdir.join('orders.jsonl'))
+    assert main(['export', 'orders', '--side', 'buyer', '--agency-id', '35-AGENCY-1', '--api-key', 'key',
+                 '--since', '2017-01-01', '--output', output]) == 0
+    assert capsys.readouterr().out == "35-AGENCY-1: 60 orders\n"
+    assert len(read_lines(output)) == 60
+    assert main(['export', 'orders', '--output', output]) == 1
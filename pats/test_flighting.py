@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test flighting
+
+"""
+
+import datetime
+from decimal import Decimal
+import random
+import pytest
+from .core import PATSException
+from . import flighting as flighting_module
+from .flighting import flighting, set_flighting
+
+def test_pro_rata_even_and_weighted_splits():
+    # 10 days of June, all of July, 5 days of August: 46 days
+    split, = flighting(['2017-06-21'], [datetime.date(2017, 8, 5)], [46000], use_numpy=False)
+    assert split == [{'month': 6, 'year': 2017, 'units': 10000},
+                     {'month': 7, 'year': 2017, 'units': 31000},
+                     {'month': 8, 'year': 2017, 'units': 5000}]
+    split, = flighting(['2017-12-15'], ['2018-02-01'], [100], method='even', use_numpy=False)
+    assert [(m['year'], m['month'], m['units']) for m in split] == [(2017, 12, 33), (2018, 1, 34), (2018, 2, 33)]
+    split, = flighting(['2017-06-01'], ['2017-07-31'], [7], method='weights', weights=[[1, 2.5]], use_numpy=False)
+    assert [m['units'] for m in split] == [2, 5]
+    with pytest.raises(PATSException):
+        flighting(['2017-06-01'], ['2017-05-01'], [1], use_numpy=False)
+    with pytest.raises(PATSException):
+        flighting(['2017-06-01'], ['2017-07-01'], [1.5], use_numpy=False)
+    with pytest.raises(PATSException):
+        flighting(['2017-06-01'], ['2017-07-01'], [1], method='weights', weights=[[1]], use_numpy=False)
+
+def test_units_from_payloads():
+    split, = flighting(['2017-06-01'], ['2017-07-31'], ['61'], method='even', use_numpy=False)
+    assert [m['units'] for m in split] == [31, 30]
+    split, = flighting(['2017-06-01'], ['2017-06-30'], [Decimal('30.00')], use_numpy=False)
+    assert split == [{'month': 6, 'year': 2017, 'units': 30}]
+    for units in ['1.5', Decimal('1.5'), 'lots', Decimal('NaN'), '-1']:
+        with pytest.raises(PATSException):
+            flighting(['2017-06-01'], ['2017-07-01'], [units], use_numpy=False)
+
+def test_set_flighting_on_dicts():
+    line_items = [{'flightStartDate': '2017-06-01', 'flightEndDate': '2017-06-30', 'units': 5}]
+    set_flighting(line_items, use_numpy=False)
+    assert line_items[0]['flighting'] == [{'month': 6, 'year': 2017, 'units': 5}]
+
+def test_numpy_matches_python_and_totals_are_exact():
+    if flighting_module.numpy is None:
+        pytest.skip("numpy is not installed")
+    rand = random.Random(42)
+    starts, ends, units = [], [], []
+    for n in range(2000):
+        start = datetime.date(2016, 1, 1) + datetime.timedelta(days=rand.randint(0, 800))
+        starts.append(start)
+        ends.append(start + datetime.timedelta(days=rand.randint(0, 400)))
+        units.append(rand.randint(0, 10 ** 9))
+    for method in ('days', 'even'):
+        fast = flighting(starts, ends, units, method=method, use_numpy=True)
+        assert fast == flighting(starts, ends, units, method=method, use_numpy=False)
+        assert [sum(m['units'] for m in split) for split in fast] == units
+    weights = [[rand.randint(1, 5) for m in split] for split in fast]
+    assert flighting(starts, ends, units, 'weights', weights, use_numpy=True) == \
+        flighting(starts, ends, units, 'weights', weights, use_numpy=False)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test historical order harvester
+
+"""
+
+import datetime
+import json
+import os
+from .buyer import PATSBuyer
+from .harvest import OrderHarvester
+
+class StubBuyer(PATSBuyer):
+    # orders updated on 2017-01-05 (twice, as PATS pages can overlap) and 2017-02-10
+    ORDERS = [
+        {"orderId": "O-1", "version": 1, "lastUpdatedDate": "2017-01-05T10:00:00Z"},
+        {"orderId": "O-1", "version": 1, "lastUpdatedDate": "2017-01-05T10:00:00Z"},
+        {"orderId": "O-2", "version": 3, "lastUpdatedDate": "2017-02-10T10:00:00Z"},
+    ]
+
+    calls = 0
+
+    def list_orders(self, since_date=None, page_size=25, page=1, **kwargs):
+        StubBuyer.calls += 1
+        if page > 1:
+            return []
+        return [o for o in self.ORDERS if o["lastUpdatedDate"][:10] >= since_date.strftime("%Y-%m-%d")]
+
+def test_harvest_merges_and_resumes(tmpdir):
+    tenants = [{'factory': StubBuyer, 'agency_id': '35-AGENCY-1', 'api_key': 'key'},
+               {'factory': StubBuyer, 'agency_id': '35-AGENCY-2', 'api_key': 'key'}]
+    harvester = OrderHarvester(tenants, start_date=datetime.date(2017, 1, 1),
+                               end_date=datetime.date(2017, 2, 1),
+                               workdir=str(tmpdir.join('work')), processes=0)
+    output = str(tmpdir.join('orders.jsonl'))
+    StubBuyer.calls = 0
+    stats = harvester.run(output)
+    # each tenant is paged through once; O-2 was updated after the end date
+    assert StubBuyer.calls == 2
+    assert stats == {'shards_fetched': 2, 'shards_skipped': 0, 'orders_written': 2}
+    with open(output) as f:
+        records = [json.loads(line) for line in f]
+    assert [(r['tenant'], r['order']['orderId']) for r in records] == [('35-AGENCY-1', 'O-1'), ('35-AGENCY-2', 'O-1')]
+
+    # a finished shard isn't fetched again
+    os.remove(harvester.shards()[1]['path'])
+    stats = harvester.run(output)
+    assert stats == {'shards_fetched': 1, 'shards_skipped': 1, 'orders_written': 2}
+    assert StubBuyer.calls == 3
+
+def test_open_ended_harvest_resumes_on_a_later_day(tmpdir, monkeypatch):
+    tenants = [{'factory': StubBuyer, 'agency_id': '35-AGENCY-1', 'api_key': 'key'}]
+    workdir = str(tmpdir.join('work'))
+    output = str(tmpdir.join('orders.jsonl'))
+    stats = OrderHarvester(tenants, start_date=datetime.date(2017, 1, 1), workdir=workdir, processes=0).run(output)
+    # no end date: O-2 is kept
+    assert stats == {'shards_fetched': 1, 'shards_skipped': 0, 'orders_written': 2}
+
+    class Tomorrow(datetime.date):
+        @classmethod
+        def today(cls):
+            return datetime.date(2030, 1, 2)
+    monkeypatch.setattr('pats.harvest.datetime.date', Tomorrow)
+    stats = OrderHarvester(tenants, start_date=datetime.date(2017, 1, 1), workdir=workdir, processes=0).run(output)
+    assert stats == {'shards_fetched': 0, 'shards_skipped': 1, 'orders_written': 2}
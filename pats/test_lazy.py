@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test lazy JSON views
+
+"""
+
+import json
+import re
+import pytest
+from . import lazy
+from .lazy import loads, dumps, JSONObjectView, JSONArrayView
+
+ORDER = {
+    'orderId': 'ORD-1',
+    'version': 3,
+    'lineItems': [
+        {'lineItemExternalId': 'L%d' % n, 'rate': '12.50', 'units': n, 'active': n % 2 == 0,
+         'notes': u'qu"ote\\ and é', 'flighting': {'weeks': [[1, 2], [3, None]]}}
+        for n in range(50)
+    ],
+    'empty': {},
+    'nothing': [],
+    'status': 'SENT',
+}
+
+@pytest.fixture(params=[True, False], ids=['possessive', 'backtracking'])
+def scanner(request, monkeypatch):
+    # both sets of scanning regexes, whichever this Python uses by default
+    try:
+        item, field = lazy._patterns(lazy.MAX_SKIP_DEPTH, possessive=request.param)
+    except re.error:
+        pytest.skip("possessive quantifiers need Python 3.11")
+    monkeypatch.setattr(lazy, 'ITEM', item)
+    monkeypatch.setattr(lazy, 'FIELD', field)
+
+def test_views_match_json_loads(scanner):
+    text = json.dumps(ORDER, indent=2)
+    order = loads(text)
+    assert isinstance(order, JSONObjectView)
+    # the status comes after the line items, which are stepped over without being read
+    assert order['status'] == 'SENT'
+    line_items = order['lineItems']
+    assert isinstance(line_items, JSONArrayView)
+    assert line_items[7]['units'] == 7 and line_items[-1]['lineItemExternalId'] == 'L49'
+    assert line_items.spans and not line_items[7]['flighting'].spans
+    assert order == json.loads(text)
+    assert order.to_python() == ORDER
+    assert json.loads(dumps(order)) == ORDER
+    assert json.loads(dumps({'order': order})) == {'order': ORDER}
+    with pytest.raises(TypeError):
+        order['status'] = 'CANCELLED'
+    with pytest.raises(KeyError):
+        order['missing']
+
+def test_deeply_nested_values(scanner):
+    value = 'bottom'
+    for n in range(20):
+        value = [value, {'n': n}]
+    text = json.dumps({'deep': value, 'after': True})
+    assert loads(text)['after'] is True
+    assert loads(text) == json.loads(text)
+
+def test_coalesced_lazy_result_read_from_several_threads():
+    import threading
+    import time
+    from .buyer import PATSBuyer
+    text = json.dumps([{'orderId': 'O-%d' % n, 'version': 1} for n in range(20000)])
+
+    class SlowBuyer(PATSBuyer):
+        def _perform_request(self, method, domain, path, extra_headers, body=None):
+            time.sleep(0.2)
+            return loads(text)
+
+    buyer = SlowBuyer(agency_id='35-AGENCY-1', api_key='key', coalesce_requests=True, lazy_json=True)
+    results = []
+    start = threading.Barrier(8)
+
+    def read():
+        orders = buyer.view_rfp_detail(rfp_id='RFP-1')
+        start.wait()
+        results.append((len([order['orderId'] for order in orders]), len(orders)))
+
+    threads = [threading.Thread(target=read) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert buyer.metrics()['coalesced_requests'] == 7
+    assert results == [(20000, 20000)] * 8
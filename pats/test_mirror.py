@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test local mirror
+
+"""
+
+import datetime
+from .buyer import PATSBuyer
+from .mirror import PATSMirror
+
+ORDERS = [
+    {"orderId": "O-1", "version": 1, "campaignId": "CP-1", "advertiserName": "Acme",
+     "status": "Sent", "lastUpdatedDate": "2017-05-02",
+     "digitalLineItems": [{"id": "L-1", "name": "Banner", "units": 1000, "rate": 5.0, "cost": 5.0}]},
+    {"orderId": "O-1", "version": 2, "campaignId": "CP-1", "advertiserName": "Acme",
+     "status": "Accepted", "lastUpdatedDate": "2017-05-03",
+     "digitalLineItems": [{"id": "L-2", "name": "MPU", "units": 2000, "rate": 5.0, "cost": 10.0}]},
+    {"orderId": "O-2", "version": 1, "campaignId": "CP-2", "advertiserName": "Other",
+     "status": "Sent", "lastUpdatedDate": "2017-05-04", "printLineItems": []},
+]
+
+class StubBuyer(PATSBuyer):
+    requests = 0
+
+    def list_orders(self, since_date=None, page_size=25, page=1, **kwargs):
+        self.requests += 1
+        return ORDERS if page == 1 else []
+
+def test_mirror_orders_and_line_items():
+    buyer = StubBuyer(agency_id='35-AGENCY-1', api_key='key', mirror=PATSMirror())
+    since = datetime.date(2017, 5, 1)
+    orders = buyer.mirror_orders(since_date=since, advertiser='Acme')
+    assert [(o['orderId'], o['version']) for o in orders] == [('O-1', 2)]
+    assert [li['id'] for li in buyer.mirror_order_line_items(order_id='O-1')] == ['L-2']
+    assert [li['id'] for li in buyer.mirror_order_line_items(order_id='O-1', version=1)] == ['L-1']
+    # second query is answered from the mirror
+    buyer.mirror_orders(since_date=since, campaign_id='CP-2')
+    assert buyer.requests == 1
+    # an older since date, or a zero freshness bound, forces a refresh
+    buyer.mirror_orders(since_date=datetime.date(2017, 1, 1))
+    buyer.mirror_orders(since_date=since, max_age=-1)
+    assert buyer.requests == 3
+
+def test_mirror_rfps_due():
+    mirror = PATSMirror()
+    mirror.store_rfps('35-AGENCY-1', [
+        {"id": "RFP-1", "responseDueDate": "2017-05-02"},
+        {"id": "RFP-2", "responseDueDate": "2017-05-09T12:00:00Z"},
+        {"id": "RFP-3", "responseDueDate": "2017-05-20"},
+    ], complete=True)
+    due = mirror.find_rfps_due('35-AGENCY-1', datetime.date(2017, 5, 2), datetime.date(2017, 5, 9))
+    assert [rfp['id'] for rfp in due] == ['RFP-1', 'RFP-2']
+    assert mirror.is_fresh('35-AGENCY-1', 'rfps', 60)
+    assert not mirror.is_fresh('35-OTHER-1', 'rfps', 60)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test typed read-side models
+
+"""
+
+import datetime
+import json
+from decimal import Decimal
+import pytest
+from .core import PATSException
+from .lazy import loads
+from .models import Parser, load_orders, load_rfps, load_proposals
+
+def order_payload(n):
+    return {
+        'orderId': 'ORD-%d' % n,
+        'version': '2',
+        'campaignId': 'CMP-1',
+        'advertiser': {'name': 'Acme', 'code': 'ACM'},
+        'status': 'SENT',
+        'lastUpdatedDate': '2017-05-01T12:30:15.250Z',
+        'digitalLineItems': [
+            {'id': 'D%d' % n, 'externalId': 'EXT-D%d' % n, 'name': 'Homepage', 'costMethod': 'CPM',
+             'units': '250000', 'rate': '12.50', 'cost': 3125.0,
+             'flightStartDate': '2017-06-01', 'flightEndDate': '2017-06-30'},
+        ],
+        'printLineItems': [
+            {'id': 'P%d' % n, 'externalId': 'EXT-P%d' % n, 'parentExternalId': 'PKG-1', 'referenceId': 'R1',
+             'costMethod': 'Flat', 'units': 1, 'rate': '1000', 'cost': '1000.00', 'coverDate': '2017-06-15'},
+        ],
+    }
+
+def test_orders_are_parsed_once_and_indexed():
+    orders = load_orders([order_payload(n) for n in range(3)])
+    order = orders[1]
+    assert (order.order_id, order.version, order.advertiser, order.status) == ('ORD-1', 2, 'Acme', 'SENT')
+    assert order.updated == datetime.datetime(2017, 5, 1, 12, 30, 15, 250000)
+    digital = order.line_item('D1')
+    assert digital is order.line_item('EXT-D1')
+    assert (digital.media, digital.units, digital.rate, digital.cost) == ('digital', 250000, Decimal('12.50'), Decimal('3125.0'))
+    assert digital.start_date == datetime.date(2017, 6, 1) and digital.end_date == datetime.date(2017, 6, 30)
+    printed = order.line_item('P1')
+    assert (printed.media, printed.parent_external_id, printed.reference_id) == ('print', 'PKG-1', 'R1')
+    assert printed.start_date == printed.end_date == datetime.date(2017, 6, 15)
+    assert order.total_cost() == Decimal('4125.00')
+    with pytest.raises(KeyError):
+        order.line_item('nope')
+    # equal values parsed by one parser are shared between models
+    assert orders[0].line_item('D0').start_date is orders[2].line_item('D2').start_date
+    assert not hasattr(order, '__dict__')
+
+def test_models_from_lazy_views_and_other_payloads():
+    order, = load_orders([loads(json.dumps(order_payload(7)))])
+    assert order.advertiser == 'Acme' and order.line_item('EXT-P7').rate == Decimal('1000')
+    rfp, = load_rfps([{'rfpId': 'RFP-1', 'startDate': '2017-06-01', 'endDate': '2017-06-30',
+                       'responseDueDate': '2017-05-20', 'budget': '50000.00'}])
+    assert rfp.response_due_date == datetime.date(2017, 5, 20) and rfp.budget == Decimal('50000.00')
+    proposal, = load_proposals([{'proposalId': 'PRP-1', 'rfpId': 'RFP-1',
+                                 'digitalLineItems': [{'lineItemExternalId': 'L1', 'rate': 2.5}]}])
+    assert proposal.rfp_id == 'RFP-1' and proposal.line_item('L1').rate == Decimal('2.5')
+    with pytest.raises(PATSException):
+        Parser().date('June 1st')
+
+def test_timestamps_are_normalised_to_utc():
+    parser = Parser()
+    assert parser.date('2017-06-01T10:00:00.123-0500') == datetime.datetime(2017, 6, 1, 15, 0, 0, 123000)
+    assert parser.date('2017-06-01T00:30:00+01:00') == datetime.datetime(2017, 5, 31, 23, 30)
+    assert parser.date('2017-06-01T10:00:00.5Z') == datetime.datetime(2017, 6, 1, 10, 0, 0, 500000)
+    assert parser.date('2017-06-01T10:00') == datetime.datetime(2017, 6, 1, 10, 0)
+    with pytest.raises(PATSException):
+        parser.date('2017-06-01T10:00:00 EST')
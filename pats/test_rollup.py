@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test spend roll-up
+
+"""
+
+import json
+from decimal import Decimal
+import pytest
+from .core import PATSException
+from .lazy import loads
+from .rollup import SpendRollup
+
+def order(order_id, version, campaign, vendor, digital_cost='1000.00', print_cost=None):
+    payload = {
+        'orderId': order_id, 'version': version, 'campaignId': campaign, 'vendorId': vendor,
+        'advertiser': {'name': 'Acme'},
+        'digitalLineItems': [
+            {'buyType': 'Display', 'section': 'Sport', 'cost': digital_cost, 'flightStartDate': '2017-06-10',
+             'flighting': [{'year': 2017, 'month': 6, 'units': 1}, {'year': 2017, 'month': 7, 'units': 2}]},
+        ],
+    }
+    if print_cost:
+        payload['printLineItems'] = [{'buyType': 'Magazine', 'section': 'News', 'cost': print_cost,
+                                      'coverDate': '2017-08-01'}]
+    return payload
+
+def test_group_by_totals_and_newer_versions_replace_older():
+    rollup = SpendRollup()
+    assert rollup.add_orders([order('O1', 1, 'C1', 'V1', print_cost=250.5), order('O2', 1, 'C2', 'V1')]) == 2
+    assert rollup.totals() == Decimal('2250.50')
+    # the digital cost is split over the flighting months by units
+    assert rollup.totals('month') == {('2017-06',): Decimal('666.66'), ('2017-07',): Decimal('1333.34'),
+                                      ('2017-08',): Decimal('250.50')}
+    assert rollup.totals('campaign', 'media') == {('C1', 'Online'): Decimal('1000.00'),
+                                                  ('C1', 'Print'): Decimal('250.50'),
+                                                  ('C2', 'Online'): Decimal('1000.00')}
+    by_vendor = rollup.totals('vendor', 'buy_type')
+    # a new version replaces the old one's amounts, including in groupings already asked for
+    assert rollup.add(loads(json.dumps(order('O1', 2, 'C1', 'V2', digital_cost=400))))
+    assert not rollup.add(order('O1', 1, 'C1', 'V1'))
+    assert rollup.totals('vendor', 'buy_type') == {('V1', 'Display'): Decimal('1000.00'),
+                                                  ('V2', 'Display'): Decimal('400.00')}
+    assert by_vendor[('V1', 'Magazine')] == Decimal('250.50')
+    assert rollup.totals('advertiser') == {('Acme',): Decimal('1400.00')}
+    fresh = SpendRollup()
+    fresh.add_orders([order('O2', 1, 'C2', 'V1'), order('O1', 2, 'C1', 'V2', digital_cost=400)])
+    rollup.compact()
+    assert len(rollup) == len(fresh) == 4
+    assert rollup.totals('section', 'month') == fresh.totals('section', 'month')
+    with pytest.raises(PATSException):
+        rollup.totals('colour')
+
+def test_rollup_without_8_byte_arrays(monkeypatch):
+    # as on builds where no array type is 8 bytes wide: amounts go in a plain list
+    monkeypatch.setattr('pats.rollup.AMOUNT_TYPECODE', None)
+    rollup = SpendRollup()
+    rollup.add_orders([order('O1', 1, 'C1', 'V1'), order('O2', 1, 'C2', 'V1')])
+    rollup.add(order('O1', 2, 'C1', 'V1', digital_cost='10.00'))
+    rollup.compact()
+    assert isinstance(rollup.amounts, list)
+    assert rollup.totals('campaign') == {('C1',): Decimal('10.00'), ('C2',): Decimal('1000.00')}
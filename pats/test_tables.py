@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test columnar export
+
+"""
+
+import datetime
+import json
+from decimal import Decimal
+import pytest
+from . import tables
+from .lazy import loads
+from .tables import order_rows, TableExporter, ORDER_COLUMNS, LINE_ITEM_COLUMNS
+
+def order(n):
+    return {
+        'orderId': 'ORD-%d' % n, 'version': 1 + n % 3, 'vendorId': 'VEN-%d' % (n % 4), 'status': 'SENT',
+        'campaignId': 'CMP-1', 'advertiser': {'name': 'Acme'}, 'lastUpdatedDate': '2017-05-01T12:00:00Z',
+        'digitalLineItems': [{'id': 'D%d' % n, 'buyType': 'Display', 'buyCategory': 'Standard', 'units': 1000,
+                              'rate': '12.50', 'cost': 12.5, 'flightStartDate': '2017-06-01',
+                              'flightEndDate': '2017-06-30'}],
+        'printLineItems': [{'id': 'P%d' % n, 'buyType': 'Magazine', 'rate': 100, 'cost': '100.005',
+                            'coverDate': '2017-06-15'}] if n % 2 else [],
+    }
+
+def test_order_rows_are_typed_and_flat():
+    order_row, line_items = order_rows(loads(json.dumps(order(1))), tenant='AG-1')
+    order_row = dict(zip([name for name, kind in ORDER_COLUMNS], order_row))
+    assert (order_row['order_id'], order_row['version'], order_row['advertiser']) == ('ORD-1', 2, 'Acme')
+    assert order_row['updated'] == datetime.datetime(2017, 5, 1, 12, 0)
+    assert (order_row['digital_line_items'], order_row['print_line_items']) == (1, 1)
+    digital, printed = [dict(zip([name for name, kind in LINE_ITEM_COLUMNS], row)) for row in line_items]
+    assert digital['rate'] == Decimal('12.5000') and digital['flight_end_date'] == datetime.date(2017, 6, 30)
+    assert printed['media'] == 'print' and printed['cost'] == Decimal('100.0050')
+    assert printed['cover_date'] == datetime.date(2017, 6, 15) and printed['tenant'] == 'AG-1'
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_export_in_row_groups(tmpdir, file_format):
+    if tables.pyarrow is None:
+        pytest.skip("pyarrow is not installed")
+    import pyarrow.ipc
+    import pyarrow.parquet
+    orders_path, line_items_path = str(tmpdir.join('orders')), str(tmpdir.join('line_items'))
+    with TableExporter(orders_path, line_items_path, file_format, row_group_size=4) as exporter:
+        assert exporter.add_orders(order(n) for n in range(10)) == 10
+    if file_format == 'parquet':
+        assert pyarrow.parquet.ParquetFile(line_items_path).num_row_groups == 4
+        line_items = pyarrow.parquet.read_table(line_items_path, read_dictionary=['buy_type'])
+        orders = pyarrow.parquet.read_table(orders_path)
+    else:
+        line_items = pyarrow.ipc.open_stream(line_items_path).read_all()
+        orders = pyarrow.ipc.open_stream(orders_path).read_all()
+    assert orders.num_rows == 10 and line_items.num_rows == 15
+    assert pyarrow.types.is_dictionary(line_items.schema.field('buy_type').type)
+    assert orders.column('vendor_id').to_pylist()[:5] == ['VEN-0', 'VEN-1', 'VEN-2', 'VEN-3', 'VEN-0']
+    assert sum(line_items.column('cost').to_pylist()) == Decimal('625.0250')
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test multi-tenant client manager
+
+"""
+
+import pytest
+from .core import PATSException
+from .tenants import PATSTenantManager
+
+def test_tenants_share_transport():
+    manager = PATSTenantManager(buyer_api_key='buyer-key', seller_api_key='seller-key')
+    buyer_1 = manager.buyer('35-AGENCY-1', 'group', 'user')
+    buyer_2 = manager.buyer('35-AGENCY-2', 'group', 'user')
+    seller = manager.seller('35-VENDOR-1', 'seller@example.com')
+    assert manager.buyer('35-AGENCY-1', 'group', 'user') is buyer_1
+    assert buyer_1.pool is buyer_2.pool is seller.pool
+    assert buyer_1.reference_cache is seller.reference_cache
+    assert manager.tenants() == [buyer_1, buyer_2, seller]
+
+def test_fan_out():
+    manager = PATSTenantManager(buyer_api_key='buyer-key')
+    clients = [manager.buyer('35-AGENCY-%d' % n) for n in range(20)]
+
+    def fetch(client):
+        if client.agency_id == '35-AGENCY-3':
+            raise PATSException("Not found")
+        return client.agency_id
+
+    results = manager.fan_out(fetch, max_workers=4, return_exceptions=True)
+    assert results[0] == '35-AGENCY-0'
+    assert isinstance(results[3], PATSException)
+    with pytest.raises(PATSException):
+        manager.fan_out(fetch)
+    by_tenant = manager._by_tenant(fetch, clients[:3], 2, False)
+    assert list(by_tenant.items())[2] == ('35-AGENCY-2', '35-AGENCY-2')
+
+def test_by_tenant_refuses_clients_for_the_same_tenant():
+    manager = PATSTenantManager(buyer_api_key='buyer-key')
+    clients = [manager.buyer('35-AGENCY-1', 'group', 'user-1'), manager.buyer('35-AGENCY-1', 'group', 'user-2')]
+    with pytest.raises(PATSException):
+        manager.list_orders(clients=clients)
+    with pytest.raises(PATSException):
+        manager.list_rfps()
+    assert list(manager._by_tenant(lambda client: client.user_id, clients[1:], 1, False).items()) == \
+        [('35-AGENCY-1', 'user-2')]
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - Test HTTP transport
+
+"""
+
+import gzip
+import json
+import os
+import socket
+import ssl
+import subprocess
+import threading
+import time
+try:
+    from http.client import HTTPConnection, HTTPException
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from httplib import HTTPConnection, HTTPException # 2.x
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+import pytest
+from .buyer import PATSBuyer
+from .core import PATSException, PATSCircuitOpenError, PATSTimeoutError, deadline, endpoint_template
+from .transport import ConnectionPool, CircuitBreakers, DNSCache, Hedging, HTTP2Pool, TLSSessions, \
+    RecordingTransport, ReplayTransport
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'path': self.path, 'user': self.headers.get('X-MO-User-ID')}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class EchoServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class PlainConnectionPool(ConnectionPool):
+    def _connect(self, domain):
+        return HTTPConnection(domain)
+
+def start_server(handler=EchoHandler):
+    server = EchoServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, '127.0.0.1:%d' % server.server_address[1]
+
+def test_shared_client_across_threads():
+    server, domain = start_server()
+    try:
+        buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', user_id='buyer', pool=PlainConnectionPool())
+        errors = []
+
+        def worker(n):
+            for i in range(5):
+                path = '/rfps/RFP-%d-%d' % (n, i)
+                with buyer.capture() as exchange:
+                    js = buyer._send_request("GET", domain, path, buyer._identity_headers('application/json', user_id='buyer'))
+                if js['path'] != path or path not in exchange['curl_command'] or exchange['response_status'] != 200:
+                    errors.append(path)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(64)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+        metrics = buyer.metrics()
+        assert metrics['connections_opened'] + metrics['connections_reused'] == 64 * 5
+        assert metrics['connections_opened'] < 64 * 5
+    finally:
+        server.shutdown()
+        server.server_close()
+
+class SickAttachmentsHandler(EchoHandler):
+    healthy = False
+    attachment_calls = 0
+
+    def do_GET(self):
+        if self.path.startswith('/attachments/'):
+            SickAttachmentsHandler.attachment_calls += 1
+            if not SickAttachmentsHandler.healthy:
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        EchoHandler.do_GET(self)
+
+class DroppingHandler(EchoHandler):
+    # takes /drop requests in, then hangs up without answering
+    received = []
+
+    def do_drop(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        DroppingHandler.received.append(self.command)
+        self.close_connection = True
+
+    def do_GET(self):
+        if self.path == '/drop':
+            return self.do_drop()
+        EchoHandler.do_GET(self)
+
+    def do_POST(self):
+        self.do_drop()
+
+def test_stale_connection_retries_only_idempotent_requests(monkeypatch):
+    # handlers keep what they saw on the class: monkeypatch puts it back afterwards
+    server, domain = start_server(DroppingHandler)
+    try:
+        pool = PlainConnectionPool()
+        for method in ('POST', 'GET'):
+            monkeypatch.setattr(DroppingHandler, 'received', [])
+            assert pool.request('GET', domain, '/warm-up').status == 200 # leaves an idle connection
+            with pytest.raises((socket.error, HTTPException)):
+                pool.request(method, domain, '/drop', b'{"externalId": "ORDER-1"}')
+            if method == 'POST':
+                # PATS may have created the order: it isn't sent a second time
+                assert DroppingHandler.received == ['POST']
+            else:
+                assert DroppingHandler.received == ['GET', 'GET']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_endpoint_template():
+    assert endpoint_template('/campaigns/CPN123/orders/35-ORD-9/versions/2?x=1') == \
+        '/campaigns/{id}/orders/{id}/versions/{id}'
+
+def test_circuit_breaker_isolates_sick_endpoint(monkeypatch):
+    monkeypatch.setattr(SickAttachmentsHandler, 'healthy', False)
+    monkeypatch.setattr(SickAttachmentsHandler, 'attachment_calls', 0)
+    server, domain = start_server(SickAttachmentsHandler)
+    try:
+        breakers = CircuitBreakers(min_calls=2, open_seconds=60)
+        buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', pool=PlainConnectionPool(),
+                          circuit_breakers=breakers)
+        headers = buyer._identity_headers('application/json')
+        for n in range(2):
+            with pytest.raises(PATSException):
+                buyer._send_request("GET", domain, '/attachments/ATT-%d' % n, headers)
+        with pytest.raises(PATSCircuitOpenError):
+            buyer._send_request("GET", domain, '/attachments/ATT-3', headers)
+        assert SickAttachmentsHandler.attachment_calls == 2
+        # other endpoints keep working
+        assert buyer._send_request("GET", domain, '/rfps/RFP-1', headers)['path'] == '/rfps/RFP-1'
+        state = buyer.metrics()['circuit_breakers']
+        assert state[domain + ' /attachments/{id}']['state'] == 'open'
+        assert state[domain + ' /rfps/{id}']['state'] == 'closed'
+        # after open_seconds one probe goes through, and closes the breaker if it works
+        monkeypatch.setattr(SickAttachmentsHandler, 'healthy', True)
+        breakers.get((domain, '/attachments/{id}')).opened_at -= 60
+        assert buyer._send_request("GET", domain, '/attachments/ATT-4', headers)['path'] == '/attachments/ATT-4'
+        assert buyer.metrics()['circuit_breakers'][domain + ' /attachments/{id}']['state'] == 'closed'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_circuit_breaker_probe_past_deadline():
+    server, domain = start_server()
+    try:
+        breakers = CircuitBreakers(open_seconds=60)
+        buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', pool=PlainConnectionPool(),
+                          circuit_breakers=breakers)
+        headers = buyer._identity_headers('application/json')
+        breaker = breakers.get((domain, '/attachments/{id}'))
+        breaker._open()
+        breaker.opened_at -= 60
+        # the half-open probe's deadline has gone: it isn't sent, and doesn't use up the probe
+        with deadline(0.01):
+            time.sleep(0.02)
+            with pytest.raises(PATSTimeoutError):
+                buyer._send_request("GET", domain, '/attachments/ATT-1', headers)
+        assert breaker.allow()
+        breaker.release()
+        assert buyer._send_request("GET", domain, '/attachments/ATT-2', headers)['path'] == '/attachments/ATT-2'
+        assert breaker.metrics()['state'] == 'closed'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+class OneSlowHandler(EchoHandler):
+    stalled = []
+
+    def do_GET(self):
+        if 'slow' in self.path and not OneSlowHandler.stalled:
+            OneSlowHandler.stalled.append(self.path)
+            time.sleep(2)
+        EchoHandler.do_GET(self)
+
+def test_hedged_get_beats_stalled_request(monkeypatch):
+    monkeypatch.setattr(OneSlowHandler, 'stalled', [])
+    server, domain = start_server(OneSlowHandler)
+    try:
+        buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', pool=PlainConnectionPool(),
+                          hedging=Hedging(min_samples=5, budget=0.5))
+        headers = buyer._identity_headers('application/json')
+        for n in range(5):
+            buyer._send_request("GET", domain, '/orders/ORD-%d' % n, headers)
+        started = time.time()
+        js = buyer._send_request("GET", domain, '/orders/ORD-9?slow=1', headers)
+        assert js['path'] == '/orders/ORD-9?slow=1'
+        assert time.time() - started < 1
+        metrics = buyer.metrics()
+        assert metrics['hedged_requests'] == 1 and metrics['hedge_wins'] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+class StalledHandler(EchoHandler):
+    def do_GET(self):
+        if 'stall' in self.path:
+            time.sleep(2)
+        EchoHandler.do_GET(self)
+
+def test_read_timeout_and_deadline():
+    server, domain = start_server(StalledHandler)
+    try:
+        buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', pool=PlainConnectionPool(), read_timeout=0.2)
+        headers = buyer._identity_headers('application/json')
+        started = time.time()
+        with pytest.raises(PATSTimeoutError):
+            buyer._send_request("GET", domain, '/orders/stall', headers)
+        assert time.time() - started < 1
+
+        buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', pool=PlainConnectionPool())
+        with deadline(0.3):
+            # the budget left shrinks with each request...
+            buyer._send_request("GET", domain, '/orders/ORD-1', headers)
+            started = time.time()
+            with pytest.raises(PATSTimeoutError):
+                buyer._send_request("GET", domain, '/orders/stall', headers)
+            assert time.time() - started < 1
+            # ...and once it has gone, requests fail without being sent
+            with pytest.raises(PATSTimeoutError):
+                buyer._send_request("GET", domain, '/orders/ORD-2', headers)
+        assert buyer._send_request("GET", domain, '/orders/ORD-3', headers)['path'] == '/orders/ORD-3'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_dns_cache_fails_over_and_prewarms():
+    server, domain = start_server()
+    port = server.server_address[1]
+    dead = socket.socket()
+    dead.bind(('127.0.0.1', 0))
+    dead_port = dead.getsockname()[1]
+    dead.close()
+    try:
+        cache = DNSCache()
+        # a made-up host with a dead address first
+        cache.entries[('pats.invalid', port)] = (time.time() + 60, [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, ('127.0.0.1', dead_port)),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, ('127.0.0.1', port)),
+        ])
+        pool = PlainConnectionPool(dns_cache=cache)
+        host = 'pats.invalid:%d' % port
+        assert pool.prewarm(host, 2) == 2
+        assert pool.metrics()['connections_idle'] == 2
+        # the dead address has been moved to the back
+        assert cache.resolve('pats.invalid', port)[0][3] == ('127.0.0.1', port)
+        response = pool.request('GET', host, '/rfps/RFP-1')
+        assert json.loads(response.body.decode('utf-8'))['path'] == '/rfps/RFP-1'
+        metrics = pool.metrics()
+        assert metrics['connections_reused'] == 1 and metrics['dns_cache_hits'] >= 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_tls_sessions_are_resumed(tmpdir):
+    cert, key = str(tmpdir.join('cert.pem')), str(tmpdir.join('key.pem'))
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                                   '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost',
+                                   '-keyout', key, '-out', cert], stdout=devnull, stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("openssl is needed to make a test certificate")
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert, key)
+    server = EchoServer(('127.0.0.1', 0), EchoHandler)
+    server.socket = server_context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        # no idle connections kept, so every request connects again
+        pool = ConnectionPool(max_idle=0, tls=TLSSessions(ssl.create_default_context(cafile=cert)))
+        domain = 'localhost:%d' % server.server_address[1]
+        for n in range(3):
+            response = pool.request('GET', domain, '/orders/ORD-%d' % n)
+            assert json.loads(response.body.decode('utf-8'))['path'] == '/orders/ORD-%d' % n
+        metrics = pool.metrics()
+        assert metrics['tls_handshakes'] == 3
+        assert metrics['tls_sessions_resumed'] == 2
+        assert metrics['tls_handshake_time'] > 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_http2_falls_back_to_http11():
+    buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', http2=True)
+    if HTTP2Pool.available():
+        assert isinstance(buyer.pool, HTTP2Pool)
+    else:
+        assert isinstance(buyer.pool, ConnectionPool)
+        with pytest.raises(ImportError):
+            HTTP2Pool()
+
+class CreatingHandler(EchoHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(201)
+        self.send_header('Location', 'https://example.com/orders/ORD-NEW')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+def test_record_and_replay(tmpdir):
+    cassette = str(tmpdir.join('exchanges.cassette.gz'))
+    server, domain = start_server(CreatingHandler)
+    try:
+        recorder = RecordingTransport(PlainConnectionPool(), cassette)
+        buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', pool=recorder)
+        headers = buyer._identity_headers('application/json', user_id='buyer')
+        recorded = [buyer._send_request("GET", domain, '/rfps/RFP-%d' % n, headers) for n in range(3)]
+        location = buyer._send_request("POST", domain, '/orders', headers, '{"name": "x"}')
+        recorder.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert location == 'https://example.com/orders/ORD-NEW'
+
+    # the server has gone: everything comes from the cassette
+    buyer = PATSBuyer(agency_id='35-AGENCY-1', api_key='key', pool=ReplayTransport(cassette))
+    headers = buyer._identity_headers('application/json', user_id='buyer')
+    assert [buyer._send_request("GET", domain, '/rfps/RFP-%d' % n, headers) for n in range(3)] == recorded
+    assert buyer._send_request("POST", domain, '/orders', headers, '{"name": "x"}') == location
+    with pytest.raises(LookupError):
+        buyer._send_request("GET", domain, '/rfps/RFP-9', headers)
+    assert buyer.metrics()['exchanges_replayed'] == 4
+    # request headers (and so the API key) are never recorded
+    with gzip.open(cassette, 'rb') as f:
+        assert b'X-MO-API-Key' not in f.read()
@@ -0,0 +1,892 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Brendan Quinn, Clueful Media Ltd / JT-PATS Ltd
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+PATS Python library - HTTP transport - Brendan Quinn May 2017
+
+Transports (HTTP/1.1, HTTP/2 if httpx is installed, and cassette recording
+and replay), DNS and TLS session caching, rate limiting, caching, circuit
+breaking and hedging used by PATSAPIClient._send_request. Nothing in here
+knows about the PATS API itself.
+"""
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException # 2.x
+import collections
+import copy
+from email.message import Message
+import gzip
+import json
+try:
+    import queue
+except ImportError:
+    import Queue as queue # 2.x
+import socket
+import ssl
+import threading
+import time
+try:
+    import httpx # optional, for HTTP2Pool
+except ImportError:
+    httpx = None
+try:
+    import h2 # optional, what httpx speaks HTTP/2 with
+except ImportError:
+    h2 = None
+
+MAX_IDLE_CONNECTIONS = 16 # idle keep-alive connections kept per host
+DNS_TTL = 300 # seconds a resolved address is trusted for
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "DELETE") # safe to send again on a fresh connection
+
+class PATSResponse(object):
+    """
+    Status, reason, headers and (undecoded) body of one HTTP exchange.
+    """
+    __slots__ = ('status', 'reason', 'msg', 'body')
+
+    def __init__(self, status, reason, msg, body):
+        self.status = status
+        self.reason = reason
+        self.msg = msg
+        self.body = body
+
+class Transport(object):
+    """
+    What PATSAPIClient sends its requests through (its "pool"). Transports
+    must be safe to use from many threads at once.
+    """
+    def request(self, method, domain, path, body=None, headers=None, debuglevel=0, cancel=None, timeouts=None):
+        """
+        Perform one request and return a PATSResponse.
+        cancel: optional Cancellation through which another thread can abandon the request
+        timeouts: optional (connect, read) timeouts in seconds
+        Raises socket.timeout when a timeout runs out and socket.error (or
+        socket.gaierror) when the request can't be made.
+        """
+        from .core import PATSException # core imports this module
+        raise PATSException("We shouldn't get here, stuff should happen in subclass")
+
+    def prewarm(self, domain, connections=1, timeout=None):
+        """
+        Get ready to talk to a host. Returns the number of connections opened.
+        """
+        return 0
+
+    def close(self):
+        pass
+
+    def metrics(self):
+        return {}
+
+class Cancellation(object):
+    """
+    Lets another thread abandon a request made with ConnectionPool.request(..., cancel=...):
+    cancel() shuts down the request's socket, so a blocked read fails at once,
+    and the connection is thrown away rather than going back to the pool.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.connection = None
+
+    def attach(self, connection):
+        with self.lock:
+            self.connection = connection
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            sock = getattr(self.connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+class DNSCache(object):
+    """
+    Thread-safe cache of resolved host addresses, kept for ttl seconds.
+
+    If looking a host up again fails, the addresses we had are used anyway.
+    create_connection() tries each address in turn, and an address that
+    failed to connect is moved to the back of the list.
+    """
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def resolve(self, host, port):
+        """
+        List of (family, type, proto, sockaddr) for a host and port.
+        """
+        key = (host, port)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+        try:
+            infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            if entry is None:
+                raise
+            with self.lock:
+                self.stale += 1
+            return entry[1]
+        addresses = [(family, socktype, proto, sockaddr) for family, socktype, proto, name, sockaddr in infos]
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = (time.time() + self.ttl, addresses)
+        return addresses
+
+    def _demote(self, host, port, address):
+        with self.lock:
+            entry = self.entries.get((host, port))
+            if entry is not None and address in entry[1]:
+                addresses = [a for a in entry[1] if a != address] + [address]
+                self.entries[(host, port)] = (entry[0], addresses)
+
+    def create_connection(self, address, timeout=None, source_address=None):
+        """
+        Drop-in for socket.create_connection that uses the cache.
+        """
+        host, port = address
+        error = None
+        for family, socktype, proto, sockaddr in self.resolve(host, port):
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                # http.client passes a sentinel object when no timeout was set
+                if isinstance(timeout, (int, float)):
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except socket.error as e:
+                error = e
+                if sock is not None:
+                    sock.close()
+                self._demote(host, port, (family, socktype, proto, sockaddr))
+        raise error or socket.error("No addresses for %s" % host)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+default_ssl_context_lock = threading.Lock()
+default_ssl_context = None
+
+def shared_ssl_context():
+    """
+    The SSL context used by every pool that isn't given one, created once
+    per process (loading the CA certificates is not cheap).
+    """
+    global default_ssl_context
+    with default_ssl_context_lock:
+        if default_ssl_context is None:
+            default_ssl_context = ssl.create_default_context()
+        return default_ssl_context
+
+class TLSSessions(object):
+    """
+    An SSL context plus the last TLS session seen for each host, so that new
+    connections to a host can resume the session with an abbreviated
+    handshake. Counts handshakes, how many resumed a session and the time
+    spent in them.
+    """
+    def __init__(self, context=None):
+        self.context = context or shared_ssl_context()
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.handshakes = 0
+        self.resumed = 0
+        self.handshake_time = 0.0
+
+    def wrap(self, sock, host):
+        """
+        TLS handshake on a connected socket, resuming the host's last session if we have one.
+        """
+        with self.lock:
+            session = self.sessions.get(host)
+        started = time.time()
+        if session is not None:
+            try:
+                wrapped = self.context.wrap_socket(sock, server_hostname=host, session=session)
+            except TypeError: # no session resumption before Python 3.6
+                wrapped = self.context.wrap_socket(sock, server_hostname=host)
+        else:
+            wrapped = self.context.wrap_socket(sock, server_hostname=host)
+        elapsed = time.time() - started
+        with self.lock:
+            self.handshakes += 1
+            self.handshake_time += elapsed
+            if getattr(wrapped, 'session_reused', False):
+                self.resumed += 1
+        self.remember(wrapped, host)
+        return wrapped
+
+    def remember(self, sock, host):
+        """
+        Keep the socket's session for the next connection to the host. With
+        TLS 1.3 the session ticket only arrives after the handshake, so this
+        is called again once a response has been read.
+        """
+        session = getattr(sock, 'session', None)
+        if session is not None:
+            with self.lock:
+                self.sessions[host] = session
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'tls_handshakes': self.handshakes,
+                'tls_sessions_resumed': self.resumed,
+                'tls_handshake_time': self.handshake_time,
+            }
+
+class PATSHTTPSConnection(HTTPSConnection):
+    """
+    HTTPSConnection whose handshake goes through TLSSessions.
+    """
+    def __init__(self, host, tls):
+        HTTPSConnection.__init__(self, host, context=tls.context)
+        self.tls = tls
+
+    def connect(self):
+        HTTPConnection.connect(self)
+        self.sock = self.tls.wrap(self.sock, self._tunnel_host or self.host)
+
+class ConnectionPool(Transport):
+    """
+    Thread-safe pool of keep-alive HTTPS connections, kept per host.
+
+    Any number of threads can call request() at once: each call takes an idle
+    connection for the host (or opens a new one), uses it for exactly one
+    exchange and then hands it back, so a connection is never shared by two
+    requests at the same time.
+    """
+    def __init__(self, max_idle=MAX_IDLE_CONNECTIONS, dns_cache=None, tls=None):
+        """
+        max_idle: idle connections kept per host
+        dns_cache: DNSCache used to find hosts (a new one by default)
+        tls: TLSSessions for the SSL context and session resumption (by
+            default a new one using the process-wide shared_ssl_context())
+        """
+        self.max_idle = max_idle
+        self.dns_cache = dns_cache if dns_cache is not None else DNSCache()
+        self.tls = tls if tls is not None else TLSSessions()
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self, domain):
+        return PATSHTTPSConnection(domain, self.tls)
+
+    def _new_connection(self, domain):
+        connection = self._connect(domain)
+        # http.client opens its sockets through this hook (Python 3)
+        connection._create_connection = self.dns_cache.create_connection
+        return connection
+
+    def _checkout(self, domain):
+        with self.lock:
+            connections = self.idle.get(domain)
+            if connections:
+                self.reused += 1
+                return connections.pop(), True
+            self.opened += 1
+        return self._new_connection(domain), False
+
+    def _checkin(self, domain, connection):
+        with self.lock:
+            connections = self.idle.setdefault(domain, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def request(self, method, domain, path, body=None, headers=None, debuglevel=0, cancel=None, timeouts=None):
+        """
+        Perform one request and return a PATSResponse (see Transport.request).
+        A kept-alive connection that the server has closed in the meantime is
+        replaced transparently - except that a POST or PUT that had already
+        been sent on it isn't sent again, as it may have been acted on.
+        """
+        connect_timeout, read_timeout = timeouts or (None, None)
+        while True:
+            if hasattr(body, 'seek'):
+                body.seek(0) # a streamed body is sent again from the start
+            connection, reused = self._checkout(domain)
+            if debuglevel:
+                connection.set_debuglevel(debuglevel)
+            if cancel is not None:
+                cancel.attach(connection)
+            sent = False
+            try:
+                if connection.sock is None:
+                    if connect_timeout is not None:
+                        connection.timeout = connect_timeout
+                    connection.connect()
+                connection.sock.settimeout(read_timeout)
+                connection.request(method, path, body, headers or {})
+                sent = True
+                response = connection.getresponse()
+                result = PATSResponse(response.status, response.reason, response.msg, response.read())
+            except (HTTPException, socket.error) as e:
+                connection.close()
+                if reused and not isinstance(e, socket.timeout) and not (cancel is not None and cancel.cancelled) \
+                        and (method in IDEMPOTENT_METHODS or not sent):
+                    # idle connection went stale - try again on a fresh one. Once a
+                    # POST or PUT has gone out, PATS may have acted on it, so
+                    # sending it again could create a second order or proposal
+                    continue
+                raise
+            if isinstance(connection, PATSHTTPSConnection) and connection.sock is not None:
+                self.tls.remember(connection.sock, connection.host)
+            if response.will_close or (cancel is not None and cancel.cancelled):
+                connection.close()
+            else:
+                self._checkin(domain, connection)
+            return result
+
+    def prewarm(self, domain, connections=1, timeout=None):
+        """
+        Resolve a host and open (including the TLS handshake) idle connections
+        to it ahead of time, so the first requests don't have to.
+        Returns the number of connections opened.
+        """
+        opened = []
+        try:
+            for n in range(connections):
+                connection = self._new_connection(domain)
+                if timeout is not None:
+                    connection.timeout = timeout
+                connection.connect()
+                opened.append(connection)
+        finally:
+            with self.lock:
+                self.opened += len(opened)
+            for connection in opened:
+                self._checkin(domain, connection)
+        return len(opened)
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def metrics(self):
+        with self.lock:
+            metrics = {
+                'connections_opened': self.opened,
+                'connections_reused': self.reused,
+                'connections_idle': sum(len(c) for c in self.idle.values()),
+                'dns_cache_hits': self.dns_cache.hits,
+                'dns_cache_misses': self.dns_cache.misses,
+                'dns_stale_answers': self.dns_cache.stale,
+            }
+            metrics.update(self.tls.metrics())
+            return metrics
+
+class HTTP2Pool(Transport):
+    """
+    Drop-in for ConnectionPool that speaks HTTP/2 through httpx, so any number
+    of concurrent requests to a host share a few multiplexed connections and
+    the repeated headers are compressed (HPACK). Hosts that don't offer
+    HTTP/2 are spoken to over HTTP/1.1.
+
+    Needs "pip install httpx[http2]" - see available(). Cancelling a request
+    (for hedging) is not supported: the losing request is left to finish.
+    """
+    def __init__(self, max_connections=10, ssl_context=None):
+        if not self.available():
+            raise ImportError("HTTP/2 needs httpx and h2: pip install httpx[http2]")
+        self.client = httpx.Client(http2=True, verify=ssl_context or shared_ssl_context(),
+                                   limits=httpx.Limits(max_connections=max_connections))
+        self.lock = threading.Lock()
+        self.versions = {}
+
+    @staticmethod
+    def available():
+        return httpx is not None and h2 is not None
+
+    def request(self, method, domain, path, body=None, headers=None, debuglevel=0, cancel=None, timeouts=None):
+        """
+        Same contract as ConnectionPool.request: returns a PATSResponse, and
+        raises socket.timeout / socket.error when the request times out / fails.
+        """
+        connect_timeout, read_timeout = timeouts or (None, None)
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        if hasattr(body, 'seek'):
+            body.seek(0)
+        try:
+            response = self.client.request(method, 'https://%s%s' % (domain, path),
+                                           content=body, headers=headers, timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise socket.timeout(str(e))
+        except httpx.TransportError as e:
+            raise socket.error(str(e))
+        with self.lock:
+            self.versions[response.http_version] = self.versions.get(response.http_version, 0) + 1
+        return PATSResponse(response.status_code, response.reason_phrase, response.headers, response.content)
+
+    def prewarm(self, domain, connections=1, timeout=None):
+        """
+        Open a connection to a host (one is enough - requests are multiplexed on it).
+        """
+        self.request('HEAD', domain, '/', timeouts=(timeout, timeout))
+        return 1
+
+    def close(self):
+        self.client.close()
+
+    def metrics(self):
+        with self.lock:
+            return dict(('%s_requests' % version.lower().replace('/', '').replace('.', ''), count)
+                        for version, count in self.versions.items())
+
+def response_headers(pairs):
+    """
+    Case-insensitive response headers (like http.client's) from (name, value) pairs.
+    """
+    msg = Message()
+    for name, value in pairs:
+        msg[name] = value
+    return msg
+
+def recorded_body(body):
+    """
+    A request body as text for a cassette. Streamed bodies (with attachments)
+    aren't read into memory for it: they are recorded by length.
+    """
+    if hasattr(body, 'read'):
+        return '<%d bytes streamed>' % len(body)
+    return body.decode('utf-8') if isinstance(body, bytes) else body
+
+class RecordingTransport(Transport):
+    """
+    Passes requests on to another transport and records every exchange -
+    the response status, reason, headers (including Location) and body, and
+    how long it took - in a gzipped JSON lines cassette that ReplayTransport
+    can play back. Request headers are not recorded, so the API key never
+    ends up in a cassette.
+
+        transport = RecordingTransport(ConnectionPool(), 'orders.cassette.gz')
+        buyer = PATSBuyer(..., pool=transport)
+    """
+    def __init__(self, transport, path):
+        self.transport = transport
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, 'wb')
+        self.recorded = 0
+
+    def request(self, method, domain, path, body=None, headers=None, debuglevel=0, cancel=None, timeouts=None):
+        started = time.time()
+        response = self.transport.request(method, domain, path, body, headers, debuglevel, cancel, timeouts)
+        exchange = {
+            'method': method,
+            'domain': domain,
+            'path': path,
+            'request_body': recorded_body(body),
+            'status': response.status,
+            'reason': response.reason,
+            'headers': list(response.msg.items()),
+            'body': response.body.decode('utf-8'),
+            'elapsed': round(time.time() - started, 4),
+        }
+        line = (json.dumps(exchange, separators=(',', ':')) + '\n').encode('utf-8')
+        with self.lock:
+            self.file.write(line)
+            self.recorded += 1
+        return response
+
+    def prewarm(self, domain, connections=1, timeout=None):
+        return self.transport.prewarm(domain, connections, timeout)
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        self.transport.close()
+
+    def metrics(self):
+        metrics = self.transport.metrics()
+        metrics['exchanges_recorded'] = self.recorded
+        return metrics
+
+class ReplayTransport(Transport):
+    """
+    Serves the exchanges in a RecordingTransport cassette instead of using
+    the network - at full speed, or with realtime=True taking as long as the
+    recorded requests did.
+
+    Responses are matched on method, host, path and request body. Repeated
+    requests get the recorded responses in the order they were recorded;
+    when those run out, the sequence starts again (loop=False raises
+    LookupError instead). A request that was never recorded raises LookupError.
+    """
+    def __init__(self, path, realtime=False, loop=True):
+        self.realtime = realtime
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.exchanges = {}
+        self.positions = {}
+        self.replayed = 0
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                exchange = json.loads(line.decode('utf-8'))
+                key = (exchange['method'], exchange['domain'], exchange['path'], exchange['request_body'])
+                self.exchanges.setdefault(key, []).append((
+                    exchange['status'], exchange['reason'], exchange['headers'],
+                    exchange['body'].encode('utf-8'), exchange['elapsed'],
+                ))
+
+    def request(self, method, domain, path, body=None, headers=None, debuglevel=0, cancel=None, timeouts=None):
+        key = (method, domain, path, recorded_body(body))
+        with self.lock:
+            exchanges = self.exchanges.get(key)
+            if not exchanges:
+                raise LookupError("No recorded response for %s %s%s" % (method, domain, path))
+            position = self.positions.get(key, 0)
+            if position >= len(exchanges):
+                if not self.loop:
+                    raise LookupError("Recorded responses for %s %s%s have run out" % (method, domain, path))
+                position = 0
+            self.positions[key] = position + 1
+            self.replayed += 1
+        status, reason, header_pairs, response_body, elapsed = exchanges[position]
+        if self.realtime:
+            time.sleep(elapsed)
+        return PATSResponse(status, reason, response_headers(header_pairs), response_body)
+
+    def metrics(self):
+        with self.lock:
+            return {'exchanges_replayed': self.replayed}
+
+class RateLimiter(object):
+    """
+    Token bucket shared by every client that uses it: allows "rate" requests
+    per second on average, with bursts of up to "burst" requests.
+    """
+    def __init__(self, rate=10.0, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available.
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+class ReferenceCache(object):
+    """
+    Thread-safe cache of slowly-changing reference data (sellers, users, media
+    property fields, products) with a time-to-live, which can be shared by
+    many clients. Callers get their own copy of each cached value.
+    """
+    def __init__(self, ttl=3600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key, value):
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                now = time.time()
+                self.entries = dict((k, e) for k, e in self.entries.items() if e[0] >= now)
+                if len(self.entries) >= self.max_entries:
+                    self.entries.clear()
+            self.entries[key] = (time.time() + self.ttl, copy.deepcopy(value))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class CircuitBreaker(object):
+    """
+    Failure-rate and latency circuit breaker for one endpoint.
+
+    Closed: requests flow, and the outcome of the last "window" calls is kept.
+    Once at least min_calls are known and too many of them failed (or took
+    longer than slow_call_duration), the breaker opens and every request is
+    refused for open_seconds. It then goes half-open and lets a single probe
+    request through: if that works the breaker closes again, otherwise it
+    re-opens for another open_seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, slow_call_rate=0.8, slow_call_duration=10.0,
+                 window=20, min_calls=5, open_seconds=30.0):
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_duration = slow_call_duration
+        self.window = window
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.calls = collections.deque(maxlen=window)
+        self.opened_at = 0
+        self.probing = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """
+        Whether a request may go ahead now. In half-open state only the first
+        caller gets through (as the probe) until its outcome is recorded.
+        """
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN:
+                if self.probing:
+                    self.rejected += 1
+                    return False
+                self.probing = True
+            return True
+
+    def release(self):
+        """
+        Give up a request allowed through without sending it, so that if it
+        was the half-open probe another request can be.
+        """
+        with self.lock:
+            self.probing = False
+
+    def record(self, success, duration):
+        """
+        Record the outcome of a request allowed through.
+        """
+        with self.lock:
+            slow = duration > self.slow_call_duration
+            if self.state == self.HALF_OPEN:
+                self.probing = False
+                if success and not slow:
+                    self.state = self.CLOSED
+                    self.calls.clear()
+                else:
+                    self._open()
+                return
+            self.calls.append((success, slow))
+            if len(self.calls) >= self.min_calls:
+                failures = sum(1 for ok, slow in self.calls if not ok)
+                slow_calls = sum(1 for ok, slow in self.calls if slow)
+                if failures >= self.failure_rate * len(self.calls) or \
+                   slow_calls >= self.slow_call_rate * len(self.calls):
+                    self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.times_opened += 1
+        self.calls.clear()
+
+    def is_open(self):
+        with self.lock:
+            return self.state == self.OPEN
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'recent_calls': len(self.calls),
+                'recent_failures': sum(1 for ok, slow in self.calls if not ok),
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+            }
+
+class CircuitBreakers(object):
+    """
+    Thread-safe set of CircuitBreakers, one per key (eg domain and endpoint),
+    all created with the same settings. Share one between clients so they
+    all stop calling a failing endpoint together.
+    """
+    def __init__(self, **settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def get(self, key):
+        with self.lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = self.breakers[key] = CircuitBreaker(**self.settings)
+            return breaker
+
+    def metrics(self):
+        with self.lock:
+            breakers = list(self.breakers.items())
+        return dict((' '.join(key) if isinstance(key, tuple) else key, breaker.metrics())
+                    for key, breaker in breakers)
+
+class Hedging(object):
+    """
+    Request hedging for idempotent requests: if no response has arrived after
+    the "percentile" latency recently seen for the same endpoint, a second
+    copy of the request is sent, the first response wins and the other
+    request is cancelled.
+
+    At most "budget" (a fraction) of requests are hedged, so hedging can add
+    no more than that much load. Nothing is hedged for an endpoint until
+    min_samples latencies are known for it.
+    """
+    def __init__(self, percentile=95, budget=0.05, min_delay=0.01, window=200, min_samples=20):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.requests = 0
+        self.hedged = 0
+        self.wins = 0
+
+    def delay(self, key):
+        """
+        Seconds to wait before hedging a request for an endpoint, or None if
+        there aren't enough samples yet.
+        """
+        with self.lock:
+            samples = sorted(self.latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        n = min(len(samples) - 1, int(len(samples) * self.percentile / 100.0))
+        return max(self.min_delay, samples[n])
+
+    def _record(self, key, latency):
+        with self.lock:
+            samples = self.latencies.get(key)
+            if samples is None:
+                samples = self.latencies[key] = collections.deque(maxlen=self.window)
+            samples.append(latency)
+
+    def _take_hedge(self):
+        with self.lock:
+            if self.hedged + 1 > self.budget * self.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    def request(self, pool, key, method, domain, path, body=None, headers=None, debuglevel=0, timeouts=None):
+        """
+        ConnectionPool.request, hedged. key identifies the endpoint whose
+        latencies decide the hedging delay.
+        """
+        with self.lock:
+            self.requests += 1
+        delay = self.delay(key)
+        started = time.time()
+        if delay is None:
+            response = pool.request(method, domain, path, body, headers, debuglevel, timeouts=timeouts)
+            self._record(key, time.time() - started)
+            return response
+
+        results = queue.Queue()
+        attempts = []
+        def attempt(cancel):
+            try:
+                results.put((cancel, pool.request(method, domain, path, body, headers, debuglevel, cancel, timeouts), None))
+            except Exception as e:
+                results.put((cancel, None, e))
+        def launch():
+            cancel = Cancellation()
+            attempts.append(cancel)
+            thread = threading.Thread(target=attempt, args=(cancel,))
+            thread.daemon = True
+            thread.start()
+
+        launch()
+        try:
+            winner, response, error = results.get(timeout=delay)
+        except queue.Empty:
+            if self._take_hedge():
+                launch()
+            winner, response, error = results.get()
+        # if the first attempt to finish failed, the other one may still work
+        waiting = len(attempts) - 1
+        while error is not None and waiting:
+            winner, response, error = results.get()
+            waiting -= 1
+        for cancel in attempts:
+            if cancel is not winner:
+                cancel.cancel()
+        if error is not None:
+            raise error
+        if winner is not attempts[0]:
+            with self.lock:
+                self.wins += 1
+        self._record(key, time.time() - started)
+        return response
+
+    def metrics(self):
+        with self.lock:
+            return {'hedged_requests': self.hedged, 'hedge_wins': self.wins}
@@ -18,6 +18,11 @@ setup(
   url = 'https://github.com/bquinn/pats-api-python',
   download_url = 'https://github.com/bquinn/pats-api-python/archive/0.3.tar.gz',
   keywords = ['api', 'publishing', 'advertising'],
+  extras_require = {
+    'http2': ['httpx[http2]'],
+    'numpy': ['numpy'],
+    'arrow': ['pyarrow'],
+  },
   classifiers = [
     'Development Status :: 4 - Beta',
     'Intended Audience :: Developers',